@@ -1,4 +1,10 @@
-from fastapi import APIRouter
+import os
+import shutil
+from fastapi import APIRouter, Response
+from fastapi.responses import JSONResponse
+from app.core import metrics
+from app.core.config import config
+from app.core.worker import pool_status
 
 root_router = APIRouter(
     tags=["Root"]
@@ -17,8 +23,48 @@ def read_root():
 @root_router.get(
     "/health-check",
     summary="Health Check Endpoint",
-    description="This endpoint checks the health of the API. It returns a simple message indicating that the API is running.",
+    description="This endpoint checks whether the API is ready to work: ffmpeg and ffprobe are installed, the temp disk has headroom and the job workers are running. It returns 503 when a check fails.",
     response_model=dict,
 )
 def health_check():
-    return {"message": "🩺 Health Check: API is running!"}
\ No newline at end of file
+    os.makedirs(config.STORAGE_TEMP_DIR, exist_ok=True)
+    free_bytes = shutil.disk_usage(config.STORAGE_TEMP_DIR).free
+    workers = pool_status()
+
+    checks = {
+        "ffmpeg": {"ok": shutil.which("ffmpeg") is not None},
+        "ffprobe": {"ok": shutil.which("ffprobe") is not None},
+        "disk": {
+            "ok": free_bytes >= config.HEALTH_MIN_FREE_BYTES,
+            "free_bytes": free_bytes,
+            "min_free_bytes": config.HEALTH_MIN_FREE_BYTES,
+        },
+        # Without a local pool, workers run in another web process or
+        # elsewhere (python -m app.core.worker)
+        "workers": {
+            "ok": workers["configured"] == 0 or workers["alive"] > 0 or workers["elsewhere"],
+            **workers,
+        },
+    }
+    ready = all(check["ok"] for check in checks.values())
+
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "message": "🩺 Health Check: API is running!"
+            if ready
+            else "🩺 Health Check: API is not ready",
+            "ready": ready,
+            "checks": checks,
+        },
+    )
+
+
+@root_router.get(
+    "/metrics",
+    summary="Metrics Endpoint",
+    description="Prometheus metrics of all API and worker processes: request latency per route, ffmpeg runs, queue depths, upload bytes, temp storage and status store latency.",
+)
+def get_metrics():
+    payload, content_type = metrics.render()
+    return Response(content=payload, media_type=content_type)
@@ -3,16 +3,25 @@ from fastapi import (
     UploadFile,
     File,
     HTTPException,
-    BackgroundTasks,
     Form,
+    Query,
     Request,
+    WebSocket,
+    WebSocketDisconnect,
 )
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 import os
 import uuid
 import asyncio
+import json
 import sys
 from ..utils import ffmpeg_commands, video_generation
+from app.core import jobs, storage
+from app.core.config import config
+from app.core.progress_bus import progress_bus
+from app.core.tools import file_stream
+from app.core.tools.ffmpeg import FFmpegError, inspect_media
+from app.core.tools.file_response import MediaFileResponse
 from fastapi.responses import RedirectResponse
 
 if sys.platform == "win32":
@@ -22,7 +31,7 @@ video_generation_routes = APIRouter(
     prefix="/video_generation", responses={404: {"description": "Not found"}}
 )
 
-TEMP_DIR = "storage/temp"
+TEMP_DIR = config.STORAGE_TEMP_DIR
 os.makedirs(TEMP_DIR, exist_ok=True)
 
 
@@ -41,17 +50,20 @@ async def upload_audio_video(
     file_path = os.path.join(TEMP_DIR, new_filename)
 
     # Save the uploaded file
-    await video_generation.save_upload_file(file, file_path)
+    saved = await video_generation.save_upload_file(file, file_path)
+    await asyncio.to_thread(storage.track, file_path, storage.INPUT)
 
     return {
         "file_type": file_type,
         "saved_filename": new_filename,
+        "size": saved["size"],
+        "sha256": saved["sha256"],
     }
 
 
 @video_generation_routes.post("/merge_audio-video")
 async def merge_audio_video(
-    background_tasks: BackgroundTasks, audio_file: str, video_file: str
+    audio_file: str, video_file: str, priority: int = jobs.PRIORITY_NORMAL
 ):
     # Save uploaded input files with unique names
     temp_audio_path = os.path.join(TEMP_DIR, audio_file)
@@ -73,19 +85,191 @@ async def merge_audio_video(
             detail={"success": False, "message": "Video file not found."},
         )
 
-    # Schedule background merge task
-    background_tasks.add_task(
-        ffmpeg_commands.run_merge_audio_video,
-        temp_audio_path,
-        temp_video_path,
-        output_tmp_path,
-    )
-
     # replace merged_ with empty string to get final filename
     output_final_filename = output_tmp_filename.replace("merged_", "")
 
+    # Identical inputs were merged before: reuse that output. Only digests
+    # known from the upload are used; hashing is left to the merge job
+    audio_sha256 = file_stream.peek_file_digest(temp_audio_path)
+    video_sha256 = file_stream.peek_file_digest(temp_video_path)
+    cache_key = ffmpeg_commands.merge_cache_key(audio_sha256, video_sha256)
+    if cache_key and await asyncio.to_thread(
+        ffmpeg_commands.merge_cache.get_into,
+        cache_key,
+        os.path.join(TEMP_DIR, output_final_filename),
+    ):
+        ffmpeg_commands.remove_inputs(temp_audio_path, temp_video_path)
+        await asyncio.to_thread(
+            storage.track, os.path.join(TEMP_DIR, output_final_filename), storage.OUTPUT
+        )
+        return {"filename": output_final_filename, "cached": True}
+
+    # Queue the merge for the worker pool
+    job_id = await asyncio.to_thread(
+        jobs.enqueue,
+        ffmpeg_commands.run_merge_audio_video,
+        {
+            "audio_path": temp_audio_path,
+            "video_path": temp_video_path,
+            "output_tmp_path": output_tmp_path,
+            "audio_sha256": audio_sha256,
+            "video_sha256": video_sha256,
+        },
+        kind="merge_audio_video",
+        priority=priority,
+        ref=output_final_filename,
+    )
+
     # Immediately return the final filename (client can poll /files/{filename})
-    return {"filename": output_final_filename}
+    return {"filename": output_final_filename, "job_id": job_id, "cached": False}
+
+
+@video_generation_routes.post("/merge_audio-video/stream")
+async def merge_audio_video_stream(request: Request, video_file: str):
+    # The request body is the raw audio (MP3, ADTS AAC, WAV, Ogg; not M4A),
+    # piped into ffmpeg as it arrives; the video must already be uploaded
+    # Prevent directory traversal attack
+    if ".." in video_file or video_file.startswith("/"):
+        raise HTTPException(
+            status_code=400,
+            detail={"success": False, "message": "Invalid filename"},
+        )
+    temp_video_path = os.path.join(TEMP_DIR, video_file)
+    if not os.path.isfile(temp_video_path):
+        raise HTTPException(
+            status_code=400,
+            detail={"success": False, "message": "Video file not found."},
+        )
+
+    # No job references the video, so keep the storage sweep from expiring
+    # it while the merge runs
+    await asyncio.to_thread(storage.touch, temp_video_path)
+
+    output_tmp_path = os.path.join(TEMP_DIR, f"merged_{uuid.uuid4()}.mp4")
+    audio_chunks = file_stream.limit_chunks(request.stream(), config.UPLOAD_MAX_BYTES)
+    try:
+        return await ffmpeg_commands.run_merge_audio_stream(
+            audio_chunks,
+            temp_video_path,
+            output_tmp_path,
+            file_stream.peek_file_digest(temp_video_path),
+        )
+    except file_stream.FileTooLargeError as e:
+        raise HTTPException(
+            status_code=413,
+            detail={"success": False, "message": str(e)},
+        )
+    except FFmpegError as e:
+        raise HTTPException(
+            status_code=400,
+            detail={"success": False, "message": f"Merge failed: {e.stderr}"},
+        )
+
+
+@video_generation_routes.post("/merge_audio-video/batch")
+async def merge_audio_video_batch(
+    video_file: str,
+    audio_files: list[str] = Query(...),  # repeat the parameter per audio file
+    cleanup_inputs: bool = True,
+    priority: int = jobs.PRIORITY_NORMAL,
+):
+    # Validate every input before queueing anything
+    audio_files = list(dict.fromkeys(audio_files))
+    for name, message in [(video_file, "Video file not found.")] + [
+        (audio_file, f"Audio file not found: {audio_file}") for audio_file in audio_files
+    ]:
+        if ".." in name or name.startswith("/") or not os.path.isfile(
+            os.path.join(TEMP_DIR, name)
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail={"success": False, "message": message},
+            )
+
+    # Prepare the video once for the whole batch: hash it and probe it, so
+    # no merge job has to read it again for that
+    temp_video_path = os.path.join(TEMP_DIR, video_file)
+    video_digest = await file_stream.get_file_digest(temp_video_path)
+    try:
+        video_info = await inspect_media(temp_video_path, video_digest["sha256"])
+    except FFmpegError as e:
+        raise HTTPException(
+            status_code=400,
+            detail={"success": False, "message": f"Unreadable video: {e.stderr}"},
+        )
+
+    # One merge job per audio file; the worker pool spreads them over the
+    # available cores
+    batch_id = str(uuid.uuid4())
+    items = []
+    for audio_file in audio_files:
+        temp_audio_path = os.path.join(TEMP_DIR, audio_file)
+        output_tmp_path = os.path.join(TEMP_DIR, f"merged_{uuid.uuid4()}.mp4")
+        output_final_filename = os.path.basename(output_tmp_path).replace("merged_", "")
+        job_id = await asyncio.to_thread(
+            jobs.enqueue,
+            ffmpeg_commands.run_merge_audio_video,
+            {
+                "audio_path": temp_audio_path,
+                "video_path": temp_video_path,
+                "output_tmp_path": output_tmp_path,
+                "audio_sha256": file_stream.peek_file_digest(temp_audio_path),
+                "video_sha256": video_digest["sha256"],
+                "video_info": video_info,
+                "keep_audio": not cleanup_inputs,
+                "keep_video": True,
+            },
+            kind="merge_audio_video",
+            priority=priority,
+            ref=output_final_filename,
+            pipeline_id=batch_id,
+            step=audio_file,
+        )
+        items.append(
+            {"audio_file": audio_file, "filename": output_final_filename, "job_id": job_id}
+        )
+
+    # The shared video goes once every merge has succeeded; after a failure
+    # it stays for a retry until the storage sweep expires it
+    if cleanup_inputs:
+        await asyncio.to_thread(
+            jobs.enqueue,
+            ffmpeg_commands.remove_inputs,
+            {"video_path": temp_video_path},
+            kind="cleanup",
+            priority=priority,
+            pipeline_id=batch_id,
+            step="cleanup",
+            depends_on=[item["job_id"] for item in items],
+        )
+
+    return {
+        "success": True,
+        "message": "Batch queued",
+        "batch_id": batch_id,
+        "items": items,
+    }
+
+
+@video_generation_routes.get("/merge_audio-video/batch/{batch_id}")
+async def check_merge_batch(batch_id: str):
+
+    return await video_generation.get_batch_status(batch_id)
+
+
+@video_generation_routes.get("/merge_cache")
+async def merge_cache_stats():
+    return await asyncio.to_thread(ffmpeg_commands.merge_cache.stats)
+
+
+@video_generation_routes.get("/loop_cache")
+async def loop_cache_stats():
+    return await asyncio.to_thread(ffmpeg_commands.loop_cache.stats)
+
+
+@video_generation_routes.get("/storage")
+async def storage_usage():
+    return await asyncio.to_thread(storage.usage)
 
 
 # check if generation compelted
@@ -110,9 +294,27 @@ async def check_generation(filename: str):
             },
         )
 
+    return await generation_status(filename)
+
+
+async def generation_status(filename: str):
     file_path = os.path.join(TEMP_DIR, filename)
 
     if not os.path.isfile(file_path):
+        job = await asyncio.to_thread(jobs.get_job_by_ref, filename)
+        if job is not None and job["state"] == jobs.FAILED:
+            return {
+                "success": False,
+                "message": "Generation failed",
+                "job_id": job["id"],
+            }
+        if job is not None:
+            return {
+                "success": False,
+                "message": f"Generation {job['state']}",
+                "job_id": job["id"],
+                "progress": job["progress"],
+            }
         return {
             "success": False,
             "message": "Generation in progress or file not found",
@@ -125,7 +327,7 @@ async def check_generation(filename: str):
     }
 
 
-@video_generation_routes.get("/files/{filename}")
+@video_generation_routes.api_route("/files/{filename}", methods=["GET", "HEAD"])
 async def get_file(filename: str):
     # Prevent directory traversal attack
     if ".." in filename or filename.startswith("/"):
@@ -157,16 +359,19 @@ async def get_file(filename: str):
             },
         )
 
-    return FileResponse(file_path, filename=filename)
+    await asyncio.to_thread(storage.touch, file_path)
+
+    # Supports Range, If-Range, If-None-Match and zero-copy sends
+    return MediaFileResponse(file_path, filename=filename)
 
 
 @video_generation_routes.post("/upload_to_google_drive")
 async def upload_to_google_drive(
-    background_tasks: BackgroundTasks,
     folder_id: str,
     file_id: str,
     file_name: str = str,
     service_account_data: str = Form(...),
+    priority: int = jobs.PRIORITY_NORMAL,
 ):
     # Prevent directory traversal attack
     if ".." in file_id or file_id.startswith("/"):
@@ -193,19 +398,25 @@ async def upload_to_google_drive(
     upload_id = str(uuid.uuid4())
 
     # Upload to Google Drive
-    background_tasks.add_task(
-        video_generation.run_upload_file_to_google_drive,
-        file_name,
-        file_path,
-        folder_id,
-        service_account_data,
-        upload_id,
+    job_id = await asyncio.to_thread(
+        jobs.enqueue,
+        video_generation.upload_file_to_google_drive,
+        {
+            "file_name": file_name,
+            "file_path": file_path,
+            "folder_id": folder_id,
+            "service_account_data": service_account_data,
+            "upload_id": upload_id,
+        },
+        priority=priority,
+        ref=upload_id,
     )
 
     return {
         "success": True,
         "message": "Upload started",
         "upload_id": upload_id,
+        "job_id": job_id,
     }
 
 
@@ -235,13 +446,13 @@ async def oauth2callback(request: Request):
 
 @video_generation_routes.get("/upload_youtube_video/{filename}")
 async def upload_youtube_video(
-    background_tasks: BackgroundTasks,
     filename: str,
     title: str,
     description: str,
     tags: str,
     category_id: str,
     privacy_status: str,
+    priority: int = jobs.PRIORITY_NORMAL,
 ):
     # Prevent directory traversal attack
     if ".." in filename or filename.startswith("/"):
@@ -267,26 +478,373 @@ async def upload_youtube_video(
     # Generate a unique upload ID
     upload_id = str(uuid.uuid4())
 
-    # Upload to Google Drive
-    background_tasks.add_task(
-        video_generation.run_upload_youtube_video,
-        file_path,
+    # Upload to YouTube
+    job_id = await asyncio.to_thread(
+        jobs.enqueue,
+        video_generation.upload_youtube_video,
+        {
+            "file_path": file_path,
+            "title": title,
+            "description": description,
+            "tags": tags,
+            "category_id": category_id,
+            "privacy_status": privacy_status,
+            "upload_id": upload_id,
+        },
+        priority=priority,
+        ref=upload_id,
+    )
+
+    return {
+        "success": True,
+        "message": "Upload started",
+        "upload_id": upload_id,
+        "job_id": job_id,
+    }
+
+
+@video_generation_routes.get("/check_youtube_upload_progress/{upload_id}")
+async def check_youtube_upload_progress(upload_id: str):
+
+    return await video_generation.get_youtube_upload_progress(upload_id)
+
+
+@video_generation_routes.post("/publish/{filename}")
+async def publish(
+    filename: str,
+    destinations: str,  # comma-separated: 'google_drive', 'youtube'
+    folder_id: str = None,
+    file_name: str = None,
+    service_account_data: str = Form(None),
+    title: str = None,
+    description: str = "",
+    tags: str = "",
+    category_id: str = None,
+    privacy_status: str = None,
+    priority: int = jobs.PRIORITY_NORMAL,
+):
+    # Prevent directory traversal attack
+    if ".." in filename or filename.startswith("/"):
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "success": False,
+                "message": "Invalid filename",
+            },
+        )
+
+    file_path = os.path.join(TEMP_DIR, filename)
+
+    if not os.path.isfile(file_path):
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "success": False,
+                "message": "File not found",
+            },
+        )
+
+    # Collect the upload options of each destination
+    options = video_generation.build_publish_options(
+        destinations,
+        file_name or filename,
+        folder_id,
+        service_account_data,
         title,
         description,
         tags,
         category_id,
         privacy_status,
-        upload_id
+    )
+
+    if not options:
+        raise HTTPException(
+            status_code=400,
+            detail={"success": False, "message": "No destinations given"},
+        )
+
+    # Generate a unique publish ID, also the upload ID of every destination
+    publish_id = str(uuid.uuid4())
+
+    job_id = await asyncio.to_thread(
+        jobs.enqueue,
+        video_generation.publish_file,
+        {
+            "file_path": file_path,
+            "publish_id": publish_id,
+            "destinations": options,
+        },
+        kind="publish",
+        priority=priority,
+        ref=publish_id,
     )
 
     return {
         "success": True,
-        "message": "Upload started",
-        "upload_id": upload_id,
+        "message": "Publish started",
+        "publish_id": publish_id,
+        "destinations": list(options),
+        "job_id": job_id,
     }
 
 
-@video_generation_routes.get("/check_youtube_upload_progress/{upload_id}")
-async def check_youtube_upload_progress(upload_id: str):
+@video_generation_routes.get("/publish/{publish_id}")
+async def check_publish(publish_id: str):
+
+    return await video_generation.get_publish_status(publish_id)
+
+
+@video_generation_routes.post("/pipeline")
+async def pipeline(
+    audio: UploadFile = File(None),
+    video: UploadFile = File(None),
+    audio_file: str = None,  # name of an already uploaded audio file
+    video_file: str = None,  # name of an already uploaded video file
+    destinations: str = "",  # comma-separated: 'google_drive', 'youtube'
+    folder_id: str = None,
+    file_name: str = None,
+    service_account_data: str = Form(None),
+    title: str = None,
+    description: str = "",
+    tags: str = "",
+    category_id: str = None,
+    privacy_status: str = None,
+    priority: int = jobs.PRIORITY_NORMAL,
+):
+    # Validate the publish targets before accepting any upload
+    options = video_generation.build_publish_options(
+        destinations,
+        file_name,
+        folder_id,
+        service_account_data,
+        title,
+        description,
+        tags,
+        category_id,
+        privacy_status,
+    )
+
+    # Resolve each input: a new upload or an already uploaded file
+    inputs = {}
+    for file_type, upload, existing in (
+        ("audio", audio, audio_file),
+        ("video", video, video_file),
+    ):
+        if upload is not None:
+            new_filename = f"{file_type}_{uuid.uuid4()}_{upload.filename}"
+            file_path = os.path.join(TEMP_DIR, new_filename)
+            await video_generation.save_upload_file(upload, file_path)
+            await asyncio.to_thread(storage.track, file_path, storage.INPUT)
+        elif existing and ".." not in existing and not existing.startswith("/"):
+            file_path = os.path.join(TEMP_DIR, existing)
+        else:
+            file_path = None
+
+        if file_path is None or not os.path.isfile(file_path):
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "success": False,
+                    "message": f"{file_type.capitalize()} file not found.",
+                },
+            )
+        inputs[file_type] = file_path
+
+    pipeline_id = str(uuid.uuid4())
+    output_tmp_path = os.path.join(TEMP_DIR, f"merged_{uuid.uuid4()}.mp4")
+    output_final_filename = os.path.basename(output_tmp_path).replace("merged_", "")
+
+    # Merge step; a cached output is picked up by the job itself
+    steps = {}
+    steps["merge"] = await asyncio.to_thread(
+        jobs.enqueue,
+        ffmpeg_commands.run_merge_audio_video,
+        {
+            "audio_path": inputs["audio"],
+            "video_path": inputs["video"],
+            "output_tmp_path": output_tmp_path,
+            "audio_sha256": file_stream.peek_file_digest(inputs["audio"]),
+            "video_sha256": file_stream.peek_file_digest(inputs["video"]),
+        },
+        kind="merge_audio_video",
+        priority=priority,
+        ref=output_final_filename,
+        pipeline_id=pipeline_id,
+        step="merge",
+    )
+
+    # Publish step, queued as soon as the merge completes
+    if options:
+        if video_generation.GOOGLE_DRIVE in options:
+            options[video_generation.GOOGLE_DRIVE]["file_name"] = (
+                file_name or output_final_filename
+            )
+        steps["publish"] = await asyncio.to_thread(
+            jobs.enqueue,
+            video_generation.publish_file,
+            {
+                "file_path": os.path.join(TEMP_DIR, output_final_filename),
+                "publish_id": pipeline_id,
+                "destinations": options,
+            },
+            kind="publish",
+            priority=priority,
+            ref=pipeline_id,
+            pipeline_id=pipeline_id,
+            step="publish",
+            depends_on=[steps["merge"]],
+        )
+
+    return {
+        "success": True,
+        "message": "Pipeline started",
+        "pipeline_id": pipeline_id,
+        "filename": output_final_filename,
+        "steps": steps,
+    }
 
-    return await video_generation.get_youtube_upload_progress(upload_id)
\ No newline at end of file
+
+@video_generation_routes.get("/pipeline/{pipeline_id}")
+async def check_pipeline(pipeline_id: str):
+
+    return await video_generation.get_pipeline_status(pipeline_id)
+
+
+@video_generation_routes.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(jobs.get_job, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"success": False, "message": "Job not found"},
+        )
+    return job
+
+
+@video_generation_routes.get("/jobs")
+async def list_jobs(state: str = None, limit: int = 100):
+    return {
+        "queue": await asyncio.to_thread(jobs.queue_depths),
+        "jobs": await asyncio.to_thread(jobs.list_jobs, state, min(limit, 1000)),
+    }
+
+
+def _upload_done(status: dict) -> bool:
+    return status.get("status") in ("completed", "failed")
+
+
+def _generation_done(status: dict) -> bool:
+    return status.get("success") or status.get("message") == "Generation failed"
+
+
+def _job_done(status: dict) -> bool:
+    return status.get("state") in (jobs.COMPLETED, jobs.FAILED)
+
+
+# Streamable progress: how to fetch it, and when it is final
+PROGRESS_STREAMS = {
+    "upload": (video_generation.get_upload_progress, _upload_done),
+    "youtube": (video_generation.get_youtube_upload_progress, _upload_done),
+    "generation": (generation_status, _generation_done),
+    "publish": (video_generation.get_publish_status, _job_done),
+    "pipeline": (video_generation.get_pipeline_status, _job_done),
+}
+
+
+def _progress_stream(kind: str, key: str):
+    if kind not in PROGRESS_STREAMS:
+        raise HTTPException(
+            status_code=404,
+            detail={"success": False, "message": f"Unknown progress stream '{kind}'"},
+        )
+    if ".." in key or key.startswith("/") or key.endswith(".tmp"):
+        raise HTTPException(
+            status_code=400,
+            detail={"success": False, "message": "Invalid ID"},
+        )
+
+    fetch, done = PROGRESS_STREAMS[kind]
+
+    async def fetch_status():
+        try:
+            return await fetch(key)
+        except HTTPException as e:
+            message = e.detail.get("message") if isinstance(e.detail, dict) else e.detail
+            return {"success": False, "message": message, "status_code": e.status_code}
+
+    return progress_bus.subscribe((kind, key), fetch_status), done
+
+
+def _is_final(status: dict, done) -> bool:
+    # Errors (e.g. unknown IDs) end the stream too
+    return "status_code" in status or bool(done(status))
+
+
+@video_generation_routes.get("/progress/{kind}/{key}/stream")
+async def stream_progress(kind: str, key: str):
+    """
+    Streams the progress of an upload ("upload", "youtube"), a merge
+    ("generation"), a publish or a pipeline as Server-Sent Events. Each
+    event carries the same JSON as the matching polling endpoint; the
+    stream ends once the status is final.
+    """
+    subscription, done = _progress_stream(kind, key)
+
+    async def events():
+        async with subscription as updates:
+            while True:
+                try:
+                    status = await updates.get(config.PROGRESS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(status, default=str)}\n\n"
+                if _is_final(status, done):
+                    break
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+@video_generation_routes.websocket("/progress/{kind}/{key}/ws")
+async def websocket_progress(websocket: WebSocket, kind: str, key: str):
+    """
+    Sends the progress of an upload, merge, publish or pipeline as JSON
+    messages, like the SSE stream, then closes once the status is final.
+    """
+    try:
+        subscription, done = _progress_stream(kind, key)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail["message"])
+        return
+
+    await websocket.accept()
+    disconnected = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        async with subscription as updates:
+            while True:
+                update = asyncio.create_task(updates.get())
+                await asyncio.wait(
+                    {update, disconnected}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not update.done():
+                    update.cancel()
+                    return
+
+                status = update.result()
+                await websocket.send_json(status)
+                if _is_final(status, done):
+                    break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
@@ -1,14 +1,56 @@
 import os
+import math
 import shutil
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.core.tools.ffmpeg import run_ffmpeg_command
+import time
 import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from app.core.tools.ffmpeg import (
+    FFmpegError,
+    ffmpeg_slot,
+    run_ffmpeg_command,
+    inspect_media,
+    get_stream,
+    get_duration,
+    parse_progress_time,
+)
+from app.core.tools import file_stream
+from app.core.tools.file_cache import FileCache, make_key
+from app.core.config import config
+from app.core import jobs, storage
 
 ffmpeg_router = APIRouter()
 
-TEMP_DIR = "storage/temp"
+TEMP_DIR = config.STORAGE_TEMP_DIR
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Codecs an MP4 can carry as they are; other streams get transcoded
+MP4_VIDEO_CODECS = {"h264", "hevc", "mpeg4", "av1"}
+MP4_AUDIO_CODECS = {"aac", "mp3"}
+
+# Encoder options used when a stream has to be transcoded
+VIDEO_TRANSCODE_ARGS = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-pix_fmt", "yuv420p"]
+AUDIO_TRANSCODE_ARGS = ["-c:a", "aac"]
+
+# Everything besides the inputs that decides the merge output; part of the cache key
+MERGE_OPTIONS = [
+    sorted(MP4_VIDEO_CODECS),
+    sorted(MP4_AUDIO_CODECS),
+    VIDEO_TRANSCODE_ARGS,
+    AUDIO_TRANSCODE_ARGS,
+]
+
+# Merged outputs keyed by input contents and merge options
+merge_cache = FileCache(config.MERGE_CACHE_DIR, config.MERGE_CACHE_MAX_BYTES, ".mp4")
+
+# Videos looped to standard lengths, keyed by video content and length
+loop_cache = FileCache(config.LOOP_CACHE_DIR, config.LOOP_CACHE_MAX_BYTES, ".mp4")
+
+# One build per looped video at a time in this process: a lock and the
+# number of merges holding or waiting for it, keyed like loop_cache
+_loop_locks = {}
+
 
 async def save_upload_file(upload_file: UploadFile, destination_path: str):
     with open(destination_path, "wb") as f:
@@ -16,37 +58,705 @@ async def save_upload_file(upload_file: UploadFile, destination_path: str):
     upload_file.file.close()
 
 
-def run_merge_audio_video(audio_path: str, video_path: str, output_tmp_path: str):
+def remove_partial_output(output_tmp_path: str):
+    # Never leave a half-written merge behind under the temp filename
+    if os.path.exists(output_tmp_path):
+        os.remove(output_tmp_path)
 
-    # Run your async merge function and wait for it
-    asyncio.run(merge_audio_video(audio_path, video_path, output_tmp_path))
 
-    # Rename merged file to remove "merged_" prefix
-    output_final_path = output_tmp_path.replace("merged_", "")
-    os.rename(output_tmp_path, output_final_path)
+def merge_cache_key(audio_sha256: Optional[str], video_sha256: Optional[str]) -> Optional[str]:
+    """
+    Returns the cache key of a merge from the content hashes of its inputs,
+    or None when the cache is disabled or a hash is unknown.
+    """
+    if config.MERGE_CACHE_MAX_BYTES <= 0 or not audio_sha256 or not video_sha256:
+        return None
+    return make_key(audio_sha256, video_sha256, MERGE_OPTIONS)
+
 
+def remove_inputs(audio_path: Optional[str] = None, video_path: Optional[str] = None):
     # Clean up input files after merge
-    if os.path.exists(audio_path):
+    if audio_path and os.path.exists(audio_path):
         os.remove(audio_path)
-    if os.path.exists(video_path):
+    if video_path and os.path.exists(video_path):
         os.remove(video_path)
 
 
-async def merge_audio_video(audio_file: str, video_file: str, output_file: str) -> str:
+async def run_merge_audio_video(
+    audio_path: str,
+    video_path: str,
+    output_tmp_path: str,
+    cache_key: Optional[str] = None,
+    audio_sha256: Optional[str] = None,
+    video_sha256: Optional[str] = None,
+    video_info: Optional[dict] = None,
+    keep_audio: bool = False,
+    keep_video: bool = False,
+):
+
+    output_final_path = output_tmp_path.replace("merged_", "")
+    # Inputs shared with other merges (e.g. a batch's video) stay
+    inputs = {
+        "audio_path": None if keep_audio else audio_path,
+        "video_path": None if keep_video else video_path,
+    }
+
+    # Inputs are hashed here rather than in the request, as they can be large
+    if config.MERGE_CACHE_MAX_BYTES > 0:
+        if audio_sha256 is None:
+            audio_sha256 = (await file_stream.get_file_digest(audio_path))["sha256"]
+        if video_sha256 is None:
+            video_sha256 = (await file_stream.get_file_digest(video_path))["sha256"]
+        cache_key = cache_key or merge_cache_key(audio_sha256, video_sha256)
+
+    # Identical inputs were merged before: reuse that output
+    if cache_key and await asyncio.to_thread(
+        merge_cache.get_into, cache_key, output_final_path
+    ):
+        remove_inputs(**inputs)
+        await asyncio.to_thread(storage.track, output_final_path, storage.OUTPUT)
+        return {"filename": os.path.basename(output_final_path), "mode": "cached"}
+
+    # Run the merge on the event loop; ffmpeg itself runs as a child process
+    try:
+        codecs = await merge_audio_video(
+            audio_path, video_path, output_tmp_path, audio_sha256, video_sha256, video_info
+        )
+    except BaseException:
+        # Inputs are kept so the job can be retried
+        remove_partial_output(output_tmp_path)
+        raise
+
+    # Rename merged file to remove "merged_" prefix
+    os.rename(output_tmp_path, output_final_path)
+    await asyncio.to_thread(storage.track, output_final_path, storage.OUTPUT)
+
+    if cache_key:
+        await asyncio.to_thread(merge_cache.put, cache_key, output_final_path)
+
+    remove_inputs(**inputs)
+
+    return {"filename": os.path.basename(output_final_path), **codecs}
+
+
+class MergeProgress:
+    """
+    Turns ffmpeg "-progress" blocks into a percentage, encode speed and ETA
+    measured against the audio duration, and reports them on the running job.
+    """
+
+    def __init__(self, duration: Optional[float], codecs: dict):
+        self.duration = duration
+        self.codecs = codecs
+        self.started_at = time.time()
+
+    def __call__(self, block: dict):
+        out_time = parse_progress_time(block) or 0.0
+        elapsed = time.time() - self.started_at
+
+        speed = block.get("speed", "N/A").rstrip("x").strip()
+        speed = float(speed) if speed not in ("", "N/A") else None
+        if not speed and elapsed > 0 and out_time > 0:
+            speed = out_time / elapsed
+
+        percent_complete = None
+        eta_seconds = None
+        if self.duration:
+            percent_complete = min(round(out_time / self.duration * 100, 1), 100.0)
+            if speed:
+                eta_seconds = round(max(self.duration - out_time, 0) / speed, 1)
+        if block.get("progress") == "end":
+            percent_complete = 100.0
+            eta_seconds = 0
+
+        jobs.report_progress(
+            {
+                "percent_complete": percent_complete,
+                "out_time": round(out_time, 2),
+                "duration": self.duration,
+                "speed": round(speed, 2) if speed else None,
+                "eta_seconds": eta_seconds,
+                "elapsed_seconds": round(elapsed, 1),
+                "updated_at": time.time(),
+                **self.codecs,
+            }
+        )
+
+
+def choose_codec_args(audio_info: dict, video_info: dict) -> tuple[list[str], dict]:
+    """
+    Picks stream copy for every stream an MP4 can carry as it is and
+    transcoding only for the others.
+
+    Returns:
+        tuple[list[str], dict]: The ffmpeg codec options, and a summary of
+            the chosen path ("video"/"audio": "copy" or "transcode", and
+            "mode": "remux" when nothing is transcoded).
+    """
+    video_stream = get_stream(video_info, "video") or {}
+    audio_stream = get_stream(audio_info, "audio") or {}
+
+    copy_video = video_stream.get("codec_name") in MP4_VIDEO_CODECS
+    copy_audio = audio_stream.get("codec_name") in MP4_AUDIO_CODECS
+
+    args = ["-c:v", "copy"] if copy_video else VIDEO_TRANSCODE_ARGS
+    args = args + (["-c:a", "copy"] if copy_audio else AUDIO_TRANSCODE_ARGS)
+
+    return args, {
+        "video": "copy" if copy_video else "transcode",
+        "audio": "copy" if copy_audio else "transcode",
+        "mode": "remux" if copy_video and copy_audio else "transcode",
+    }
+
+
+async def merge_audio_video(
+    audio_file: str,
+    video_file: str,
+    output_file: str,
+    audio_sha256: Optional[str] = None,
+    video_sha256: Optional[str] = None,
+    video_info: Optional[dict] = None,
+) -> dict:
+    # Probe both inputs (cached per content hash) to pick the cheapest codecs;
+    # a batch probes its video once and passes the result to every merge
+    if video_info is None:
+        audio_info, video_info = await asyncio.gather(
+            inspect_media(audio_file, audio_sha256),
+            inspect_media(video_file, video_sha256),
+        )
+    else:
+        audio_info = await inspect_media(audio_file, audio_sha256)
+    codec_args, codecs = choose_codec_args(audio_info, video_info)
+
+    # The audio decides the output length
+    duration = get_duration(audio_info)
+
+    # Cut a pre-looped copy of the video instead of looping it on every merge
+    looped_file = f"{output_file}.loop.mp4"
+    try:
+        looped = await place_looped_video(
+            video_file, video_info, duration, looped_file, video_sha256
+        )
+    except FFmpegError as e:
+        print(f"Could not prepare a looped video for {output_file}, using -stream_loop: {e}")
+        looped = False
+    if looped:
+        audio_args = codec_args[codec_args.index("-c:a"):]
+        codecs = {
+            **codecs,
+            "video": "copy",
+            "mode": "remux" if codecs["audio"] == "copy" else "transcode",
+        }
+        command = [
+            "ffmpeg",
+            "-y",
+            "-nostats",
+            "-progress",
+            "pipe:1",
+            "-i",
+            looped_file,
+            "-i",
+            audio_file,
+            "-map",
+            "0:v:0",
+            "-map",
+            "1:a:0",
+            "-t",
+            f"{duration:.3f}",
+            "-c:v",
+            "copy",
+        ] + audio_args + [output_file]
+        print(f"Merging {output_file} (pre-looped video, audio {codecs['audio']})")
+        try:
+            await run_ffmpeg_command(command, on_progress=MergeProgress(duration, codecs))
+        finally:
+            remove_partial_output(looped_file)
+        return {**codecs, "loop": "prebuilt"}
+
+    # A long video transcode is split over several encoders
+    segments = plan_segments(duration, video_info) if codecs["video"] == "transcode" else None
+    if segments:
+        await merge_segmented(
+            audio_file, video_file, output_file, duration, segments, codecs
+        )
+        return {**codecs, "loop": "stream_loop", "segments": len(segments)}
+
     command = [
         "ffmpeg",
         "-y",
+        "-nostats",
+        "-progress",
+        "pipe:1",  # Machine-readable progress on stdout
         "-stream_loop",
         "-1",  # Loop video infinitely
         "-i",
         video_file,
         "-i",
         audio_file,
+        "-map",
+        "0:v:0",  # Picture from the video, even if it has its own audio
+        "-map",
+        "1:a:0",
         "-shortest",  # Stop when the shortest input ends (the audio)
-        "-c:v",
-        "copy",
-        "-c:a",
+    ]
+    if duration:
+        # -shortest alone can keep looping the video while the audio
+        # encoder drains, so also cap the output at the audio length
+        command += ["-t", f"{duration:.3f}"]
+    command += codec_args + [output_file]
+
+    print(f"Merging {output_file} ({codecs['mode']}: video {codecs['video']}, audio {codecs['audio']})")
+    await run_ffmpeg_command(command, on_progress=MergeProgress(duration, codecs))
+    return {**codecs, "loop": "stream_loop"}
+
+
+def _frame_rate(video_stream: dict) -> Optional[float]:
+    # Only constant frame rates can be cut at exact frame counts
+    rates = {video_stream.get("r_frame_rate"), video_stream.get("avg_frame_rate")}
+    if len(rates) != 1 or None in rates:
+        return None
+    numerator, _, denominator = rates.pop().partition("/")
+    try:
+        rate = float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return rate or None
+
+
+def plan_segments(duration: Optional[float], video_info: dict) -> Optional[list[dict]]:
+    """
+    Splits the output timeline of a merge into segments to encode in
+    parallel: as many as the MERGE_MAX_SEGMENTS budget allows while each
+    stays at least MERGE_SEGMENT_MIN_SECONDS long.
+
+    Segments are whole frames of the looped video, so each encoded segment
+    starts on a keyframe and they join without re-encoding.
+
+    Returns:
+        list[dict]: The "offset" of each segment into the video (seconds)
+            and its number of "frames", or None when a single encoder
+            should do the whole merge (short output, unknown duration or a
+            variable frame rate).
+    """
+    video_stream = get_stream(video_info, "video") or {}
+    frame_rate = _frame_rate(video_stream)
+    video_duration = get_duration(video_info)
+    if not duration or not frame_rate or not video_duration:
+        return None
+
+    count = min(config.MERGE_MAX_SEGMENTS, int(duration // config.MERGE_SEGMENT_MIN_SECONDS))
+    if count < 2:
+        return None
+
+    total_frames = math.ceil(duration * frame_rate)
+    loop_frames = max(round(video_duration * frame_rate), 1)
+    frames_per_segment = math.ceil(total_frames / count)
+    return [
+        {
+            "offset": (start % loop_frames) / frame_rate,
+            "frames": min(frames_per_segment, total_frames - start),
+        }
+        for start in range(0, total_frames, frames_per_segment)
+    ]
+
+
+class SegmentProgress:
+    """
+    Adds up the progress of parallel segment encoders into one report.
+    """
+
+    def __init__(self, progress: MergeProgress, count: int):
+        self.progress = progress
+        self.out_times = [0.0] * count
+
+    def segment(self, index: int) -> Callable[[dict], None]:
+        def on_progress(block: dict):
+            self.out_times[index] = parse_progress_time(block) or self.out_times[index]
+            self.progress(
+                {
+                    "out_time_us": str(int(sum(self.out_times) * 1_000_000)),
+                    "speed": "N/A",
+                    "progress": "continue",
+                }
+            )
+
+        return on_progress
+
+
+async def _run_all(*commands):
+    # Runs the commands concurrently; the first failure cancels the rest
+    tasks = [asyncio.create_task(command) for command in commands]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def merge_segmented(
+    audio_file: str,
+    video_file: str,
+    output_file: str,
+    duration: float,
+    segments: list[dict],
+    codecs: dict,
+):
+    """
+    Merges with the looped video transcoded in parallel segments (see
+    plan_segments), then joined with the concat demuxer and muxed with the
+    audio by stream copy. The output has the same streams, codecs and
+    container as a single-pass merge.
+
+    The audio is encoded in one piece while the segments run: AAC frames
+    carry encoder delay, so audio encoded in segments would click at every
+    join.
+    """
+    progress = SegmentProgress(MergeProgress(duration, codecs), len(segments))
+    threads = max((os.cpu_count() or 1) // len(segments), 1)
+    segment_files = [f"{output_file}.{index}.mp4" for index in range(len(segments))]
+    list_file = f"{output_file}.txt"
+    audio_source = audio_file
+    temp_files = segment_files + [list_file]
+
+    commands = [
+        run_ffmpeg_command(
+            [
+                "ffmpeg",
+                "-y",
+                "-nostats",
+                "-progress",
+                "pipe:1",
+                "-stream_loop",
+                "-1",
+                "-ss",
+                f"{segment['offset']:.6f}",
+                "-i",
+                video_file,
+                "-map",
+                "0:v:0",
+                "-an",
+                "-frames:v",
+                str(segment["frames"]),
+            ]
+            + VIDEO_TRANSCODE_ARGS
+            + ["-threads", str(threads), segment_file],
+            on_progress=progress.segment(index),
+        )
+        for index, (segment, segment_file) in enumerate(zip(segments, segment_files))
+    ]
+    if codecs["audio"] == "transcode":
+        audio_source = f"{output_file}.audio.m4a"
+        temp_files.append(audio_source)
+        commands.append(
+            run_ffmpeg_command(
+                ["ffmpeg", "-y", "-i", audio_file, "-map", "0:a:0", "-vn"]
+                + AUDIO_TRANSCODE_ARGS
+                + [audio_source]
+            )
+        )
+
+    print(
+        f"Merging {output_file} in {len(segments)} segments "
+        f"({threads} threads each, audio {codecs['audio']})"
+    )
+    try:
+        await _run_all(*commands)
+
+        with open(list_file, "w") as f:
+            for segment_file in segment_files:
+                escaped = os.path.abspath(segment_file).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        await run_ffmpeg_command(
+            [
+                "ffmpeg",
+                "-y",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                list_file,
+                "-i",
+                audio_source,
+                "-map",
+                "0:v:0",
+                "-map",
+                "1:a:0",
+                "-t",
+                f"{duration:.3f}",
+                "-c",
+                "copy",
+                output_file,
+            ]
+        )
+        progress.progress(
+            {"out_time_us": str(int(duration * 1_000_000)), "progress": "end"}
+        )
+    finally:
+        for path in temp_files:
+            remove_partial_output(path)
+
+
+@asynccontextmanager
+async def _loop_lock(key: str):
+    # The entry goes once no merge uses it, so the mapping stays small
+    entry = _loop_locks.get(key)
+    if entry is None:
+        entry = _loop_locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _loop_locks[key]
+
+
+async def place_looped_video(
+    video_file: str,
+    video_info: dict,
+    duration: Optional[float],
+    destination: str,
+    video_sha256: Optional[str] = None,
+) -> bool:
+    """
+    Places at `destination` (hard link when possible) the video looped to
+    the shortest of the LOOP_CACHE_LENGTHS covering `duration`, building
+    and caching it on a miss. The result is H.264 or another codec an MP4
+    carries as it is, so merges can cut it at the audio length with
+    stream copy.
+
+    Returns:
+        bool: False when no looped video applies: the cache is disabled,
+            the duration is unknown, longer than every length, or shorter
+            than the smallest one (building and storing a loop far longer
+            than the output would cost more than -stream_loop).
+    """
+    video_duration = get_duration(video_info)
+    lengths = sorted(config.LOOP_CACHE_LENGTHS)
+    if config.LOOP_CACHE_MAX_BYTES <= 0 or not duration or not video_duration or not lengths:
+        return False
+    if duration <= video_duration or duration < lengths[0]:
+        return False
+    length = next((length for length in lengths if length >= duration), None)
+    if length is None:
+        return False
+
+    if video_sha256 is None:
+        video_sha256 = (await file_stream.get_file_digest(video_file))["sha256"]
+    video_stream = get_stream(video_info, "video") or {}
+    copy_video = video_stream.get("codec_name") in MP4_VIDEO_CODECS
+    key = make_key(video_sha256, length, copy_video or VIDEO_TRANSCODE_ARGS)
+
+    async with _loop_lock(key):
+        if await asyncio.to_thread(loop_cache.get_into, key, destination):
+            return True
+        await build_looped_video(video_file, video_duration, copy_video, length, destination)
+        await asyncio.to_thread(loop_cache.put, key, destination)
+    return True
+
+
+async def build_looped_video(
+    video_file: str,
+    video_duration: float,
+    copy_video: bool,
+    length: int,
+    destination: str,
+):
+    """
+    Writes the video stream of `video_file` repeated to `length` seconds.
+
+    The copies are joined with the concat demuxer and stream copy, so at
+    most one pass of the video is encoded: when its codec cannot go into
+    an MP4 as it is, a single loop is transcoded first and then repeated.
+    """
+    unit_file = f"{destination}.unit.mp4"
+    list_file = f"{destination}.txt"
+    source = video_file
+    try:
+        if not copy_video:
+            await run_ffmpeg_command(
+                ["ffmpeg", "-y", "-i", video_file, "-map", "0:v:0", "-an"]
+                + VIDEO_TRANSCODE_ARGS
+                + [unit_file]
+            )
+            source = unit_file
+
+        # One spare loop covers rounding in the stream durations
+        loops = math.ceil(length / video_duration) + 1
+        escaped = os.path.abspath(source).replace("'", "'\\''")
+        with open(list_file, "w") as f:
+            f.write(f"file '{escaped}'\n" * loops)
+
+        print(f"Building {length}s looped video from {video_file} ({loops} loops)")
+        await run_ffmpeg_command(
+            [
+                "ffmpeg",
+                "-y",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                list_file,
+                "-map",
+                "0:v:0",
+                "-c",
+                "copy",
+                "-t",
+                str(length),
+                destination,
+            ]
+        )
+    except BaseException:
+        remove_partial_output(destination)
+        raise
+    finally:
+        remove_partial_output(unit_file)
+        remove_partial_output(list_file)
+
+
+async def run_merge_audio_stream(
+    chunks: AsyncIterator[bytes],
+    video_path: str,
+    output_tmp_path: str,
+    video_sha256: Optional[str] = None,
+) -> dict:
+    """
+    Merges audio arriving as a stream with a stored video, renaming the
+    output once it is complete. The video is kept so it can be reused.
+    """
+    output_final_path = output_tmp_path.replace("merged_", "")
+    try:
+        codecs = await merge_audio_stream(chunks, video_path, output_tmp_path, video_sha256)
+    except BaseException:
+        remove_partial_output(output_tmp_path)
+        raise
+
+    os.rename(output_tmp_path, output_final_path)
+    await asyncio.to_thread(storage.track, output_final_path, storage.OUTPUT)
+    return {"filename": os.path.basename(output_final_path), **codecs}
+
+
+async def merge_audio_stream(
+    chunks: AsyncIterator[bytes],
+    video_file: str,
+    output_file: str,
+    video_sha256: Optional[str] = None,
+) -> dict:
+    """
+    Merges audio fed to ffmpeg's stdin as it arrives (e.g. straight from a
+    request body) with a looped, stored video, so encoding overlaps the
+    upload and the audio is never written to disk.
+
+    The audio must be in a format readable from a pipe (MP3, ADTS AAC,
+    WAV, Ogg, ...; not MP4/M4A). Its duration is unknown up front, so
+    progress reports the encoded time but no percentage.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The audio data.
+        video_file (str): Path of the video to loop under the audio.
+        output_file (str): Path of the MP4 to create.
+        video_sha256 (str): Content hash of the video, for the probe cache.
+
+    Returns:
+        dict: The chosen codec paths, as from choose_codec_args.
+    """
+    video_info = await inspect_media(video_file, video_sha256)
+    video_stream = get_stream(video_info, "video") or {}
+    copy_video = video_stream.get("codec_name") in MP4_VIDEO_CODECS
+    codecs = {
+        "video": "copy" if copy_video else "transcode",
+        "audio": "transcode",
+        "mode": "stream",
+    }
+    progress = MergeProgress(None, codecs)
+
+    # Without a known duration there is no "-t" guard, and -shortest on a
+    # looped video overshoots (or, with the video copied, never stops)
+    # while the audio is encoded in the same process. So the audio is
+    # encoded to ADTS AAC by a first process and copied by the second,
+    # where -shortest cuts the output at the end of the audio.
+    command = [
+        "ffmpeg",
+        "-y",
+        "-nostats",
+        "-progress",
+        "pipe:1",
+        "-stream_loop",
+        "-1",
+        "-i",
+        video_file,
+        "-f",
         "aac",
-        output_file,
+        "-i",
+        "pipe:0",
+        "-map",
+        "0:v:0",
+        "-map",
+        "1:a:0",
+        "-shortest",
     ]
-    return await run_ffmpeg_command(command)
+    command += (["-c:v", "copy"] if copy_video else VIDEO_TRANSCODE_ARGS)
+    command += ["-c:a", "copy", output_file]
+    encode_command = ["ffmpeg", "-i", "pipe:0", "-vn"] + AUDIO_TRANSCODE_ARGS
+    encode_command += ["-f", "adts", "pipe:1"]
+
+    print(f"Merging streamed audio into {output_file} (video {codecs['video']})")
+
+    # Both processes count as one ffmpeg run
+    async with ffmpeg_slot():
+        read_fd, write_fd = os.pipe()
+        open_fds = {read_fd, write_fd}
+
+        def close_fd(fd: int):
+            if fd in open_fds:
+                open_fds.remove(fd)
+                os.close(fd)
+
+        encode = mux = None
+        try:
+            encode = asyncio.create_task(
+                run_ffmpeg_command(
+                    encode_command, stdin=chunks, stdout=write_fd, acquire_slot=False
+                )
+            )
+            # The mux only sees the end of the audio once this process has
+            # closed its copy of the write end as well
+            encode.add_done_callback(lambda _: close_fd(write_fd))
+            mux = asyncio.create_task(
+                run_ffmpeg_command(
+                    command, on_progress=progress, stdin=read_fd, acquire_slot=False
+                )
+            )
+            # Without a reader left, the encoder must fail to write rather
+            # than block on a full pipe
+            mux.add_done_callback(lambda _: close_fd(read_fd))
+
+            await asyncio.wait({encode, mux}, return_when=asyncio.FIRST_EXCEPTION)
+            if mux.done() and mux.exception() is not None:
+                # Nothing reads the audio any more
+                encode.cancel()
+                await asyncio.gather(encode, return_exceptions=True)
+                raise mux.exception()
+            # A failed encode is the root cause; the mux only sees an early
+            # end of the audio, so let it exit before reporting the failure
+            await asyncio.gather(mux, return_exceptions=True)
+            encode.result()
+            mux.result()
+        except BaseException:
+            tasks = [task for task in (encode, mux) if task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            # Also covers tasks cancelled before they started
+            for fd in list(open_fds):
+                close_fd(fd)
+
+    return codecs
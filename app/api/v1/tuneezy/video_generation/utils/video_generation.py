@@ -1,39 +1,117 @@
 from fastapi import UploadFile, HTTPException, Request
-from app.core.tools import google_drive, youtube
+from app.core.tools import google_drive, youtube, file_stream
+from app.core import jobs, status_store, storage
 import asyncio
 import uuid
 from typing import Dict
 import os
-import json
 from app.core.tools.youtube import authorize, oauth2callback
 
 
+# Legacy JSON status files, imported into the status store at startup
 UPLOAD_STATUS_FILE = "app/api/v1/tuneezy/video_generation/storage/video_upload.json"
 YOUTUBE_UPLOAD_STATUS_FILE = "app/api/v1/tuneezy/video_generation/storage/youtube_upload.json"
 
+# Status store destinations
+GOOGLE_DRIVE = "google_drive"
+YOUTUBE = "youtube"
+
 SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
 REDIRECT_URI = "http://localhost:8000/api/v1/tuneezy/video_generation/oauth2callback"
 
 
 # Utility to save uploaded file
 async def save_upload_file(upload_file: UploadFile, destination: str):
-    with open(destination, "wb") as out_file:
-        content = await upload_file.read()
-        out_file.write(content)
+    try:
+        return await file_stream.save_upload_file(upload_file, destination)
+    except file_stream.FileTooLargeError as e:
+        raise HTTPException(
+            status_code=413,
+            detail={"success": False, "message": str(e)},
+        )
 
 
-def run_upload_file_to_google_drive(
-    file_name: str,
-    file_path: str,
-    folder_id: str,
-    service_account_data: str,
-    upload_id: str,
-):
-    asyncio.run(
-        upload_file_to_google_drive(
-            file_name, file_path, folder_id, service_account_data, upload_id
+def migrate_status_files():
+    """
+    Imports the legacy JSON upload status files into the status store.
+    """
+    status_store.migrate_json_file(GOOGLE_DRIVE, UPLOAD_STATUS_FILE)
+    status_store.migrate_json_file(YOUTUBE, YOUTUBE_UPLOAD_STATUS_FILE)
+
+
+class UploadProgressReporter:
+    """
+    Publishes the upload percentage and throughput of the running job so the
+    API process can answer progress requests. The last throughput is kept
+    for the final status record.
+    """
+
+    def __init__(self, publish=jobs.report_progress):
+        self.throughput_bps = None
+        self.publish = publish
+
+    def __call__(self, percent_complete: int, throughput_bps: float = None):
+        if throughput_bps is not None:
+            self.throughput_bps = round(throughput_bps, 1)
+        self.publish(
+            {"percent_complete": percent_complete, "throughput_bps": self.throughput_bps}
         )
-    )
+
+
+class PublishProgress:
+    """
+    Tracks the progress of each destination of a publish job and reports
+    them together as the job's progress.
+    """
+
+    def __init__(self, destinations):
+        self.destinations = {
+            destination: {"status": "queued", "percent_complete": 0, "throughput_bps": None}
+            for destination in destinations
+        }
+
+    def update(self, destination: str, fields: dict):
+        self.destinations[destination].update(fields)
+        jobs.report_progress({"destinations": self.destinations})
+
+    def reporter(self, destination: str) -> UploadProgressReporter:
+        return UploadProgressReporter(lambda fields: self.update(destination, fields))
+
+
+async def get_job_upload_progress(upload_id: str, destination: str = None):
+    """
+    Builds an upload status from the job running the upload, or returns
+    None if there is no such job. For publish jobs the progress of the
+    given destination is used.
+    """
+    job = await asyncio.to_thread(jobs.get_job_by_ref, upload_id)
+    if job is None:
+        return None
+
+    # Jobs waiting for their dependencies (e.g. a pipeline's publish step)
+    # are reported as queued, as is any state added later
+    status = {
+        jobs.BLOCKED: "queued",
+        jobs.QUEUED: "queued",
+        jobs.RUNNING: "in_progress",
+        jobs.COMPLETED: "completed",
+        jobs.FAILED: "failed",
+    }.get(job["state"], "queued")
+
+    progress = job["progress"] or {}
+    if "destinations" in progress:
+        progress = progress["destinations"].get(destination) or {}
+        if progress.get("status") in ("completed", "failed"):
+            status = progress["status"]
+
+    return {
+        "video_id": "0",
+        "percent_complete": progress.get("percent_complete", 0),
+        "status": status,
+        "uploaded_at": None,
+        "throughput_bps": progress.get("throughput_bps"),
+        "job_id": job["id"],
+    }
 
 
 # Utility to upload file to the google drive
@@ -43,37 +121,39 @@ async def upload_file_to_google_drive(
     folder_id: str,
     service_account_data: str,
     upload_id: str,
+    stream=None,
+    reporter: UploadProgressReporter = None,
 ):
 
+    reporter = reporter or UploadProgressReporter()
+
     # Upload the file to Google Drive
     file_id = await google_drive.upload_file(
-        file_name, file_path, folder_id, service_account_data, upload_id
+        file_name,
+        file_path,
+        folder_id,
+        service_account_data,
+        upload_id,
+        on_progress=reporter,
+        stream=stream,
     )
 
-    # Prepare the result data
-    result_data = {
-        upload_id: {
+    # Record the result
+    await asyncio.to_thread(
+        status_store.set_status,
+        GOOGLE_DRIVE,
+        upload_id,
+        {
             "video_id": file_id,
             "percent_complete": 100,
             "status": "completed",
             "uploaded_at": str(os.path.getmtime(file_path)),
-        }
-    }
-
-    # Load existing JSON data if file exists
-    if os.path.exists(UPLOAD_STATUS_FILE):
-        with open(UPLOAD_STATUS_FILE, "r") as f:
-            try:
-                existing_data = json.load(f)
-            except json.JSONDecodeError:
-                existing_data = {}
-    else:
-        existing_data = {}
+            "throughput_bps": reporter.throughput_bps,
+        },
+    )
+    await asyncio.to_thread(storage.mark_published, file_path)
 
-    # Update and save
-    existing_data.update(result_data)
-    with open(UPLOAD_STATUS_FILE, "w") as f:
-        json.dump(existing_data, f, indent=4)
+    return file_id
 
 
 async def get_upload_progress(upload_id: str):
@@ -87,24 +167,15 @@ async def get_upload_progress(upload_id: str):
         int: The current upload progress percentage.
     """
 
-    # First check the JSON file for completed uploads
-    if os.path.exists(UPLOAD_STATUS_FILE):
-        with open(UPLOAD_STATUS_FILE, "r") as f:
-            try:
-                data = json.load(f)
-                if upload_id in data:
-                    return data[upload_id]
-            except json.JSONDecodeError:
-                pass  # Ignore corrupted file and fall back to in-memory progress
-
-    # If not found in file, check the in-memory progress
-    if upload_id in google_drive.upload_progress:
-        return {
-            "video_id": "0",
-            "percent_complete": google_drive.upload_progress[upload_id],
-            "status": "in_progress",
-            "uploaded_at": None,
-        }
+    # First check the status store for completed uploads
+    status = await asyncio.to_thread(status_store.get_status, GOOGLE_DRIVE, upload_id)
+    if status is not None:
+        return status
+
+    # If not found in the store, check the job running the upload
+    progress = await get_job_upload_progress(upload_id, GOOGLE_DRIVE)
+    if progress is not None:
+        return progress
 
     # If not found in either
     raise HTTPException(status_code=404, detail="Upload ID not found")
@@ -129,27 +200,6 @@ async def youtube_auth_callback(request: Request):
     )
 
 
-def run_upload_youtube_video(
-    file_path: str,
-    title: str,
-    description: str,
-    tags: str,
-    category_id: str,
-    privacy_status: str,
-    upload_id: str
-):
-    return asyncio.run(
-        upload_youtube_video(
-            file_path,
-            title,
-            description,
-            tags,
-            category_id,
-            privacy_status,
-            upload_id
-        )
-    )
-
 async def upload_youtube_video(
     file_path: str,
     title: str,
@@ -157,9 +207,12 @@ async def upload_youtube_video(
     tags: str,
     category_id: str,
     privacy_status: str,
-    upload_id: str
+    upload_id: str,
+    stream=None,
+    reporter: UploadProgressReporter = None,
 ):
     
+    reporter = reporter or UploadProgressReporter()
     file_id = await youtube.upload_file(
         application="tuneezy",
         file_path=file_path,
@@ -168,33 +221,31 @@ async def upload_youtube_video(
         tags=tags,
         category_id=category_id,
         privacy_status=privacy_status,
-        upload_id=upload_id
+        upload_id=upload_id,
+        on_progress=reporter,
+        stream=stream,
     )
+
+    # Errors come back as a status dict: fail the job instead of recording them
+    if isinstance(file_id, dict) and file_id.get("status") == "error":
+        raise RuntimeError(file_id["message"])
     
-    # Prepare the result data
-    result_data = {
-        upload_id: {
+    # Record the result
+    await asyncio.to_thread(
+        status_store.set_status,
+        YOUTUBE,
+        upload_id,
+        {
             "video_id": file_id,
             "percent_complete": 100,
             "status": "completed",
             "uploaded_at": str(os.path.getmtime(file_path)),
-        }
-    }
-
-    # Load existing JSON data if file exists
-    if os.path.exists(YOUTUBE_UPLOAD_STATUS_FILE):
-        with open(YOUTUBE_UPLOAD_STATUS_FILE, "r") as f:
-            try:
-                existing_data = json.load(f)
-            except json.JSONDecodeError:
-                existing_data = {}
-    else:
-        existing_data = {}
+            "throughput_bps": reporter.throughput_bps,
+        },
+    )
+    await asyncio.to_thread(storage.mark_published, file_path)
 
-    # Update and save
-    existing_data.update(result_data)
-    with open(YOUTUBE_UPLOAD_STATUS_FILE, "w") as f:
-        json.dump(existing_data, f, indent=4)
+    return file_id
         
         
 async def get_youtube_upload_progress(upload_id: str):
@@ -208,24 +259,269 @@ async def get_youtube_upload_progress(upload_id: str):
         int: The current upload progress percentage.
     """
 
-    # First check the JSON file for completed uploads
-    if os.path.exists(YOUTUBE_UPLOAD_STATUS_FILE):
-        with open(YOUTUBE_UPLOAD_STATUS_FILE, "r") as f:
-            try:
-                data = json.load(f)
-                if upload_id in data:
-                    return data[upload_id]
-            except json.JSONDecodeError:
-                pass  # Ignore corrupted file and fall back to in-memory progress
-
-    # If not found in file, check the in-memory progress
-    if upload_id in youtube.upload_progress:
-        return {
-            "video_id": "0",
-            "percent_complete": youtube.upload_progress[upload_id],
-            "status": "in_progress",
-            "uploaded_at": None,
-        }
+    # First check the status store for completed uploads
+    status = await asyncio.to_thread(status_store.get_status, YOUTUBE, upload_id)
+    if status is not None:
+        return status
+
+    # If not found in the store, check the job running the upload
+    progress = await get_job_upload_progress(upload_id, YOUTUBE)
+    if progress is not None:
+        return progress
 
     # If not found in either
-    raise HTTPException(status_code=404, detail="Upload ID not found")
\ No newline at end of file
+    raise HTTPException(status_code=404, detail="Upload ID not found")
+
+
+def build_publish_options(
+    destinations: str,
+    file_name: str,
+    folder_id: str = None,
+    service_account_data: str = None,
+    title: str = None,
+    description: str = "",
+    tags: str = "",
+    category_id: str = None,
+    privacy_status: str = None,
+) -> Dict[str, dict]:
+    """
+    Validates the destinations of a publish and collects the upload options
+    of each.
+
+    Args:
+        destinations (str): Comma-separated destinations ("google_drive", "youtube").
+        file_name (str): Name of the file on Google Drive.
+
+    Returns:
+        dict: Upload options keyed by destination.
+    """
+    options = {}
+    for destination in dict.fromkeys(d.strip().lower() for d in destinations.split(",")):
+        if not destination:
+            continue
+        if destination == GOOGLE_DRIVE:
+            required = {"folder_id": folder_id, "service_account_data": service_account_data}
+            options[destination] = {"file_name": file_name, **required}
+        elif destination == YOUTUBE:
+            required = {
+                "title": title,
+                "category_id": category_id,
+                "privacy_status": privacy_status,
+            }
+            options[destination] = {"description": description, "tags": tags, **required}
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "success": False,
+                    "message": f"Unknown destination '{destination}'",
+                },
+            )
+
+        missing = [name for name, value in required.items() if not value]
+        if missing:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "success": False,
+                    "message": f"Missing {', '.join(missing)} for {destination}",
+                },
+            )
+
+    return options
+
+
+# Upload handlers of each publish destination
+PUBLISHERS = {
+    GOOGLE_DRIVE: upload_file_to_google_drive,
+    YOUTUBE: upload_youtube_video,
+}
+
+
+async def publish_file(file_path: str, publish_id: str, destinations: Dict[str, dict]):
+    """
+    Uploads one file to several destinations concurrently.
+
+    The uploads read the file through a shared read-ahead buffer, so it is
+    read from disk once. Each destination reports its own progress and
+    fails on its own; when the job is retried, destinations that already
+    completed are skipped.
+
+    Args:
+        file_path (str): Path of the file to publish.
+        publish_id (str): The unique ID of the publish, used as the upload
+            ID of every destination.
+        destinations (dict): Upload options keyed by destination.
+
+    Returns:
+        dict: The uploaded file or video ID keyed by destination.
+    """
+    progress = PublishProgress(destinations)
+    reader = file_stream.SharedFileReader(file_path)
+
+    async def publish(destination: str, options: dict):
+        existing = await asyncio.to_thread(status_store.get_status, destination, publish_id)
+        if existing is not None and existing["status"] == "completed":
+            progress.update(destination, {"status": "completed", "percent_complete": 100})
+            return existing["video_id"]
+
+        progress.update(destination, {"status": "in_progress"})
+        try:
+            result = await PUBLISHERS[destination](
+                file_path=file_path,
+                upload_id=publish_id,
+                stream=reader.open(),
+                reporter=progress.reporter(destination),
+                **options,
+            )
+        except Exception as e:
+            progress.update(destination, {"status": "failed", "error": str(e)})
+            raise
+        progress.update(destination, {"status": "completed", "percent_complete": 100})
+        return result
+
+    results = await asyncio.gather(
+        *(publish(destination, options) for destination, options in destinations.items()),
+        return_exceptions=True,
+    )
+
+    failed = {
+        destination: result
+        for destination, result in zip(destinations, results)
+        if isinstance(result, BaseException)
+    }
+    if failed:
+        # Chained to the first error, which decides whether to retry
+        raise RuntimeError(
+            "Publishing failed for "
+            + ", ".join(f"{destination} ({error})" for destination, error in failed.items())
+        ) from next(iter(failed.values()))
+
+    return dict(zip(destinations, results))
+
+
+async def get_publish_status(publish_id: str):
+    """
+    Get the status of a publish and of each of its destinations.
+
+    Args:
+        publish_id (str): The unique ID of the publish.
+
+    Returns:
+        dict: The job state and a status per destination.
+    """
+    job = await asyncio.to_thread(jobs.get_job_by_ref, publish_id)
+    if job is None or job["kind"] != "publish":
+        raise HTTPException(status_code=404, detail="Publish ID not found")
+
+    destinations = {}
+    for destination, progress in ((job["progress"] or {}).get("destinations") or {}).items():
+        # Completed uploads are recorded in the status store
+        status = await asyncio.to_thread(status_store.get_status, destination, publish_id)
+        destinations[destination] = status if status is not None else progress
+
+    return {
+        "publish_id": publish_id,
+        "job_id": job["id"],
+        "state": job["state"],
+        "error": job["error"],
+        "destinations": destinations,
+    }
+
+
+async def get_pipeline_status(pipeline_id: str):
+    """
+    Get the status and timings of each step of a pipeline.
+
+    Args:
+        pipeline_id (str): The unique ID of the pipeline.
+
+    Returns:
+        dict: The overall state and the steps keyed by name.
+    """
+    steps = await asyncio.to_thread(jobs.get_pipeline, pipeline_id)
+    if not steps:
+        raise HTTPException(status_code=404, detail="Pipeline ID not found")
+
+    states = {step["state"] for step in steps}
+    if jobs.FAILED in states:
+        state = jobs.FAILED
+    elif states == {jobs.COMPLETED}:
+        state = jobs.COMPLETED
+    elif states <= {jobs.QUEUED, jobs.BLOCKED}:
+        state = jobs.QUEUED
+    else:
+        state = jobs.RUNNING
+
+    def seconds(start, end):
+        return round(end - start, 3) if start is not None and end is not None else None
+
+    return {
+        "pipeline_id": pipeline_id,
+        "state": state,
+        "steps": {
+            step["step"]: {
+                "job_id": step["id"],
+                "state": step["state"],
+                "depends_on": step["depends_on"] or [],
+                "progress": step["progress"],
+                "result": step["result"],
+                "error": step["error"],
+                "created_at": step["created_at"],
+                "started_at": step["started_at"],
+                "finished_at": step["finished_at"],
+                "wait_seconds": seconds(step["created_at"], step["started_at"]),
+                "run_seconds": seconds(step["started_at"], step["finished_at"]),
+            }
+            for step in steps
+        },
+    }
+
+
+async def get_batch_status(batch_id: str):
+    """
+    Get the status of each merge of a batch.
+
+    Args:
+        batch_id (str): The unique ID of the batch.
+
+    Returns:
+        dict: The overall state, counts per state and the items in request
+            order.
+    """
+    steps = await asyncio.to_thread(jobs.get_pipeline, batch_id)
+    items = [step for step in steps if step["kind"] == "merge_audio_video"]
+    if not items:
+        raise HTTPException(status_code=404, detail="Batch ID not found")
+
+    counts = {}
+    for item in items:
+        counts[item["state"]] = counts.get(item["state"], 0) + 1
+
+    if counts.get(jobs.COMPLETED) == len(items):
+        state = jobs.COMPLETED
+    elif counts.get(jobs.COMPLETED, 0) + counts.get(jobs.FAILED, 0) == len(items):
+        state = jobs.FAILED
+    elif set(counts) <= {jobs.QUEUED, jobs.BLOCKED}:
+        state = jobs.QUEUED
+    else:
+        state = jobs.RUNNING
+
+    return {
+        "batch_id": batch_id,
+        "state": state,
+        "total": len(items),
+        "counts": counts,
+        "items": [
+            {
+                "audio_file": item["step"],
+                "filename": item["ref"],
+                "job_id": item["id"],
+                "state": item["state"],
+                "progress": item["progress"],
+                "result": item["result"],
+                "error": item["error"],
+            }
+            for item in items
+        ],
+    }
@@ -16,5 +16,113 @@ class Config:
     CCN_NEWS_API_KEY = os.getenv("CCN_NEWS_API_KEY")
     CCN_DAILY_ARTICLE_DB_NOTION = os.getenv("CCN_DAILY_ARTICLE_DB_NOTION")
 
+    # File uploads
+    UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+    UPLOAD_READ_CHUNK_SIZE = int(os.getenv("UPLOAD_READ_CHUNK_SIZE", 1024 * 1024))
+
+    # File downloads
+    FILE_SEND_CHUNK_SIZE = int(os.getenv("FILE_SEND_CHUNK_SIZE", 1024 * 1024))
+
+    # Resumable uploads to Google Drive / YouTube
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 256 * 1024))
+    UPLOAD_MAX_CHUNK_SIZE = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", 32 * 1024 * 1024))
+    UPLOAD_ADAPTIVE_CHUNKS = os.getenv("UPLOAD_ADAPTIVE_CHUNKS", "true").lower() == "true"
+    UPLOAD_MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", 5))
+
+    # Publishing one file to several destinations
+    PUBLISH_READ_BLOCK_SIZE = int(os.getenv("PUBLISH_READ_BLOCK_SIZE", 4 * 1024 * 1024))
+    PUBLISH_READ_AHEAD_BLOCKS = int(os.getenv("PUBLISH_READ_AHEAD_BLOCKS", 4))
+    PUBLISH_BUFFER_BYTES = int(os.getenv("PUBLISH_BUFFER_BYTES", 128 * 1024 * 1024))
+
+    # FFmpeg
+    # Shared by the API and job worker processes through lock files in
+    # FFMPEG_SLOTS_DIR
+    FFMPEG_MAX_CONCURRENCY = int(os.getenv("FFMPEG_MAX_CONCURRENCY", os.cpu_count() or 1))
+    FFMPEG_SLOTS_DIR = os.getenv("FFMPEG_SLOTS_DIR", "storage/ffmpeg_slots")
+    FFMPEG_SLOT_POLL_INTERVAL = float(os.getenv("FFMPEG_SLOT_POLL_INTERVAL", 0.1))
+    FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", 6 * 60 * 60))
+    FFMPEG_STDERR_LINES = int(os.getenv("FFMPEG_STDERR_LINES", 200))
+    FFPROBE_TIMEOUT = float(os.getenv("FFPROBE_TIMEOUT", 60))
+    PROBE_CACHE_SIZE = int(os.getenv("PROBE_CACHE_SIZE", 1024))
+    FILE_DIGEST_CACHE_SIZE = int(os.getenv("FILE_DIGEST_CACHE_SIZE", 4096))
+
+    # Long video transcodes are split into this many segments at most,
+    # each at least MERGE_SEGMENT_MIN_SECONDS long, encoded in parallel
+    MERGE_MAX_SEGMENTS = int(os.getenv("MERGE_MAX_SEGMENTS", FFMPEG_MAX_CONCURRENCY))
+    MERGE_SEGMENT_MIN_SECONDS = float(os.getenv("MERGE_SEGMENT_MIN_SECONDS", 120))
+
+    # Merge output cache
+    MERGE_CACHE_DIR = os.getenv("MERGE_CACHE_DIR", "storage/temp/cache/merged")
+    MERGE_CACHE_MAX_BYTES = int(os.getenv("MERGE_CACHE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+
+    # Pre-looped videos that merges cut at the audio length (0 bytes disables)
+    LOOP_CACHE_DIR = os.getenv("LOOP_CACHE_DIR", "storage/temp/cache/looped")
+    LOOP_CACHE_MAX_BYTES = int(os.getenv("LOOP_CACHE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+    LOOP_CACHE_LENGTHS = [
+        int(seconds)
+        for seconds in os.getenv("LOOP_CACHE_LENGTHS", "600,1800,3600,7200").split(",")
+        if seconds.strip()
+    ]
+
+    # Temp storage lifecycle
+    STORAGE_TEMP_DIR = os.getenv("STORAGE_TEMP_DIR", "storage/temp")
+    STORAGE_DB_PATH = os.getenv("STORAGE_DB_PATH", "storage/files.db")
+    STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", 50 * 1024 * 1024 * 1024))
+    STORAGE_INPUT_TTL = float(os.getenv("STORAGE_INPUT_TTL", 24 * 60 * 60))
+    STORAGE_OUTPUT_TTL = float(os.getenv("STORAGE_OUTPUT_TTL", 7 * 24 * 60 * 60))
+    STORAGE_PUBLISHED_TTL = float(os.getenv("STORAGE_PUBLISHED_TTL", 24 * 60 * 60))
+    STORAGE_PARTIAL_TTL = float(os.getenv("STORAGE_PARTIAL_TTL", 12 * 60 * 60))
+    STORAGE_SWEEP_INTERVAL = float(os.getenv("STORAGE_SWEEP_INTERVAL", 5 * 60))
+    # Partial outputs written to within this time may belong to a merge of
+    # another process (e.g. a streaming merge) and are not orphans
+    STORAGE_ORPHAN_GRACE = float(os.getenv("STORAGE_ORPHAN_GRACE", 60 * 60))
+
+    # Upload status store
+    STATUS_DB_PATH = os.getenv("STATUS_DB_PATH", "storage/status.db")
+    STATUS_RETENTION_SECONDS = float(os.getenv("STATUS_RETENTION_SECONDS", 30 * 24 * 60 * 60))
+    STATUS_MAX_RECORDS = int(os.getenv("STATUS_MAX_RECORDS", 100_000))
+
+    # Google API clients
+    GOOGLE_CLIENT_TTL = float(os.getenv("GOOGLE_CLIENT_TTL", 60 * 60))
+    GOOGLE_CLIENT_CACHE_SIZE = int(os.getenv("GOOGLE_CLIENT_CACHE_SIZE", 32))
+    GOOGLE_TOKEN_REFRESH_MARGIN = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", 5 * 60))
+    # How often stored OAuth tokens (YouTube) are checked and refreshed
+    # ahead of expiry in the background
+    GOOGLE_TOKEN_REFRESH_INTERVAL = float(os.getenv("GOOGLE_TOKEN_REFRESH_INTERVAL", 60))
+    # Pending YouTube authorisations (OAuth states) expire after this long
+    OAUTH_STATE_TTL = float(os.getenv("OAUTH_STATE_TTL", 15 * 60))
+    OAUTH_STATE_CACHE_SIZE = int(os.getenv("OAUTH_STATE_CACHE_SIZE", 256))
+    GOOGLE_HTTP_POOL_SIZE = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", 4))
+    # Base URL of the Drive and YouTube APIs, e.g. a local stand-in such as
+    # the one of the benchmarks; unset for Google's own
+    GOOGLE_API_ENDPOINT = os.getenv("GOOGLE_API_ENDPOINT")
+
+    # Job queue
+    JOB_DB_PATH = os.getenv("JOB_DB_PATH", "storage/jobs.db")
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+    # Held by the one web process that runs the JOB_WORKERS pool
+    JOB_POOL_LOCK_PATH = os.getenv("JOB_POOL_LOCK_PATH", "storage/job_pool.lock")
+    JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", 4))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))
+    JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 60 * 60))
+
+    # Progress streaming (SSE / WebSocket)
+    PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", 0.5))
+    PROGRESS_KEEPALIVE_SECONDS = float(os.getenv("PROGRESS_KEEPALIVE_SECONDS", 15))
+
+    # Metrics and readiness
+    METRICS_DIR = os.getenv("METRICS_DIR", "storage/metrics")
+    HEALTH_MIN_FREE_BYTES = int(os.getenv("HEALTH_MIN_FREE_BYTES", 2 * 1024 * 1024 * 1024))
+
+    # Request timing (Server-Timing header, logs of slow requests) and profiling
+    TIMING_ENABLED = os.getenv("TIMING_ENABLED", "true").lower() == "true"
+    TIMING_LOG_MIN_SECONDS = float(os.getenv("TIMING_LOG_MIN_SECONDS", 1))
+    PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+    PROFILE_ALLOW_HEADER = os.getenv("PROFILE_ALLOW_HEADER", "false").lower() == "true"
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "storage/profiles")
+
 
 config = Config()
@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# One connection per thread and database file
+_local = threading.local()
+
+
+def connect(path: str, schema: str = "") -> sqlite3.Connection:
+    """
+    Returns this thread's connection to a local SQLite database.
+
+    The database runs in WAL mode so readers never block the writer, and
+    the schema is applied the first time a thread opens the file.
+
+    Args:
+        path (str): Path of the database file.
+        schema (str): SQL script creating the tables (must be idempotent).
+
+    Returns:
+        sqlite3.Connection: A connection in autocommit mode.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if schema:
+            conn.executescript(schema)
+        connections[path] = conn
+
+    return conn
+
+
+def add_missing_columns(conn: sqlite3.Connection, table: str, columns: dict):
+    """
+    Adds columns introduced after a table was first created.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database.
+        table (str): Name of the table.
+        columns (dict): Column definitions ("TEXT", "REAL", ...) keyed by name.
+    """
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, definition in columns.items():
+        if name in existing:
+            continue
+        try:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+        except sqlite3.OperationalError:
+            pass  # Another process added it first
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """
+    Runs a block of statements as one write transaction.
+
+    The write lock is taken up front so concurrent processes serialise
+    instead of failing with "database is locked" on upgrade.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
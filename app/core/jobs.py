@@ -0,0 +1,401 @@
+import json
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Callable, Optional
+from app.core.config import config
+from app.core.db import add_missing_columns, connect, transaction
+
+# Job states
+BLOCKED = "blocked"  # Waiting for the jobs it depends on
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Job priorities (higher runs first)
+PRIORITY_LOW = -10
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 10
+
+# ID of the job the current task is running, set by the worker
+current_job_id: ContextVar[Optional[str]] = ContextVar("current_job_id", default=None)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    handler TEXT NOT NULL,
+    payload TEXT,
+    ref TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 1,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_expires_at REAL,
+    pipeline_id TEXT,
+    step TEXT,
+    depends_on TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, priority DESC, created_at);
+CREATE INDEX IF NOT EXISTS jobs_ref ON jobs (ref);
+"""
+
+# Columns added after the first release, applied to existing databases
+UPGRADES = {"pipeline_id": "TEXT", "step": "TEXT", "depends_on": "TEXT"}
+
+# Indexes on upgraded columns, created once they exist
+INDEXES = """
+CREATE INDEX IF NOT EXISTS jobs_pipeline ON jobs (pipeline_id);
+"""
+
+_upgraded = set()
+
+# Columns returned to API clients (the payload may contain credentials)
+PUBLIC_COLUMNS = (
+    "id, kind, ref, priority, state, attempts, max_attempts, progress, result, "
+    "error, worker, created_at, started_at, finished_at, pipeline_id, step, depends_on"
+)
+
+
+def _db():
+    conn = connect(config.JOB_DB_PATH, SCHEMA)
+    if config.JOB_DB_PATH not in _upgraded:
+        add_missing_columns(conn, "jobs", UPGRADES)
+        conn.executescript(INDEXES)
+        _upgraded.add(config.JOB_DB_PATH)
+    return conn
+
+
+def _to_dict(row) -> Optional[dict]:
+    if row is None:
+        return None
+    job = dict(row)
+    for key in ("payload", "progress", "result", "depends_on"):
+        if job.get(key) is not None:
+            job[key] = json.loads(job[key])
+    return job
+
+
+def enqueue(
+    handler: Callable,
+    kwargs: dict,
+    kind: Optional[str] = None,
+    priority: int = PRIORITY_NORMAL,
+    ref: Optional[str] = None,
+    max_attempts: Optional[int] = None,
+    pipeline_id: Optional[str] = None,
+    step: Optional[str] = None,
+    depends_on: Optional[list] = None,
+) -> str:
+    """
+    Adds a job to the queue.
+
+    The handler is stored by import path, so it must be a module-level
+    function; workers import it and call it with the given keyword arguments.
+
+    Args:
+        handler (Callable): The function (sync or async) to run.
+        kwargs (dict): JSON-serialisable keyword arguments for the handler.
+        kind (str): Short job type shown to clients. Defaults to the
+            handler's name.
+        priority (int): Jobs with a higher priority are claimed first.
+        ref (str): Client-facing identifier (e.g. an upload ID or output
+            filename) used to look the job up.
+        max_attempts (int): How many times the job may run before it is
+            marked failed. Defaults to the JOB_MAX_ATTEMPTS setting.
+        pipeline_id (str): ID of the pipeline the job is a step of.
+        step (str): Name of the step within its pipeline.
+        depends_on (list): IDs of jobs that must complete before this one
+            is queued. If one of them fails, so does this job.
+
+    Returns:
+        str: The ID of the new job.
+    """
+    job_id = str(uuid.uuid4())
+    conn = _db()
+    with transaction(conn):
+        conn.execute(
+            "INSERT INTO jobs (id, kind, handler, payload, ref, priority, state, "
+            "max_attempts, created_at, pipeline_id, step, depends_on) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_id,
+                kind or handler.__name__,
+                f"{handler.__module__}:{handler.__qualname__}",
+                json.dumps(kwargs),
+                ref,
+                priority,
+                BLOCKED if depends_on else QUEUED,
+                max_attempts or config.JOB_MAX_ATTEMPTS,
+                time.time(),
+                pipeline_id,
+                step,
+                json.dumps(depends_on) if depends_on else None,
+            ),
+        )
+        if depends_on:
+            # Dependencies may have finished already
+            _settle_blocked(conn)
+    return job_id
+
+
+def _settle_blocked(conn):
+    """
+    Queues blocked jobs whose dependencies have all completed, and fails
+    those with a failed dependency (and, in turn, their dependents).
+    Must run inside a transaction.
+    """
+    now = time.time()
+    while True:
+        cursor = conn.execute(
+            "UPDATE jobs SET state = ?, payload = NULL, finished_at = ?, "
+            "error = 'A step this job depends on failed' "
+            "WHERE state = ? AND EXISTS (SELECT 1 FROM json_each(jobs.depends_on) d "
+            "JOIN jobs dep ON dep.id = d.value WHERE dep.state = ?)",
+            (FAILED, now, BLOCKED, FAILED),
+        )
+        if cursor.rowcount == 0:
+            break
+
+    conn.execute(
+        "UPDATE jobs SET state = ? WHERE state = ? AND NOT EXISTS ("
+        "SELECT 1 FROM json_each(jobs.depends_on) d LEFT JOIN jobs dep "
+        "ON dep.id = d.value WHERE dep.state IS NOT ?)",
+        (QUEUED, BLOCKED, COMPLETED),
+    )
+
+
+def claim_next(worker: str) -> Optional[dict]:
+    """
+    Atomically takes the highest-priority queued job for a worker.
+
+    Args:
+        worker (str): ID of the claiming worker.
+
+    Returns:
+        dict: The claimed job including its payload, or None if the queue
+            is empty.
+    """
+    conn = _db()
+    now = time.time()
+    with transaction(conn):
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE state = ? "
+            "ORDER BY priority DESC, created_at LIMIT 1",
+            (QUEUED,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        conn.execute(
+            "UPDATE jobs SET state = ?, worker = ?, attempts = attempts + 1, "
+            "started_at = ?, lease_expires_at = ? WHERE id = ?",
+            (RUNNING, worker, now, now + config.JOB_LEASE_SECONDS, row["id"]),
+        )
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+    return _to_dict(job)
+
+
+def heartbeat(job_id: str):
+    """
+    Extends the lease of a running job so it is not reclaimed.
+    """
+    _db().execute(
+        "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND state = ?",
+        (time.time() + config.JOB_LEASE_SECONDS, job_id, RUNNING),
+    )
+
+
+def complete(job_id: str, result=None):
+    """
+    Marks a job as completed, drops its payload and queues the jobs that
+    were only waiting for it.
+    """
+    conn = _db()
+    with transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET state = ?, result = ?, payload = NULL, finished_at = ?, "
+            "lease_expires_at = NULL WHERE id = ?",
+            (COMPLETED, json.dumps(result, default=str), time.time(), job_id),
+        )
+        _settle_blocked(conn)
+
+
+def fail(job_id: str, error: str, retry: bool = True):
+    """
+    Records a failed attempt, re-queueing the job if it has attempts left.
+
+    Args:
+        job_id (str): The failed job.
+        error (str): What went wrong, kept on the job.
+        retry (bool): Whether another attempt may succeed. False fails the
+            job right away (e.g. an input ffmpeg cannot read).
+    """
+    conn = _db()
+    with transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET state = CASE WHEN ? AND attempts < max_attempts THEN ? ELSE ? END, "
+            "error = ?, lease_expires_at = NULL, "
+            "finished_at = CASE WHEN ? AND attempts < max_attempts THEN NULL ELSE ? END "
+            "WHERE id = ?",
+            (retry, QUEUED, FAILED, error, retry, time.time(), job_id),
+        )
+        cursor = conn.execute(
+            "UPDATE jobs SET payload = NULL WHERE id = ? AND state = ?",
+            (job_id, FAILED),
+        )
+        if cursor.rowcount:
+            _settle_blocked(conn)
+
+
+def release(job_id: str):
+    """
+    Puts a running job back in the queue without counting the attempt,
+    e.g. when its worker is shutting down.
+    """
+    _db().execute(
+        "UPDATE jobs SET state = ?, attempts = attempts - 1, worker = NULL, "
+        "lease_expires_at = NULL WHERE id = ? AND state = ?",
+        (QUEUED, job_id, RUNNING),
+    )
+
+
+def recover_expired() -> int:
+    """
+    Re-queues running jobs whose worker stopped renewing the lease (crashed
+    or killed), and fails those that have used up their attempts.
+
+    Returns:
+        int: The number of jobs recovered.
+    """
+    conn = _db()
+    now = time.time()
+    with transaction(conn):
+        cursor = conn.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+            "error = 'Worker stopped responding', worker = NULL, lease_expires_at = NULL, "
+            "finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END "
+            "WHERE state = ? AND lease_expires_at < ?",
+            (QUEUED, FAILED, now, RUNNING, now),
+        )
+        if cursor.rowcount:
+            _settle_blocked(conn)
+    return cursor.rowcount
+
+
+def prune(retention_seconds: Optional[float] = None) -> int:
+    """
+    Deletes finished jobs older than the retention period.
+
+    Returns:
+        int: The number of jobs deleted.
+    """
+    if retention_seconds is None:
+        retention_seconds = config.JOB_RETENTION_SECONDS
+    cursor = _db().execute(
+        "DELETE FROM jobs WHERE state IN (?, ?) AND finished_at < ?",
+        (COMPLETED, FAILED, time.time() - retention_seconds),
+    )
+    return cursor.rowcount
+
+
+def set_progress(job_id: str, progress: dict):
+    """
+    Stores the latest progress report of a running job.
+    """
+    _db().execute(
+        "UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id)
+    )
+
+
+def report_progress(progress: dict):
+    """
+    Stores progress for the job the current task is running. Does nothing
+    when called outside a job, so job handlers can also be called directly.
+    """
+    job_id = current_job_id.get()
+    if job_id is not None:
+        set_progress(job_id, progress)
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """
+    Returns a job without its payload, or None if it does not exist.
+    """
+    row = _db().execute(
+        f"SELECT {PUBLIC_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    return _to_dict(row)
+
+
+def get_job_by_ref(ref: str) -> Optional[dict]:
+    """
+    Returns the most recent job with the given client-facing reference.
+    """
+    row = _db().execute(
+        f"SELECT {PUBLIC_COLUMNS} FROM jobs WHERE ref = ? "
+        "ORDER BY created_at DESC LIMIT 1",
+        (ref,),
+    ).fetchone()
+    return _to_dict(row)
+
+
+def get_pipeline(pipeline_id: str) -> list[dict]:
+    """
+    Returns the jobs of a pipeline (without payloads) in creation order.
+    """
+    rows = _db().execute(
+        f"SELECT {PUBLIC_COLUMNS} FROM jobs WHERE pipeline_id = ? ORDER BY created_at",
+        (pipeline_id,),
+    ).fetchall()
+    return [_to_dict(row) for row in rows]
+
+
+def active_payloads(states: tuple = (BLOCKED, QUEUED, RUNNING)) -> list[dict]:
+    """
+    Returns the payloads of unfinished jobs, for housekeeping that must not
+    touch files still in use. Never expose these to clients.
+    """
+    placeholders = ", ".join("?" for _ in states)
+    rows = _db().execute(
+        f"SELECT payload FROM jobs WHERE state IN ({placeholders}) AND payload IS NOT NULL",
+        states,
+    ).fetchall()
+    return [json.loads(row["payload"]) for row in rows]
+
+
+def list_jobs(state: Optional[str] = None, limit: int = 100) -> list[dict]:
+    """
+    Returns the most recent jobs, optionally filtered by state.
+    """
+    if state is None:
+        rows = _db().execute(
+            f"SELECT {PUBLIC_COLUMNS} FROM jobs ORDER BY created_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+    else:
+        rows = _db().execute(
+            f"SELECT {PUBLIC_COLUMNS} FROM jobs WHERE state = ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (state, limit),
+        ).fetchall()
+    return [_to_dict(row) for row in rows]
+
+
+def queue_depths() -> dict:
+    """
+    Returns the number of jobs in each state.
+    """
+    rows = _db().execute(
+        "SELECT state, COUNT(*) AS count FROM jobs GROUP BY state"
+    ).fetchall()
+    return {row["state"]: row["count"] for row in rows}
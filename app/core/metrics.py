@@ -0,0 +1,169 @@
+import os
+import time
+from app.core.config import config
+
+# Every process (uvicorn workers, job workers) writes its samples to its
+# own memory-mapped files in this directory and a scrape adds them up.
+# prometheus_client picks the mode when it is imported, so the directory
+# has to be set first.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", config.METRICS_DIR)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+from starlette.types import ASGIApp, Message, Receive, Scope, Send  # noqa: E402
+from app.core import jobs, storage  # noqa: E402
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve an HTTP request, by route template.",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+FFMPEG_RUN_SECONDS = Histogram(
+    "ffmpeg_run_duration_seconds",
+    "Wall time of ffmpeg processes, by outcome.",
+    ["result"],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200),
+)
+FFMPEG_EXITS = Counter(
+    "ffmpeg_exits",
+    'ffmpeg processes finished, by exit code ("timeout" or "killed" when stopped).',
+    ["exit_code"],
+)
+FFMPEG_ACTIVE = Gauge(
+    "ffmpeg_active_processes",
+    "ffmpeg processes currently running.",
+    multiprocess_mode="livesum",
+)
+UPLOAD_BYTES = Counter(
+    "upload_bytes",
+    "Bytes sent to upload destinations; rate() gives the throughput.",
+    ["destination"],
+)
+STARTUP_SECONDS = Gauge(
+    "app_startup_seconds",
+    "Time the slowest API process took to start, by phase "
+    '("process" runs until the app is imported, "total" until it is ready).',
+    ["phase"],
+    multiprocess_mode="max",
+)
+STATUS_STORE_SECONDS = Histogram(
+    "status_store_operation_seconds",
+    "Latency of upload status store reads and writes.",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+
+
+class _StateCollector:
+    # Read at scrape time from the shared databases rather than counted
+    def collect(self):
+        queue = GaugeMetricFamily("job_queue_jobs", "Jobs in the queue, by state.", labels=["state"])
+        for state, count in jobs.queue_depths().items():
+            queue.add_metric([state], count)
+        yield queue
+
+        usage = storage.usage()
+        temp = GaugeMetricFamily(
+            "temp_storage_bytes", "Space used by tracked temp files, by class.", labels=["file_class"]
+        )
+        for file_class, entry in usage["classes"].items():
+            temp.add_metric([file_class], entry["bytes"])
+        yield temp
+        yield GaugeMetricFamily(
+            "temp_storage_quota_bytes", "Temp storage quota.", value=usage["quota_bytes"]
+        )
+        yield GaugeMetricFamily(
+            "temp_disk_free_bytes", "Free space on the temp disk.", value=usage["disk_free_bytes"]
+        )
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Collects the metrics of all processes in the Prometheus text format.
+
+    Returns:
+        tuple[bytes, str]: The payload and its content type.
+    """
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_StateCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_dead_processes() -> int:
+    """
+    Deletes the metric files of processes that no longer run, e.g. from
+    before a restart, so the directory does not grow without bound.
+
+    Returns:
+        int: The number of files removed.
+    """
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    removed = 0
+    for name in os.listdir(directory):
+        # Files are named "<type>[_<mode>]_<pid>.db"
+        pid = name.rsplit("_", 1)[-1].removesuffix(".db")
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            os.remove(os.path.join(directory, name))
+            removed += 1
+    return removed
+
+
+def mark_process_dead(pid: int):
+    """
+    Drops the live gauges of a stopped process (e.g. a job worker).
+    """
+    multiprocess.mark_process_dead(pid)
+
+
+class MetricsMiddleware:
+    """
+    Records the duration and status of every HTTP request, labelled with
+    the matched route template so paths with IDs don't each become a series.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(
+                time.perf_counter() - started
+            )
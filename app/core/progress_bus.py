@@ -0,0 +1,121 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from app.core.config import config
+
+
+class Subscription:
+    """
+    Receives the values published on one topic.
+
+    Only the latest value is kept: a consumer that falls behind skips the
+    intermediate updates instead of building up a backlog.
+    """
+
+    def __init__(self):
+        self._value = None
+        self._event = asyncio.Event()
+
+    def push(self, value: Any):
+        self._value = value
+        self._event.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Waits for a value newer than the last one returned.
+
+        Raises:
+            asyncio.TimeoutError: If nothing was published within `timeout`.
+        """
+        await asyncio.wait_for(self._event.wait(), timeout)
+        self._event.clear()
+        return self._value
+
+
+class _Topic:
+    def __init__(self, fetch: Callable[[], Awaitable[Any]]):
+        self.fetch = fetch
+        self.subscribers = set()
+        self.last = None
+
+
+class ProgressBus:
+    """
+    In-process publish/subscribe of progress values.
+
+    Jobs report progress from the worker processes into the job and status
+    stores. Rather than every client polling those, a single task in the
+    API process fetches each watched topic once per PROGRESS_POLL_INTERVAL
+    and publishes the value to all of its subscribers when it changed. The
+    task only runs while someone is subscribed.
+    """
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval or config.PROGRESS_POLL_INTERVAL
+        self._topics = {}
+        self._task = None
+
+    def publish(self, key: Hashable, value: Any):
+        """
+        Publishes a value to the subscribers of a topic if it changed.
+        """
+        topic = self._topics.get(key)
+        if topic is None or value == topic.last:
+            return
+        topic.last = value
+        for subscription in topic.subscribers:
+            subscription.push(value)
+
+    async def _refresh(self, key: Hashable, topic: _Topic):
+        try:
+            value = await topic.fetch()
+        except Exception as e:
+            # Keep the last value; the next poll tries again
+            print(f"Failed to fetch progress of {key}: {e}")
+            return
+        self.publish(key, value)
+
+    async def _poll(self):
+        while self._topics:
+            await asyncio.sleep(self.interval)
+            await asyncio.gather(
+                *(self._refresh(key, topic) for key, topic in list(self._topics.items()))
+            )
+
+    @asynccontextmanager
+    async def subscribe(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        """
+        Subscribes to a topic for the duration of the block.
+
+        Args:
+            key (Hashable): Identifies the topic, e.g. ("upload", upload_id).
+            fetch (Callable): Coroutine function returning the topic's
+                current value. Used by the first subscriber of the topic.
+
+        Yields:
+            Subscription: Receives the current value right away, then every
+                change.
+        """
+        subscription = Subscription()
+        topic = self._topics.get(key)
+        if topic is None:
+            topic = self._topics[key] = _Topic(fetch)
+            topic.subscribers.add(subscription)
+            await self._refresh(key, topic)
+        else:
+            topic.subscribers.add(subscription)
+            if topic.last is not None:
+                subscription.push(topic.last)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+
+        try:
+            yield subscription
+        finally:
+            topic.subscribers.discard(subscription)
+            if not topic.subscribers and self._topics.get(key) is topic:
+                del self._topics[key]
+
+
+progress_bus = ProgressBus()
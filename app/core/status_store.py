@@ -0,0 +1,235 @@
+import json
+import os
+import time
+from typing import Optional
+from app.core import metrics
+from app.core.config import config
+from app.core.db import add_missing_columns, connect, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_status (
+    destination TEXT NOT NULL,
+    upload_id TEXT NOT NULL,
+    video_id TEXT,
+    percent_complete INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    uploaded_at TEXT,
+    throughput_bps REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (destination, upload_id)
+);
+CREATE INDEX IF NOT EXISTS upload_status_updated ON upload_status (updated_at);
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    destination TEXT NOT NULL,
+    upload_id TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    resumable_uri TEXT NOT NULL,
+    offset INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (destination, upload_id)
+);
+"""
+
+# Resumable sessions are kept by Google for about a week
+SESSION_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+# Columns added after the first release, applied to existing databases
+UPGRADES = {"throughput_bps": "REAL"}
+
+_upgraded = set()
+
+
+def _db():
+    conn = connect(config.STATUS_DB_PATH, SCHEMA)
+    if config.STATUS_DB_PATH not in _upgraded:
+        add_missing_columns(conn, "upload_status", UPGRADES)
+        _upgraded.add(config.STATUS_DB_PATH)
+    return conn
+
+
+def set_status(destination: str, upload_id: str, status: dict):
+    """
+    Creates or replaces the status record of an upload in one atomic write.
+
+    Args:
+        destination (str): Where the file was uploaded ("google_drive", "youtube", ...).
+        upload_id (str): The unique ID for the upload.
+        status (dict): The "video_id", "percent_complete", "status",
+            "uploaded_at" and (optional) "throughput_bps" fields.
+    """
+    with metrics.STATUS_STORE_SECONDS.labels("set_status").time():
+        _db().execute(
+            "INSERT INTO upload_status (destination, upload_id, video_id, percent_complete, "
+            "status, uploaded_at, throughput_bps, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(destination, upload_id) DO UPDATE SET video_id = excluded.video_id, "
+            "percent_complete = excluded.percent_complete, status = excluded.status, "
+            "uploaded_at = excluded.uploaded_at, throughput_bps = excluded.throughput_bps, "
+            "updated_at = excluded.updated_at",
+            (
+                destination,
+                upload_id,
+                json.dumps(status.get("video_id")),
+                status.get("percent_complete", 0),
+                status["status"],
+                status.get("uploaded_at"),
+                status.get("throughput_bps"),
+                time.time(),
+            ),
+        )
+
+
+def get_status(destination: str, upload_id: str) -> Optional[dict]:
+    """
+    Returns the status record of an upload, or None if there is none.
+    """
+    with metrics.STATUS_STORE_SECONDS.labels("get_status").time():
+        row = _db().execute(
+            "SELECT video_id, percent_complete, status, uploaded_at, throughput_bps "
+            "FROM upload_status "
+            "WHERE destination = ? AND upload_id = ?",
+            (destination, upload_id),
+        ).fetchone()
+        if row is None:
+            return None
+        status = dict(row)
+        status["video_id"] = json.loads(status["video_id"])
+        return status
+
+
+def prune(
+    retention_seconds: Optional[float] = None, max_records: Optional[int] = None
+) -> int:
+    """
+    Deletes status records not updated within the retention period, then
+    the least recently updated ones beyond `max_records`, and resumable
+    sessions old enough to have expired on the server.
+
+    Returns:
+        int: The number of records deleted.
+    """
+    if retention_seconds is None:
+        retention_seconds = config.STATUS_RETENTION_SECONDS
+    if max_records is None:
+        max_records = config.STATUS_MAX_RECORDS
+    conn = _db()
+    conn.execute(
+        "DELETE FROM upload_sessions WHERE updated_at < ?",
+        (time.time() - SESSION_RETENTION_SECONDS,),
+    )
+    expired = conn.execute(
+        "DELETE FROM upload_status WHERE updated_at < ?",
+        (time.time() - retention_seconds,),
+    ).rowcount
+    evicted = conn.execute(
+        "DELETE FROM upload_status WHERE rowid IN (SELECT rowid FROM upload_status "
+        "ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+        (max_records,),
+    ).rowcount
+    return expired + evicted
+
+
+def save_session(
+    destination: str, upload_id: str, fingerprint: str, resumable_uri: str, offset: int
+):
+    """
+    Records the resumable session of an upload in progress and the number
+    of bytes the server has confirmed.
+
+    Args:
+        destination (str): Where the file is being uploaded.
+        upload_id (str): The unique ID for the upload.
+        fingerprint (str): Identifies the file being uploaded, so a session
+            is never resumed with different content.
+        resumable_uri (str): The session URI returned by the server.
+        offset (int): Bytes committed by the server so far.
+    """
+    with metrics.STATUS_STORE_SECONDS.labels("save_session").time():
+        _db().execute(
+            "INSERT INTO upload_sessions (destination, upload_id, fingerprint, "
+            "resumable_uri, offset, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(destination, upload_id) DO UPDATE SET "
+            "fingerprint = excluded.fingerprint, resumable_uri = excluded.resumable_uri, "
+            "offset = excluded.offset, updated_at = excluded.updated_at",
+            (destination, upload_id, fingerprint, resumable_uri, offset, time.time()),
+        )
+
+
+def get_session(destination: str, upload_id: str) -> Optional[dict]:
+    """
+    Returns the saved resumable session of an upload, or None if there is none.
+    """
+    with metrics.STATUS_STORE_SECONDS.labels("get_session").time():
+        row = _db().execute(
+            "SELECT fingerprint, resumable_uri, offset, updated_at FROM upload_sessions "
+            "WHERE destination = ? AND upload_id = ?",
+            (destination, upload_id),
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+
+def delete_session(destination: str, upload_id: str):
+    """
+    Forgets the resumable session of an upload.
+    """
+    _db().execute(
+        "DELETE FROM upload_sessions WHERE destination = ? AND upload_id = ?",
+        (destination, upload_id),
+    )
+
+
+def list_sessions() -> list[dict]:
+    """
+    Returns the saved resumable sessions, oldest first.
+    """
+    rows = _db().execute(
+        "SELECT destination, upload_id, offset, updated_at FROM upload_sessions "
+        "ORDER BY updated_at"
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def migrate_json_file(destination: str, path: str) -> int:
+    """
+    Imports a legacy JSON status file ({upload_id: status}) and renames it
+    to "<path>.migrated" so it is only imported once. Records already in
+    the store are kept, and empty files are left in place.
+
+    Returns:
+        int: The number of records imported.
+    """
+    if not os.path.exists(path):
+        return 0
+
+    with open(path, "r") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError:
+            data = {}
+
+    if not data:
+        return 0
+
+    now = time.time()
+    conn = _db()
+    with transaction(conn):
+        for upload_id, status in data.items():
+            conn.execute(
+                "INSERT OR IGNORE INTO upload_status (destination, upload_id, video_id, "
+                "percent_complete, status, uploaded_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    destination,
+                    upload_id,
+                    json.dumps(status.get("video_id")),
+                    status.get("percent_complete", 0),
+                    status.get("status", "completed"),
+                    status.get("uploaded_at"),
+                    now,
+                ),
+            )
+
+    try:
+        os.replace(path, f"{path}.migrated")
+    except FileNotFoundError:
+        pass  # Another process migrated it at the same time
+    return len(data)
@@ -0,0 +1,295 @@
+import os
+import re
+import shutil
+import time
+from typing import Optional
+from app.core import jobs
+from app.core.config import config
+from app.core.db import connect
+
+# File classes
+INPUT = "input"  # Uploaded audio / video waiting to be merged
+OUTPUT = "output"  # Merged video
+PARTIAL = "partial"  # Merge output still being written, or its helper files
+
+# "merged_<uuid>.mp4" while a merge writes it, plus the files the merge
+# keeps next to it (".loop.mp4", segments, concat lists, encoded audio)
+PARTIAL_NAME = re.compile(r"merged_[0-9a-f-]{36}\.mp4(\..+)?")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    file_class TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    published_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_lru ON files (published_at, last_access);
+"""
+
+
+def _db():
+    return connect(config.STORAGE_DB_PATH, SCHEMA)
+
+
+def _key(path: str) -> str:
+    return os.path.abspath(path)
+
+
+def _ttl(file_class: str, published: bool) -> float:
+    if published:
+        return config.STORAGE_PUBLISHED_TTL
+    return {
+        INPUT: config.STORAGE_INPUT_TTL,
+        OUTPUT: config.STORAGE_OUTPUT_TTL,
+        PARTIAL: config.STORAGE_PARTIAL_TTL,
+    }[file_class]
+
+
+def classify(path: str) -> str:
+    """
+    Guesses the class of a temp file from its name.
+    """
+    name = os.path.basename(path)
+    if PARTIAL_NAME.fullmatch(name):
+        return PARTIAL
+    if name.startswith(("audio_", "video_")):
+        return INPUT
+    return OUTPUT
+
+
+def _held_bytes(stat_result: os.stat_result) -> int:
+    # A file hard-linked from the merge cache holds no space of its own:
+    # deleting it frees nothing, and the cache is bounded separately
+    return stat_result.st_size if stat_result.st_nlink <= 1 else 0
+
+
+def track(path: str, file_class: Optional[str] = None):
+    """
+    Starts (or refreshes) tracking a file created in the temp directory.
+
+    Args:
+        path (str): Path of the file.
+        file_class (str): INPUT, OUTPUT or PARTIAL. Guessed from the name
+            if omitted.
+    """
+    now = time.time()
+    try:
+        size = _held_bytes(os.stat(path))
+    except OSError:
+        return
+    _db().execute(
+        "INSERT INTO files (path, file_class, size, created_at, last_access) "
+        "VALUES (?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET "
+        "file_class = excluded.file_class, size = excluded.size, "
+        "last_access = excluded.last_access",
+        (_key(path), file_class or classify(path), size, now, now),
+    )
+
+
+def touch(path: str):
+    """
+    Records an access to a tracked file (e.g. a download).
+    """
+    _db().execute(
+        "UPDATE files SET last_access = ? WHERE path = ?", (time.time(), _key(path))
+    )
+
+
+def mark_published(path: str):
+    """
+    Records that a file was uploaded to its destination, so it becomes the
+    first to go when space runs short.
+    """
+    track(path)
+    _db().execute(
+        "UPDATE files SET published_at = ? WHERE path = ?", (time.time(), _key(path))
+    )
+
+
+def _busy_paths(states: tuple = (jobs.BLOCKED, jobs.QUEUED, jobs.RUNNING)) -> set:
+    # Files referenced by jobs that have not finished must stay
+    busy = set()
+    for payload in jobs.active_payloads(states):
+        for value in payload.values():
+            if isinstance(value, str):
+                busy.add(_key(value))
+    return busy
+
+
+def _is_busy(path: str, busy: set) -> bool:
+    # Merges name their helper files after the output they write
+    return path in busy or any(path.startswith(f"{prefix}.") for prefix in busy)
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Could not remove {path}: {e}")
+        return False
+    _db().execute("DELETE FROM files WHERE path = ?", (path,))
+    return True
+
+
+def _adopt_untracked(directory: str) -> int:
+    # Files created before tracking started, or by a crashed process
+    conn = _db()
+    tracked = {row["path"] for row in conn.execute("SELECT path FROM files")}
+    adopted = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            path = _key(entry.path)
+            if path in tracked or not entry.is_file(follow_symlinks=False):
+                continue
+            stat_result = entry.stat(follow_symlinks=False)
+            conn.execute(
+                "INSERT OR IGNORE INTO files (path, file_class, size, created_at, "
+                "last_access) VALUES (?, ?, ?, ?, ?)",
+                (
+                    path,
+                    classify(path),
+                    _held_bytes(stat_result),
+                    stat_result.st_mtime,
+                    stat_result.st_mtime,
+                ),
+            )
+            adopted += 1
+    return adopted
+
+
+def remove_orphans(directory: Optional[str] = None) -> int:
+    """
+    Deletes partial merge outputs and their helper files that no running
+    job is writing, e.g. left behind by a crashed ffmpeg run. Files changed
+    within STORAGE_ORPHAN_GRACE are kept, as merges that run outside the
+    job queue (streaming merges) or in other processes may still write
+    them. Meant for startup.
+
+    Returns:
+        int: The number of files removed.
+    """
+    directory = directory or config.STORAGE_TEMP_DIR
+    os.makedirs(directory, exist_ok=True)
+    running = _busy_paths((jobs.RUNNING,))
+    cutoff = time.time() - config.STORAGE_ORPHAN_GRACE
+
+    removed = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            path = _key(entry.path)
+            if (
+                entry.is_file(follow_symlinks=False)
+                and classify(path) == PARTIAL
+                and not _is_busy(path, running)
+                and entry.stat(follow_symlinks=False).st_mtime < cutoff
+                and _remove(path)
+            ):
+                removed += 1
+    if removed:
+        print(f"Removed {removed} orphaned partial output(s)")
+    return removed
+
+
+def sweep(directory: Optional[str] = None) -> dict:
+    """
+    Applies the retention rules to the temp directory:
+
+    - forgets tracked files that no longer exist, and refreshes the space
+      the others hold (a hard link stops sharing it once its merge cache
+      entry is evicted),
+    - deletes files not accessed within the TTL of their class (published
+      outputs have their own, shorter TTL),
+    - while usage exceeds STORAGE_QUOTA_BYTES, deletes published outputs
+      least recently accessed first.
+
+    Files referenced by unfinished jobs are never deleted.
+
+    Returns:
+        dict: Counts of the files expired and evicted, and bytes freed.
+    """
+    directory = directory or config.STORAGE_TEMP_DIR
+    os.makedirs(directory, exist_ok=True)
+    conn = _db()
+    _adopt_untracked(directory)
+    busy = _busy_paths()
+    now = time.time()
+    expired = evicted = freed = 0
+
+    rows = conn.execute(
+        "SELECT path, file_class, size, last_access, published_at FROM files"
+    ).fetchall()
+    for row in rows:
+        path = row["path"]
+        try:
+            size = _held_bytes(os.stat(path))
+        except FileNotFoundError:
+            conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            continue
+        if size != row["size"]:
+            conn.execute("UPDATE files SET size = ? WHERE path = ?", (size, path))
+        if _is_busy(path, busy):
+            continue
+        ttl = _ttl(row["file_class"], row["published_at"] is not None)
+        if now - row["last_access"] > ttl and _remove(path):
+            expired += 1
+            freed += size
+
+    used = conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+    if used > config.STORAGE_QUOTA_BYTES:
+        # Outputs sharing their space with the cache would free nothing
+        candidates = conn.execute(
+            "SELECT path, size FROM files WHERE published_at IS NOT NULL AND size > 0 "
+            "ORDER BY last_access"
+        ).fetchall()
+        for row in candidates:
+            if used <= config.STORAGE_QUOTA_BYTES:
+                break
+            if _is_busy(row["path"], busy):
+                continue
+            if _remove(row["path"]):
+                evicted += 1
+                freed += row["size"]
+                used -= row["size"]
+        if used > config.STORAGE_QUOTA_BYTES:
+            print(
+                f"Temp storage over quota ({used} > {config.STORAGE_QUOTA_BYTES} bytes) "
+                "with no published outputs left to evict"
+            )
+
+    if expired or evicted:
+        print(f"Storage sweep: {expired} expired, {evicted} evicted, {freed} bytes freed")
+    return {"expired": expired, "evicted": evicted, "freed_bytes": freed}
+
+
+def usage(directory: Optional[str] = None) -> dict:
+    """
+    Reports the space used by tracked temp files per class, against the
+    quota and the free space of the disk.
+    """
+    directory = directory or config.STORAGE_TEMP_DIR
+    rows = _db().execute(
+        "SELECT file_class, published_at IS NOT NULL AS published, COUNT(*) AS files, "
+        "COALESCE(SUM(size), 0) AS bytes FROM files GROUP BY file_class, published"
+    ).fetchall()
+
+    classes = {}
+    for row in rows:
+        name = row["file_class"] + ("_published" if row["published"] else "")
+        classes[name] = {"files": row["files"], "bytes": row["bytes"]}
+
+    disk = shutil.disk_usage(directory)
+    used = sum(entry["bytes"] for entry in classes.values())
+    return {
+        "used_bytes": used,
+        "quota_bytes": config.STORAGE_QUOTA_BYTES,
+        "quota_used": round(used / config.STORAGE_QUOTA_BYTES, 4)
+        if config.STORAGE_QUOTA_BYTES
+        else None,
+        "classes": classes,
+        "disk_total_bytes": disk.total,
+        "disk_free_bytes": disk.free,
+    }
@@ -0,0 +1,242 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.config import config
+
+# Spans of the request or job the current task is serving. Copied into
+# tasks and asyncio.to_thread calls started from it.
+_current = contextvars.ContextVar("timings", default=None)
+
+
+class Timings:
+    """
+    Named spans recorded while serving one request or job. Spans with the
+    same name (e.g. every upload chunk) are added up and counted.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            total, count = self.spans.get(name, (0.0, 0))
+            self.spans[name] = (total + seconds, count + 1)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                name: {"ms": round(total * 1000, 1), "count": count}
+                for name, (total, count) in self.spans.items()
+            }
+
+    def server_timing(self) -> str:
+        """
+        Formats the spans and the time so far as a Server-Timing header.
+        """
+        with self._lock:
+            entries = [
+                f'{name};dur={total * 1000:.1f};desc="x{count}"'
+                if count > 1
+                else f"{name};dur={total * 1000:.1f}"
+                for name, (total, count) in self.spans.items()
+            ]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Times the block as a span of the current request or job. Does nothing
+    outside of one.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def record(name: str, seconds: float):
+    """
+    Adds an already measured span to the current request or job, if any.
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def collect():
+    """
+    Collects the spans recorded in the block (and the tasks and threads it
+    starts).
+
+    Yields:
+        Timings: The recorded spans.
+    """
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def process_age() -> Optional[float]:
+    """
+    Returns the seconds since this process was started, or None where
+    /proc is not available.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces: split after its ")"
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    return max(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 0.0)
+
+
+def log_event(event: str, **fields):
+    """
+    Prints a structured (JSON) log line.
+    """
+    print(json.dumps({"event": event, "time": round(time.time(), 3), **fields}, default=str))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread at a fixed interval and counts them
+    as folded stacks ("thread;module:function:line;... count"), the input
+    format of flame graph tools such as speedscope or flamegraph.pl.
+
+    The event loop thread is shared by all requests being served, so its
+    samples include whatever else ran concurrently.
+    """
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval or config.PROFILE_INTERVAL
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, path: str):
+        """
+        Stops sampling and writes the folded stacks to `path`.
+        """
+        self._stop.set()
+        self._thread.join()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class TimingMiddleware:
+    """
+    Collects the spans of each HTTP request and reports them in a
+    Server-Timing response header and, for requests slower than
+    TIMING_LOG_MIN_SECONDS, a structured log line. Time spent waiting for
+    the request body is recorded as the "receive" span.
+
+    A request is profiled when PROFILE_REQUESTS is set, or when it carries
+    an "X-Profile" header and PROFILE_ALLOW_HEADER is set; the response
+    then names the profile in an "X-Profile-Id" header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiler = None
+        profile_id = None
+        if config.PROFILE_REQUESTS or (
+            config.PROFILE_ALLOW_HEADER and "x-profile" in Headers(scope=scope)
+        ):
+            profile_id = str(uuid.uuid4())
+            profiler = SamplingProfiler()
+            profiler.start()
+
+        status = 500
+        with collect() as timings:
+
+            async def timed_receive() -> Message:
+                started = time.perf_counter()
+                message = await receive()
+                if message["type"] == "http.request":
+                    timings.add("receive", time.perf_counter() - started)
+                return message
+
+            async def send_with_timing(message: Message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    headers = MutableHeaders(scope=message)
+                    headers.append("server-timing", timings.server_timing())
+                    if profile_id is not None:
+                        headers.append("x-profile-id", profile_id)
+                await send(message)
+
+            try:
+                await self.app(scope, timed_receive, send_with_timing)
+            finally:
+                if profiler is not None:
+                    profiler.stop(os.path.join(config.PROFILE_DIR, f"{profile_id}.folded"))
+                duration = timings.elapsed()
+                if duration >= config.TIMING_LOG_MIN_SECONDS or profile_id is not None:
+                    log_event(
+                        "request",
+                        method=scope["method"],
+                        path=scope["path"],
+                        route=getattr(scope.get("route"), "path", None),
+                        status=status,
+                        duration_ms=round(duration * 1000, 1),
+                        spans=timings.as_dict(),
+                        profile_id=profile_id,
+                    )
@@ -0,0 +1,245 @@
+import datetime
+import os
+import pickle
+import threading
+import time
+from app.core import timing
+from app.core.config import config
+
+
+class SharedCredentials:
+    """
+    Google credentials shared by every upload of this process that uses the
+    same identity, refreshed by one caller at a time.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.last_used = time.monotonic()
+        self._refresh_lock = threading.Lock()
+
+    def expires_soon(self) -> bool:
+        expiry = self.credentials.expiry
+        if expiry is None:
+            return False
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        margin = datetime.timedelta(seconds=config.GOOGLE_TOKEN_REFRESH_MARGIN)
+        return expiry - now < margin
+
+    def _needs_refresh(self) -> bool:
+        return not self.credentials.valid or self.expires_soon()
+
+    def ensure_fresh(self) -> bool:
+        """
+        Refreshes the access token if it is missing or about to expire.
+
+        Returns:
+            bool: Whether the token was refreshed.
+        """
+        if not self._needs_refresh():
+            return False
+        with self._refresh_lock:
+            # Another caller may have refreshed it while we waited
+            if not self._needs_refresh():
+                return False
+            self._refresh()
+        return True
+
+    def refresh_rejected(self, token: str) -> bool:
+        """
+        Refreshes the access token after an API rejected `token`, unless
+        another caller has replaced it since.
+
+        Returns:
+            bool: Whether the token was refreshed.
+        """
+        with self._refresh_lock:
+            if self.credentials.token != token:
+                return False
+            self._refresh()
+        return True
+
+    def authorized_http(self):
+        """
+        Returns an authorised httplib2 connection that refreshes the token
+        through these shared credentials.
+        """
+        import google_auth_httplib2
+        from googleapiclient.http import build_http
+
+        # build_http keeps 308 ("Resume Incomplete") from being followed as
+        # a redirect
+        return google_auth_httplib2.AuthorizedHttp(_TransportCredentials(self), http=build_http())
+
+    def _refresh(self):
+        from google.auth.transport.requests import Request
+
+        with timing.span("auth"):
+            self.credentials.refresh(Request())
+        self._refreshed()
+
+    def _refreshed(self):
+        pass
+
+
+class _TransportCredentials:
+    """
+    What an AuthorizedHttp sees as its credentials. It refreshes them by
+    itself, before a request and after a 401, so both go through the lock
+    of the SharedCredentials instead.
+    """
+
+    def __init__(self, shared: SharedCredentials):
+        self._shared = shared
+        self._token = None
+
+    def __getattr__(self, name):
+        return getattr(self._shared.credentials, name)
+
+    def before_request(self, request, method, url, headers):
+        self._shared.ensure_fresh()
+        self._token = self._shared.credentials.token
+        self._shared.credentials.apply(headers, token=self._token)
+
+    def refresh(self, request):
+        # Called when the API rejected the token of the last request
+        self._shared.refresh_rejected(self._token)
+
+
+def _write_atomically(path: str, credentials):
+    # Readers in other processes see the old file or the new one, never
+    # a partial write
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(credentials, f)
+    os.replace(tmp_path, path)
+
+
+def _identity(credentials) -> tuple:
+    return (
+        getattr(credentials, "client_id", None),
+        getattr(credentials, "refresh_token", None),
+    )
+
+
+class StoredCredentials(SharedCredentials):
+    """
+    OAuth credentials kept in a pickle file (e.g. those of an application's
+    YouTube channel), loaded once and shared by all of its uploads.
+
+    Refreshed tokens are written back to the file atomically. When the file
+    is replaced by another process, a refreshed token with the same
+    identity is taken over in place, while new credentials (the
+    application was authorised again) bump `generation` so clients built
+    on the old ones are replaced.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.generation = 0
+        self._mtime = None
+        self._load_lock = threading.Lock()
+        super().__init__(self._read())
+
+    def _read(self):
+        with timing.span("auth"), open(self.path, "rb") as f:
+            self._mtime = os.fstat(f.fileno()).st_mtime
+            return pickle.load(f)
+
+    def reload_if_changed(self):
+        """
+        Picks up the file if it changed since it was last read or written.
+        """
+        try:
+            mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._load_lock:
+            if os.path.getmtime(self.path) == self._mtime:
+                return
+            credentials = self._read()
+            if _identity(credentials) == _identity(self.credentials):
+                self.credentials.token = credentials.token
+                self.credentials.expiry = credentials.expiry
+            else:
+                self.credentials = credentials
+                self.generation += 1
+
+    def ensure_fresh(self) -> bool:
+        self.reload_if_changed()
+        return super().ensure_fresh()
+
+    def refresh_rejected(self, token: str) -> bool:
+        self.reload_if_changed()
+        return super().refresh_rejected(token)
+
+    def _refreshed(self):
+        with self._load_lock:
+            _write_atomically(self.path, self.credentials)
+            self._mtime = os.path.getmtime(self.path)
+
+
+# Stored credentials of this process, keyed by file path
+_stored = {}
+_stored_lock = threading.Lock()
+_refresher = None
+
+
+def _refresh_stored():
+    # Keeps the tokens of recently used credentials valid so uploads never
+    # wait for a refresh; idle ones are left to refresh on their next use
+    while True:
+        time.sleep(config.GOOGLE_TOKEN_REFRESH_INTERVAL)
+        with _stored_lock:
+            stores = list(_stored.values())
+        for stored in stores:
+            if time.monotonic() - stored.last_used > config.GOOGLE_CLIENT_TTL:
+                continue
+            try:
+                stored.ensure_fresh()
+            except Exception as e:
+                print(f"Token refresh failed for {stored.path}: {e}")
+
+
+def get_stored_credentials(path: str) -> StoredCredentials:
+    """
+    Returns the shared credentials stored in `path`, loading them on first
+    use and starting the background refresh of this process.
+
+    Args:
+        path (str): Path of the pickled credentials.
+
+    Returns:
+        StoredCredentials: The credentials, reloaded if the file changed.
+    """
+    global _refresher
+    with _stored_lock:
+        stored = _stored.get(path)
+        if stored is None:
+            stored = _stored[path] = StoredCredentials(path)
+        if _refresher is None:
+            _refresher = threading.Thread(
+                target=_refresh_stored, name="token-refresh", daemon=True
+            )
+            _refresher.start()
+    stored.reload_if_changed()
+    stored.last_used = time.monotonic()
+    return stored
+
+
+def save_credentials(path: str, credentials):
+    """
+    Stores newly authorised credentials atomically, replacing the ones this
+    process had loaded from `path`.
+    """
+    _write_atomically(path, credentials)
+    with _stored_lock:
+        stored = _stored.get(path)
+    if stored is not None:
+        stored.reload_if_changed()
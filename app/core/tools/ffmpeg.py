@@ -1,19 +1,377 @@
-import subprocess
+import asyncio
+import contextlib
+import json
+import os
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterable, Callable, Optional, Union
+from cachetools import LRUCache
+from app.core import metrics, timing
+from app.core.config import config
 
+try:
+    import fcntl
+except ImportError:  # Windows: slots are only limited per process
+    fcntl = None
 
-async def run_ffmpeg_command(command: list[str]) -> str:
+# Longest partial stderr line kept while waiting for a line break
+MAX_STDERR_LINE = 4096
+
+_semaphore = None
+
+# ffprobe results keyed by file content hash
+_probe_cache = LRUCache(maxsize=config.PROBE_CACHE_SIZE)
+
+
+class FFmpegError(Exception):
+    """
+    Raised when an ffmpeg command exits with a non-zero status.
+    """
+
+    def __init__(self, returncode: int, stderr: str):
+        self.returncode = returncode
+        self.stderr = stderr
+        super().__init__(f"ffmpeg exited with code {returncode}: {stderr}")
+
+
+class FFmpegTimeoutError(FFmpegError):
+    """
+    Raised when an ffmpeg command runs longer than its timeout.
+    """
+
+    def __init__(self, timeout: float, stderr: str):
+        self.timeout = timeout
+        self.returncode = None
+        self.stderr = stderr
+        Exception.__init__(self, f"ffmpeg timed out after {timeout} seconds: {stderr}")
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(config.FFMPEG_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def _try_lock_slot() -> Optional[int]:
+    # Slot files are locked with flock, which the OS releases when the
+    # holding process dies, so crashed workers never leak slots
+    os.makedirs(config.FFMPEG_SLOTS_DIR, exist_ok=True)
+    for index in range(config.FFMPEG_MAX_CONCURRENCY):
+        fd = os.open(
+            os.path.join(config.FFMPEG_SLOTS_DIR, f"slot_{index}.lock"),
+            os.O_RDWR | os.O_CREAT,
+        )
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+    return None
+
+
+@asynccontextmanager
+async def ffmpeg_slot():
+    """
+    Holds one of the FFMPEG_MAX_CONCURRENCY ffmpeg slots shared by every
+    process (API and job workers) using FFMPEG_SLOTS_DIR, waiting for a
+    free one. Callers that run several connected processes as one unit
+    take a slot for the group (see `acquire_slot`).
+    """
+    # Waiters of this process queue on the semaphore rather than polling
+    async with _get_semaphore():
+        if fcntl is None:
+            yield
+            return
+        fd = _try_lock_slot()
+        while fd is None:
+            await asyncio.sleep(config.FFMPEG_SLOT_POLL_INTERVAL)
+            fd = _try_lock_slot()
+        try:
+            yield
+        finally:
+            os.close(fd)
+
+
+async def _feed_stdin(writer: asyncio.StreamWriter, chunks: AsyncIterable[bytes]):
+    try:
+        async for chunk in chunks:
+            writer.write(chunk)
+            await writer.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # ffmpeg stopped reading; its exit status tells why
+    finally:
+        try:
+            writer.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+async def _drain_stderr(stream: asyncio.StreamReader, lines: deque):
+    # ffmpeg separates its status updates with "\r", so split on both
+    # line endings ourselves instead of relying on readline()
+    pending = b""
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            break
+        parts = re.split(rb"[\r\n]", pending + chunk)
+        pending = parts.pop()[-MAX_STDERR_LINE:]
+        for line in parts:
+            if line:
+                lines.append(line.decode(errors="replace"))
+    if pending:
+        lines.append(pending.decode(errors="replace"))
+
+
+async def _read_progress(stream: asyncio.StreamReader, on_progress: Callable[[dict], None]) -> bytes:
+    # "-progress pipe:1" writes key=value lines in blocks ending with
+    # "progress=continue" (or "progress=end" for the last one)
+    block = {}
+    async for raw_line in stream:
+        line = raw_line.decode(errors="replace").strip()
+        key, sep, value = line.partition("=")
+        if not sep:
+            continue
+        block[key] = value
+        if key == "progress":
+            on_progress(block)
+            block = {}
+    return b""
+
+
+async def _kill(process: asyncio.subprocess.Process):
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+def _record_run(exit_code: str, seconds: float):
+    if exit_code == "0":
+        result = "ok"
+    elif exit_code in ("timeout", "killed"):
+        result = exit_code
+    else:
+        result = "error"
+    metrics.FFMPEG_EXITS.labels(exit_code).inc()
+    metrics.FFMPEG_RUN_SECONDS.labels(result).observe(seconds)
+
+
+async def run_ffmpeg_command(
+    command: list[str],
+    timeout: Optional[float] = None,
+    on_progress: Optional[Callable[[dict], None]] = None,
+    stdin: Union[int, AsyncIterable[bytes], None] = None,
+    stdout: Optional[int] = None,
+    acquire_slot: bool = True,
+) -> str:
     """
     Runs the ffmpeg command and returns the output.
 
+    The number of ffmpeg processes running at once, across all processes
+    of the app, is limited by the FFMPEG_MAX_CONCURRENCY setting; extra
+    commands wait for a free slot (see `ffmpeg_slot`).
+    Only the last FFMPEG_STDERR_LINES lines of stderr are kept. The child
+    process is killed if the command times out or the caller is cancelled.
+
     Args:
         command (list[str]): The ffmpeg command to run.
+        timeout (float): Maximum run time in seconds. Defaults to the
+            FFMPEG_TIMEOUT setting (0 disables the timeout).
+        on_progress (Callable[[dict], None]): Optional callback receiving each
+            block of key/value pairs written by "-progress pipe:1". The
+            command must include that option when a callback is given.
+        stdin (int | AsyncIterable[bytes]): Optional input for "pipe:0":
+            chunks to write to ffmpeg as they arrive, or a file descriptor
+            (e.g. the read end of a pipe from another ffmpeg).
+        stdout (int): Optional file descriptor to send ffmpeg's output to
+            instead of returning it. Descriptors passed as stdin or stdout
+            stay owned by the caller, which must close them.
+        acquire_slot (bool): Whether to take an FFMPEG_MAX_CONCURRENCY slot.
+            Pass False when the caller already holds one for a group of
+            connected processes, which could otherwise deadlock.
 
     Returns:
         str: The output of the ffmpeg command.
+
+    Raises:
+        FFmpegError: If ffmpeg exits with a non-zero status.
+        FFmpegTimeoutError: If ffmpeg runs longer than the timeout.
+    """
+    if timeout is None:
+        timeout = config.FFMPEG_TIMEOUT
+
+    stderr_lines = deque(maxlen=config.FFMPEG_STDERR_LINES)
+    feed = stdin if stdin is not None and not isinstance(stdin, int) else None
+
+    slot = ffmpeg_slot() if acquire_slot else contextlib.nullcontext()
+    wait_started = time.monotonic()
+    async with slot:
+        timing.record("ffmpeg_wait", time.monotonic() - wait_started)
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=(
+                asyncio.subprocess.PIPE
+                if feed is not None
+                else stdin if stdin is not None else asyncio.subprocess.DEVNULL
+            ),
+            stdout=stdout if stdout is not None else asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        tasks = [process.wait()]
+        if stdout is not None:
+            stdout_task = None
+        elif on_progress is None:
+            stdout_task = asyncio.create_task(process.stdout.read())
+        else:
+            stdout_task = asyncio.create_task(_read_progress(process.stdout, on_progress))
+        if stdout_task is not None:
+            tasks.append(stdout_task)
+        tasks.append(asyncio.create_task(_drain_stderr(process.stderr, stderr_lines)))
+        if feed is not None:
+            tasks.append(asyncio.create_task(_feed_stdin(process.stdin, feed)))
+
+        gathered = asyncio.gather(*tasks)
+        started = time.monotonic()
+        exit_code = "killed"
+        metrics.FFMPEG_ACTIVE.inc()
+        try:
+            await asyncio.wait_for(gathered, timeout=timeout or None)
+            exit_code = str(process.returncode)
+        except asyncio.TimeoutError:
+            exit_code = "timeout"
+            await _kill(process)
+            raise FFmpegTimeoutError(timeout, "\n".join(stderr_lines))
+        except BaseException:
+            # Cancelled by the caller, or the input failed: don't leave the
+            # child process behind
+            await _kill(process)
+            gathered.cancel()
+            await asyncio.gather(gathered, return_exceptions=True)
+            raise
+        finally:
+            metrics.FFMPEG_ACTIVE.dec()
+            _record_run(exit_code, time.monotonic() - started)
+            timing.record("ffmpeg", time.monotonic() - started)
+
+    if process.returncode != 0:
+        raise FFmpegError(process.returncode, "\n".join(stderr_lines))
+
+    if stdout_task is None:
+        return ""
+    return stdout_task.result().decode(errors="replace")
+
+
+async def probe_media(path: str) -> dict:
     """
+    Reads the container and stream information of a media file with ffprobe.
 
+    Args:
+        path (str): Path of the media file.
+
+    Returns:
+        dict: The parsed ffprobe JSON output ("format" and "streams").
+
+    Raises:
+        FFmpegError: If ffprobe cannot read the file.
+    """
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe",
+        "-v",
+        "error",
+        "-print_format",
+        "json",
+        "-show_format",
+        "-show_streams",
+        path,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
     try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        return f"Error: {e.stderr}"
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(), timeout=config.FFPROBE_TIMEOUT
+        )
+    except BaseException:
+        await _kill(process)
+        raise
+
+    if process.returncode != 0:
+        raise FFmpegError(process.returncode, stderr.decode(errors="replace"))
+
+    return json.loads(stdout)
+
+
+async def inspect_media(path: str, sha256: Optional[str] = None) -> dict:
+    """
+    Returns the ffprobe information of a media file, reusing earlier
+    results for the same content.
+
+    Args:
+        path (str): Path of the media file.
+        sha256 (str): Content hash of the file if known. Without it the
+            result is cached by path, size and modification time.
+
+    Returns:
+        dict: The parsed ffprobe JSON output ("format" and "streams").
+    """
+    if sha256 is None:
+        stat_result = await asyncio.to_thread(os.stat, path)
+        key = f"{path}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+    else:
+        key = sha256
+
+    media_info = _probe_cache.get(key)
+    if media_info is None:
+        with timing.span("probe"):
+            media_info = await probe_media(path)
+        _probe_cache[key] = media_info
+    return media_info
+
+
+def get_stream(media_info: dict, codec_type: str) -> Optional[dict]:
+    """
+    Returns the first stream of a type ("audio" or "video") from ffprobe
+    output, or None if there is none.
+    """
+    for stream in media_info.get("streams", []):
+        if stream.get("codec_type") == codec_type:
+            return stream
+    return None
+
+
+def get_duration(media_info: dict) -> Optional[float]:
+    """
+    Returns the duration in seconds from ffprobe output, or None if unknown.
+    """
+    duration = media_info.get("format", {}).get("duration")
+    if duration in (None, "N/A"):
+        durations = [
+            float(stream["duration"])
+            for stream in media_info.get("streams", [])
+            if stream.get("duration") not in (None, "N/A")
+        ]
+        return max(durations) if durations else None
+    return float(duration)
+
+
+def parse_progress_time(progress: dict) -> Optional[float]:
+    """
+    Returns the output position in seconds from a "-progress" block.
+    """
+    out_time_us = progress.get("out_time_us")
+    if out_time_us not in (None, "N/A"):
+        return max(int(out_time_us), 0) / 1_000_000
+
+    out_time = progress.get("out_time")
+    if out_time and out_time != "N/A":
+        hours, minutes, seconds = out_time.lstrip("-").split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    return None
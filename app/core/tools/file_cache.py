@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Optional
+from app.core.db import connect, transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def make_key(*parts) -> str:
+    """
+    Builds a cache key from JSON-serialisable parts (content hashes,
+    argument lists, ...).
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def _link_or_copy(source: str, destination: str):
+    # Hard links make cache stores and hits instant and free on disk;
+    # fall back to a copy across filesystems
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class FileCache:
+    """
+    A content-addressed file cache bounded by total size.
+
+    Entries are tracked in a SQLite index next to the files so several
+    processes can share the cache; the least recently used entries are
+    evicted once the cache grows past `max_bytes`. Hit and miss counts are
+    kept in the index as well.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.index_path = os.path.join(directory, "index.db")
+
+    def _db(self):
+        return connect(self.index_path, SCHEMA)
+
+    def _count(self, conn, name: str):
+        conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the path of a cached file and marks it as recently used,
+        or None on a miss.
+        """
+        conn = self._db()
+        with transaction(conn):
+            row = conn.execute(
+                "SELECT path FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and not os.path.exists(row["path"]):
+                # Removed behind our back
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self._count(conn, "misses")
+                return None
+
+            conn.execute(
+                "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                (time.time(), key),
+            )
+            self._count(conn, "hits")
+        return row["path"]
+
+    def get_into(self, key: str, destination: str) -> bool:
+        """
+        Places a cached file at `destination` (hard link when possible).
+
+        Returns:
+            bool: True on a hit, False on a miss.
+        """
+        path = self.get(key)
+        if path is None:
+            return False
+        try:
+            _link_or_copy(path, destination)
+        except FileNotFoundError:
+            # Evicted between the lookup and the link
+            return False
+        return True
+
+    def put(self, key: str, source: str) -> str:
+        """
+        Adds a file to the cache (hard link when possible) and evicts least
+        recently used entries if the cache is over its size limit.
+
+        Returns:
+            str: The path of the cached file.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}{self.suffix}")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        _link_or_copy(source, tmp_path)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        conn = self._db()
+        with transaction(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, path, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, path, os.path.getsize(path), now, now),
+            )
+
+        self.evict()
+        return path
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """
+        Removes least recently used entries until the cache fits.
+
+        Returns:
+            int: The number of bytes freed.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+
+        conn = self._db()
+        freed = 0
+        with transaction(conn):
+            total = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+            if total <= max_bytes:
+                return 0
+
+            for row in conn.execute(
+                "SELECT key, path, size FROM entries ORDER BY last_access"
+            ).fetchall():
+                if total - freed <= max_bytes:
+                    break
+                if os.path.exists(row["path"]):
+                    os.remove(row["path"])
+                conn.execute("DELETE FROM entries WHERE key = ?", (row["key"],))
+                freed += row["size"]
+                self._count(conn, "evictions")
+        return freed
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss/eviction counts and current usage.
+        """
+        conn = self._db()
+        counters = {
+            row["name"]: row["value"]
+            for row in conn.execute("SELECT name, value FROM stats").fetchall()
+        }
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,182 @@
+import os
+import stat
+from email.utils import parsedate_to_datetime
+from secrets import token_hex
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+from app.core.config import config
+
+# ASGI extensions that let the server send file data without copying it
+# through Python (sendfile)
+ZEROCOPY_SEND = "http.response.zerocopysend"
+PATH_SEND = "http.response.pathsend"
+
+# Headers kept on 304 responses
+NOT_MODIFIED_HEADERS = ("etag", "last-modified", "cache-control", "content-location")
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    """
+    Returns a strong ETag for a file: its inode, modification time (ns) and
+    size, which change whenever the file is rewritten or replaced. Derived
+    from the file alone, so every process serves the same tag.
+    """
+    return (
+        f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    )
+
+
+def _etag_matches(etag: str, header: str) -> bool:
+    # If-None-Match uses the weak comparison
+    if header.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in header.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class MediaFileResponse(FileResponse):
+    """
+    A FileResponse for large media downloads.
+
+    On top of Starlette's Range / multi-range / If-Range handling it sends
+    a strong ETag, answers If-None-Match and If-Modified-Since with 304,
+    reads in larger chunks, and hands the file to the server for a
+    zero-copy send (sendfile) when the server supports the ASGI
+    "zerocopysend" or "pathsend" extension.
+    """
+
+    chunk_size = config.FILE_SEND_CHUNK_SIZE
+
+    def __init__(self, path: str, **kwargs):
+        self._extensions = {}
+        kwargs.setdefault("headers", {"cache-control": "no-cache"})
+        super().__init__(path, **kwargs)
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        self.headers.setdefault("etag", make_etag(stat_result))
+        super().set_stat_headers(stat_result)
+
+    def _not_modified(self, request_headers: Headers, stat_result: os.stat_result) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return _etag_matches(self.headers["etag"], if_none_match)
+
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(stat_result.st_mtime) <= since
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.stat_result is None:
+            try:
+                self.stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            except FileNotFoundError:
+                raise RuntimeError(f"File at path {self.path} does not exist.")
+            if not stat.S_ISREG(self.stat_result.st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            self.set_stat_headers(self.stat_result)
+
+        if self._not_modified(Headers(scope=scope), self.stat_result):
+            headers = [
+                (name, value)
+                for name, value in self.raw_headers
+                if name.decode("latin-1") in NOT_MODIFIED_HEADERS
+            ]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        self._extensions = scope.get("extensions") or {}
+        await super().__call__(scope, receive, send)
+
+    async def _send_file(self, send: Send, file, start: int, count: int, more_body: bool):
+        # Sends part of an open file, zero-copy when the server allows it
+        if ZEROCOPY_SEND in self._extensions:
+            await send(
+                {
+                    "type": ZEROCOPY_SEND,
+                    "file": file,
+                    "offset": start,
+                    "count": count,
+                    "more_body": more_body,
+                }
+            )
+            return
+
+        await anyio.to_thread.run_sync(file.seek, start)
+        end = start + count
+        while start < end:
+            chunk = await anyio.to_thread.run_sync(
+                file.read, min(self.chunk_size, end - start)
+            )
+            if not chunk:
+                break  # Truncated while sending
+            start += len(chunk)
+            last = start >= end and not more_body
+            await send({"type": "http.response.body", "body": chunk, "more_body": not last})
+            if last:
+                return
+
+        if not more_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif PATH_SEND in self._extensions:
+            await send({"type": PATH_SEND, "path": os.path.abspath(self.path)})
+        else:
+            with open(self.path, "rb") as file:
+                await self._send_file(send, file, 0, self.stat_result.st_size, False)
+
+    async def _handle_single_range(
+        self, send: Send, start: int, end: int, file_size: int, send_header_only: bool
+    ) -> None:
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            with open(self.path, "rb") as file:
+                await self._send_file(send, file, start, end - start, False)
+
+    async def _handle_multiple_ranges(
+        self,
+        send: Send,
+        ranges: list[tuple[int, int]],
+        file_size: int,
+        send_header_only: bool,
+    ) -> None:
+        boundary = token_hex(13)
+        content_length, header_generator = self.generate_multipart(
+            ranges, boundary, file_size, self.headers["content-type"]
+        )
+        # The parts are described by the multipart content type (RFC 9110 §14.6)
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(content_length)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        with open(self.path, "rb") as file:
+            for start, end in ranges:
+                await send({"type": "http.response.body", "body": header_generator(start, end), "more_body": True})
+                await self._send_file(send, file, start, end - start, True)
+                await send({"type": "http.response.body", "body": b"\n", "more_body": True})
+        # Each part already ends with a newline, as counted by generate_multipart
+        await send(
+            {
+                "type": "http.response.body",
+                "body": f"--{boundary}--\n".encode("latin-1"),
+                "more_body": False,
+            }
+        )
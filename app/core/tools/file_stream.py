@@ -0,0 +1,323 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+from cachetools import LRUCache
+from fastapi import UploadFile
+from app.core import timing
+from app.core.config import config
+
+# Digests of files written or hashed by this process, keyed by path
+file_digests = LRUCache(maxsize=config.FILE_DIGEST_CACHE_SIZE)
+
+
+class FileTooLargeError(Exception):
+    """
+    Raised when a streamed payload exceeds the allowed size.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"File exceeds the maximum allowed size of {max_bytes} bytes")
+
+
+def _write_chunk(out_file, digest, chunk: bytes):
+    # hashlib releases the GIL for large buffers, so hashing and writing
+    # both happen in the worker thread rather than on the event loop
+    digest.update(chunk)
+    out_file.write(chunk)
+
+
+def _discard(out_file, destination: str):
+    out_file.close()
+    if os.path.exists(destination):
+        os.remove(destination)
+
+
+def _remember_digest(path: str, sha256: str, size: int) -> dict:
+    record = {
+        "sha256": sha256,
+        "size": size,
+        "mtime": os.path.getmtime(path),
+    }
+    file_digests[path] = record
+    return record
+
+
+async def upload_file_chunks(
+    upload_file: UploadFile, chunk_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """
+    Yields the content of an uploaded file in fixed-size chunks.
+
+    Args:
+        upload_file (UploadFile): The uploaded file to read.
+        chunk_size (int): Number of bytes to read per chunk.
+
+    Yields:
+        bytes: The next chunk of the file.
+    """
+    chunk_size = chunk_size or config.UPLOAD_READ_CHUNK_SIZE
+    while True:
+        chunk = await upload_file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def limit_chunks(
+    chunks: AsyncIterator[bytes], max_bytes: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """
+    Passes chunks through, raising FileTooLargeError once more than
+    `max_bytes` have gone by (None for no limit).
+    """
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise FileTooLargeError(max_bytes)
+        yield chunk
+
+
+async def write_stream(
+    chunks: AsyncIterator[bytes],
+    destination: str,
+    max_bytes: Optional[int] = None,
+) -> dict:
+    """
+    Writes a stream of chunks to disk without buffering the whole payload.
+
+    File I/O runs in a worker thread, and the SHA-256 digest and byte count
+    are computed as the chunks pass through. A partially written file is
+    removed if the stream fails or exceeds the size limit.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The chunks to write.
+        destination (str): Path of the file to create.
+        max_bytes (int): Maximum number of bytes to accept (None for no limit).
+
+    Returns:
+        dict: The "sha256" digest and "size" of the written file.
+    """
+    digest = hashlib.sha256()
+    size = 0
+
+    with timing.span("save"):
+        out_file = await asyncio.to_thread(open, destination, "wb")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise FileTooLargeError(max_bytes)
+                await asyncio.to_thread(_write_chunk, out_file, digest, chunk)
+        except BaseException:
+            await asyncio.to_thread(_discard, out_file, destination)
+            raise
+
+        await asyncio.to_thread(out_file.close)
+    return _remember_digest(destination, digest.hexdigest(), size)
+
+
+async def save_upload_file(
+    upload_file: UploadFile,
+    destination: str,
+    max_bytes: Optional[int] = None,
+) -> dict:
+    """
+    Streams an uploaded file to disk in bounded chunks.
+
+    Args:
+        upload_file (UploadFile): The uploaded file.
+        destination (str): Path of the file to create.
+        max_bytes (int): Maximum number of bytes to accept. Defaults to
+            the UPLOAD_MAX_BYTES setting.
+
+    Returns:
+        dict: The "sha256" digest and "size" of the saved file.
+    """
+    if max_bytes is None:
+        max_bytes = config.UPLOAD_MAX_BYTES
+
+    # The multipart parser has already counted the spooled bytes
+    if upload_file.size is not None and upload_file.size > max_bytes:
+        raise FileTooLargeError(max_bytes)
+
+    try:
+        return await write_stream(upload_file_chunks(upload_file), destination, max_bytes)
+    finally:
+        await upload_file.close()
+
+
+def _hash_file(path: str, chunk_size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def peek_file_digest(path: str) -> Optional[str]:
+    """
+    Returns the SHA-256 digest of a file if this process already knows it
+    and the file has not changed since, without reading the file.
+    """
+    record = file_digests.get(path)
+    if record is None:
+        return None
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if record["size"] != stat_result.st_size or record["mtime"] != stat_result.st_mtime:
+        return None
+    return record["sha256"]
+
+
+async def get_file_digest(path: str) -> dict:
+    """
+    Returns the SHA-256 digest and size of a file.
+
+    The digest recorded when the file was streamed to disk is reused as long
+    as the file has not changed since; otherwise the file is hashed in a
+    worker thread and the result is remembered.
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        dict: The "sha256" digest and "size" of the file.
+    """
+    stat_result = await asyncio.to_thread(os.stat, path)
+    record = file_digests.get(path)
+    if (
+        record is not None
+        and record["size"] == stat_result.st_size
+        and record["mtime"] == stat_result.st_mtime
+    ):
+        return record
+
+    sha256 = await asyncio.to_thread(_hash_file, path, config.UPLOAD_READ_CHUNK_SIZE)
+    return _remember_digest(path, sha256, stat_result.st_size)
+
+
+class SharedFileReader:
+    """
+    Serves one file to several concurrent readers from a shared buffer.
+
+    The file is read ahead in large blocks that are kept in a bounded LRU
+    buffer, so readers moving through the file at a similar pace (e.g. the
+    uploads of one publish) share a single pass over the disk. A reader
+    that falls too far behind reads its blocks from disk again.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        block_size: Optional[int] = None,
+        read_ahead: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.block_size = block_size or config.PUBLISH_READ_BLOCK_SIZE
+        self.read_ahead = max(1, read_ahead or config.PUBLISH_READ_AHEAD_BLOCKS)
+        self.max_blocks = max(
+            self.read_ahead, (max_bytes or config.PUBLISH_BUFFER_BYTES) // self.block_size
+        )
+        self.disk_reads = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, index: int):
+        # Read the missing block and the ones after it in one sequential read
+        with open(self.path, "rb") as f:
+            f.seek(index * self.block_size)
+            data = f.read(self.block_size * self.read_ahead)
+        self.disk_reads += 1
+        for offset in range(0, len(data), self.block_size):
+            self._blocks[index + offset // self.block_size] = data[
+                offset : offset + self.block_size
+            ]
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+
+    def block(self, index: int) -> bytes:
+        """
+        Returns a block of the file, reading it (and the following ones)
+        from disk if it is not buffered.
+        """
+        with self._lock:
+            data = self._blocks.get(index)
+            if data is None:
+                self._load(index)
+                data = self._blocks[index]
+            self._blocks.move_to_end(index)
+            return data
+
+    def read(self, offset: int, size: int) -> bytes:
+        """
+        Reads up to `size` bytes starting at `offset`.
+        """
+        size = max(0, min(size, self.size - offset))
+        parts = []
+        while size > 0:
+            index, start = divmod(offset, self.block_size)
+            part = self.block(index)[start : start + size]
+            if not part:
+                break
+            parts.append(part)
+            offset += len(part)
+            size -= len(part)
+        return b"".join(parts)
+
+    def open(self) -> "SharedFileStream":
+        """
+        Returns a new seekable stream over the file with its own position.
+        """
+        return SharedFileStream(self)
+
+
+class SharedFileStream(io.RawIOBase):
+    """
+    A read-only, seekable file object backed by a SharedFileReader.
+    """
+
+    def __init__(self, reader: SharedFileReader):
+        super().__init__()
+        self._reader = reader
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._reader.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._position = offset
+        return offset
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._reader.size - self._position
+        data = self._reader.read(self._position, size)
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
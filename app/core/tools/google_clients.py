@@ -0,0 +1,147 @@
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from cachetools import TTLCache
+from app.core import timing
+from app.core.config import config
+from app.core.tools.credentials import SharedCredentials, get_stored_credentials
+
+# The Google client libraries are imported on first use rather than at
+# startup: they are slow to import and most requests never need them
+
+# Built clients keyed by credential identity
+_clients = TTLCache(maxsize=config.GOOGLE_CLIENT_CACHE_SIZE, ttl=config.GOOGLE_CLIENT_TTL)
+_clients_lock = threading.Lock()
+
+
+class GoogleClient:
+    """
+    An authenticated Google API client shared by consecutive uploads.
+
+    The discovery document is processed once when the client is built, the
+    access token is refreshed ahead of expiry, and authorised HTTP
+    connections are pooled so uploads reuse warm connections. httplib2
+    connections are not thread-safe, so each upload checks one out for its
+    own use.
+    """
+
+    def __init__(self, service, shared: SharedCredentials):
+        self.service = service
+        self.shared = shared
+        self._idle_http = []
+        self._lock = threading.Lock()
+
+    @property
+    def credentials(self):
+        return self.shared.credentials
+
+    def ensure_fresh(self):
+        """
+        Refreshes the access token if it is missing or about to expire.
+        """
+        self.shared.ensure_fresh()
+
+    @contextmanager
+    def http(self):
+        """
+        Checks out an authorised HTTP connection for one upload.
+        """
+        with self._lock:
+            http = self._idle_http.pop() if self._idle_http else None
+        if http is None:
+            http = self.shared.authorized_http()
+        try:
+            yield http
+        finally:
+            with self._lock:
+                if len(self._idle_http) < config.GOOGLE_HTTP_POOL_SIZE:
+                    self._idle_http.append(http)
+
+
+def _client_options():
+    if config.GOOGLE_API_ENDPOINT:
+        return {"api_endpoint": config.GOOGLE_API_ENDPOINT}
+    return None
+
+
+def _build_service(api: str, shared: SharedCredentials):
+    from googleapiclient.discovery import build
+
+    # The v3 discovery documents of Drive and YouTube are packaged with
+    # the client library, so building a client never fetches them
+    with timing.span("build"):
+        return build(
+            api,
+            "v3",
+            http=shared.authorized_http(),
+            cache_discovery=False,
+            static_discovery=True,
+            client_options=_client_options(),
+        )
+
+
+def _get_or_build(key: str, factory) -> GoogleClient:
+    with _clients_lock:
+        client = _clients.get(key)
+    if client is None:
+        client = factory()
+        with _clients_lock:
+            # Keep the first client if two uploads built one at once
+            client = _clients.setdefault(key, client)
+    client.ensure_fresh()
+    return client
+
+
+def get_drive_client(service_account_data: str, scopes: list) -> GoogleClient:
+    """
+    Returns a Drive v3 client for a service account, reusing a cached one
+    built for the same identity.
+
+    Args:
+        service_account_data (str): The service account JSON.
+        scopes (list): OAuth scopes to request.
+
+    Returns:
+        GoogleClient: A client with a fresh access token.
+    """
+    info = json.loads(service_account_data)
+    identity = json.dumps(
+        [info.get("client_email"), info.get("private_key_id"), sorted(scopes)]
+    )
+    key = "drive:" + hashlib.sha256(identity.encode()).hexdigest()
+
+    def factory():
+        from google.oauth2 import service_account
+
+        with timing.span("auth"):
+            credentials = service_account.Credentials.from_service_account_info(
+                info, scopes=scopes
+            )
+        shared = SharedCredentials(credentials)
+        return GoogleClient(_build_service("drive", shared), shared)
+
+    return _get_or_build(key, factory)
+
+
+def get_youtube_client(application: str, credentials_file: str) -> GoogleClient:
+    """
+    Returns a YouTube v3 client for an application's stored OAuth
+    credentials, reusing a cached one until the application is authorised
+    again. All clients of the application share one credentials object,
+    kept fresh in the background.
+
+    Args:
+        application (str): The application the credentials belong to.
+        credentials_file (str): Path of the pickled credentials.
+
+    Returns:
+        GoogleClient: A client with a fresh access token.
+    """
+    stored = get_stored_credentials(credentials_file)
+    key = f"youtube:{application}:{stored.generation}"
+
+    def factory():
+        return GoogleClient(_build_service("youtube", stored), stored)
+
+    return _get_or_build(key, factory)
@@ -1,17 +1,21 @@
 import os
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google.oauth2 import service_account
-import json
-from googleapiclient.http import MediaIoBaseUpload
-
-# Global or external dictionary to store progress
-upload_progress = {}
-
-CHUNK_SIZE = 256 * 1024
-
-
-async def upload_file(file_name, file_path, folder_id, service_account_data, upload_id):
+import asyncio
+from app.core.tools.google_clients import get_drive_client
+from app.core.tools.resumable import ChunkSizer, UploadSession, upload_chunks
+
+# Key of the resumable sessions of Drive uploads
+SESSION_DESTINATION = "google_drive"
+
+
+async def upload_file(
+    file_name,
+    file_path,
+    folder_id,
+    service_account_data,
+    upload_id,
+    on_progress=None,
+    stream=None,
+):
     """
     Uploads a file to a specific Google Drive folder using a service account JSON (dict).
 
@@ -19,53 +23,48 @@ async def upload_file(file_name, file_path, folder_id, service_account_data, upl
         file_path (str): Local path to the video file.
         folder_id (str): ID of the target Google Drive folder.
         service_account_data (dict): Parsed JSON content of the service account.
+        on_progress (Callable[[int, float], None]): Optional callback receiving
+            the percentage uploaded and the measured throughput in bytes per
+            second after each chunk.
+        stream (BinaryIO): Optional seekable stream of the file's content to
+            upload instead of opening `file_path`.
 
     Returns:
         str: The file ID of the uploaded file on Google Drive.
     """
 
-    SCOPES = ["https://www.googleapis.com/auth/drive.file"]
-
-    service_account_json = json.loads(service_account_data)
+    from googleapiclient.http import MediaIoBaseUpload
 
-    # Load credentials from dict (not file)
-    creds = service_account.Credentials.from_service_account_info(
-        service_account_json, scopes=SCOPES
-    )
+    SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 
-    service = build("drive", "v3", credentials=creds)
+    # Reuse the client (and token) of earlier uploads with this service account
+    client = await asyncio.to_thread(get_drive_client, service_account_data, SCOPES)
+    service = client.service
 
     file_metadata = {
         "name": file_name,
         "parents": [folder_id],
     }
 
-    media = MediaFileUpload(file_path, mimetype="video/mp4", resumable=True)
+    print(f"Starting upload: {file_name}...")
 
-    request = service.files().create(body=file_metadata, media_body=media, fields="id")
+    sizer = ChunkSizer()
+    session = UploadSession(SESSION_DESTINATION, upload_id, file_path)
 
-    print(f"Starting upload: {file_name}...")
-    response = None
-    upload_progress[upload_id] = 0
+    def report(progress, sizer):
+        if on_progress:
+            on_progress(progress, sizer.throughput_bps)
 
-    with open(file_path, "rb") as f:
+    with stream or open(file_path, "rb") as f, client.http() as http:
         media = MediaIoBaseUpload(
-            f, mimetype="video/mp4", chunksize=CHUNK_SIZE, resumable=True
+            f, mimetype="video/mp4", chunksize=sizer.size, resumable=True
         )
         request = service.files().create(
             body=file_metadata, media_body=media, fields="id"
         )
 
-        response = None
-        upload_progress[upload_id] = 0
-
-        while response is None:
-            status, response = request.next_chunk()
-            if status:
-                progress = int(status.progress() * 100)
-                upload_progress[upload_id] = progress
+        response = await upload_chunks(request, http, report, sizer, session)
 
     print(f"Upload complete! File ID: {response.get('id')}")
-    upload_progress[upload_id] = 100  # Ensure final update
 
     return response.get("id")
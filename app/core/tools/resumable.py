@@ -0,0 +1,248 @@
+import asyncio
+import os
+import time
+from typing import Callable, Optional
+from app.core import metrics, status_store, timing
+from app.core.config import config
+
+# Google resumable uploads require chunk sizes in multiples of 256 KiB
+CHUNK_GRANULARITY = 256 * 1024
+
+# Server responses worth retrying a chunk for
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Server responses for a session that no longer exists
+EXPIRED_STATUSES = {404, 410}
+
+
+def _round_chunk_size(size: int) -> int:
+    return max(CHUNK_GRANULARITY, size // CHUNK_GRANULARITY * CHUNK_GRANULARITY)
+
+
+class ChunkSizer:
+    """
+    Picks the chunk size of a resumable upload.
+
+    With adaptive sizing the upload starts at the configured chunk size and
+    doubles it while the measured throughput keeps improving, up to
+    UPLOAD_MAX_CHUNK_SIZE; after an error the size is halved and allowed to
+    grow again. Without it the configured size is used throughout.
+    """
+
+    def __init__(
+        self,
+        initial: Optional[int] = None,
+        maximum: Optional[int] = None,
+        adaptive: Optional[bool] = None,
+    ):
+        self.size = _round_chunk_size(initial or config.UPLOAD_CHUNK_SIZE)
+        self.maximum = _round_chunk_size(maximum or config.UPLOAD_MAX_CHUNK_SIZE)
+        self.adaptive = config.UPLOAD_ADAPTIVE_CHUNKS if adaptive is None else adaptive
+        self.bytes_sent = 0
+        self.seconds = 0.0
+        self._best_throughput = 0.0
+        self._growing = True
+
+    @property
+    def throughput_bps(self) -> Optional[float]:
+        """
+        Average upload throughput so far in bytes per second.
+        """
+        if self.seconds <= 0:
+            return None
+        return self.bytes_sent / self.seconds
+
+    def record(self, nbytes: int, seconds: float):
+        """
+        Records a successfully sent chunk and adjusts the chunk size.
+        """
+        if nbytes <= 0 or seconds <= 0:
+            return
+        self.bytes_sent += nbytes
+        self.seconds += seconds
+
+        # Only full chunks say something about the current size
+        if not self.adaptive or nbytes < self.size:
+            return
+
+        throughput = nbytes / seconds
+        if throughput > self._best_throughput * 1.1:
+            self._best_throughput = throughput
+            if self._growing and self.size < self.maximum:
+                self.size = min(self.size * 2, self.maximum)
+        else:
+            # Bigger chunks stopped paying off
+            self._growing = False
+
+    def record_error(self):
+        """
+        Shrinks the chunk size after a failed chunk.
+        """
+        if self.adaptive:
+            self.size = _round_chunk_size(self.size // 2)
+            self._best_throughput = 0.0
+            self._growing = True
+
+
+class UploadSession:
+    """
+    Persists the resumable session of one upload so that it can continue
+    from the last byte the server committed after a restart, instead of
+    sending the whole file again.
+
+    Sessions are keyed by destination and upload ID, and only resumed for
+    the same file (path, size and modification time).
+    """
+
+    def __init__(self, destination: str, upload_id: str, file_path: str):
+        stat = os.stat(file_path)
+        self.destination = destination
+        self.upload_id = upload_id
+        self.fingerprint = (
+            f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        )
+        self._saved = None
+
+    def restore(self, request) -> bool:
+        """
+        Points the request at the saved session, if there is one. The next
+        chunk then asks the server how much it has and continues from there.
+
+        Returns:
+            bool: True if a session was restored.
+        """
+        saved = status_store.get_session(self.destination, self.upload_id)
+        if saved is None or saved["fingerprint"] != self.fingerprint:
+            return False
+
+        request.resumable_uri = saved["resumable_uri"]
+        request.resumable_progress = saved["offset"]
+        request._in_error_state = True
+        self._saved = (saved["resumable_uri"], saved["offset"])
+        print(f"Resuming upload {self.upload_id} from byte {saved['offset']}")
+        return True
+
+    def save(self, request):
+        """
+        Records the request's session URI and confirmed offset if they changed.
+        """
+        if request.resumable_uri is None:
+            return
+        state = (request.resumable_uri, request.resumable_progress)
+        if state != self._saved:
+            status_store.save_session(
+                self.destination, self.upload_id, self.fingerprint, *state
+            )
+            self._saved = state
+
+    def clear(self):
+        status_store.delete_session(self.destination, self.upload_id)
+        self._saved = None
+
+
+def _restart(request):
+    request.resumable_uri = None
+    request.resumable_progress = 0
+    request._in_error_state = False
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Tells whether a Google API call failed in a way another try may not
+    (a connection or other I/O error, or a server-side HTTP status).
+    """
+    import httplib2
+    from googleapiclient.errors import HttpError
+
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES
+    return isinstance(error, (httplib2.HttpLib2Error, OSError))
+
+
+async def upload_chunks(
+    request,
+    http,
+    on_progress: Optional[Callable[[int, ChunkSizer], None]] = None,
+    sizer: Optional[ChunkSizer] = None,
+    session: Optional[UploadSession] = None,
+) -> dict:
+    """
+    Sends a resumable upload request chunk by chunk until it completes.
+
+    Chunk requests run in a worker thread. Failed chunks are retried with
+    exponential backoff (UPLOAD_MAX_RETRIES times in a row at most); the
+    client library then asks the server how much it received and resumes
+    from there. With a session, the same happens across process restarts.
+
+    Args:
+        request (HttpRequest): A request created with a resumable media body.
+        http: The authorised HTTP connection to send the chunks on.
+        on_progress (Callable[[int, ChunkSizer], None]): Optional callback
+            receiving the percentage uploaded and the chunk sizer (for its
+            throughput) after each chunk.
+        sizer (ChunkSizer): Chunk size policy. Defaults to the configured one.
+        session (UploadSession): Optional store for the session URI and
+            offset, restored before the first chunk and cleared on completion.
+
+    Returns:
+        dict: The API response of the completed upload.
+    """
+    from googleapiclient.errors import HttpError
+
+    sizer = sizer or ChunkSizer()
+    media = request.resumable
+    response = None
+    retries = 0
+    resumed = False
+
+    if session is not None:
+        resumed = await asyncio.to_thread(session.restore, request)
+
+    while response is None:
+        # The client library reads the chunk size before every chunk
+        media._chunksize = sizer.size
+        sent_before = request.resumable_progress
+        started = time.monotonic()
+        try:
+            with timing.span("upload_chunk"):
+                status, response = await asyncio.to_thread(request.next_chunk, http=http)
+        except Exception as e:
+            if (
+                resumed
+                and isinstance(e, HttpError)
+                and e.resp.status in EXPIRED_STATUSES
+            ):
+                # The saved session is gone, start over
+                print(f"Upload session of {session.upload_id} expired, restarting upload")
+                resumed = False
+                _restart(request)
+                await asyncio.to_thread(session.clear)
+                continue
+            if not is_retryable(e) or retries >= config.UPLOAD_MAX_RETRIES:
+                raise
+            retries += 1
+            sizer.record_error()
+            if request.resumable_uri is not None:
+                # Ask the server what it received before sending more
+                request._in_error_state = True
+            await asyncio.sleep(min(2**retries, 60))
+            continue
+
+        retries = 0
+        resumed = False
+        if session is not None:
+            if response is None:
+                await asyncio.to_thread(session.save, request)
+            else:
+                await asyncio.to_thread(session.clear)
+        sent = (media.size() if response is not None else request.resumable_progress) - sent_before
+        sizer.record(sent, time.monotonic() - started)
+        # Less than zero when the server kept less than was sent before a retry
+        metrics.UPLOAD_BYTES.labels(session.destination if session else "unknown").inc(
+            max(sent, 0)
+        )
+
+        if status and on_progress:
+            on_progress(int(status.progress() * 100), sizer)
+
+    return response
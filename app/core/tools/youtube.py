@@ -1,26 +1,27 @@
+import asyncio
+from cachetools import TTLCache
 from fastapi import Request
 from fastapi.responses import JSONResponse
-from google_auth_oauthlib.flow import Flow
 import os
 import json
-import pickle
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+from app.core.config import config
+from app.core.tools.credentials import save_credentials
+from app.core.tools.google_clients import get_youtube_client
+from app.core.tools.resumable import ChunkSizer, UploadSession, upload_chunks
 
-auth_flows = {}
+# Pending authorisations keyed by OAuth state; abandoned ones expire
+auth_flows = TTLCache(maxsize=config.OAUTH_STATE_CACHE_SIZE, ttl=config.OAUTH_STATE_TTL)
 
-# Global or external dictionary to store progress
-upload_progress = {}
-
-CHUNK_SIZE = 256 * 1024
+# Key of the resumable sessions of YouTube uploads
+SESSION_DESTINATION = "youtube"
 
 
 def authorize(application: str, CLIENT_SECRETS: str, SCOPES: list, REDIRECT_URI: str):
     """
     Start the OAuth flow and return the authorization URL.
     """
-    
+    from google_auth_oauthlib.flow import Flow
+
     secrets_dir = f"app/api/v1/{application}/video_generation/storage/secrets"
     os.makedirs(secrets_dir, exist_ok=True)
 
@@ -68,19 +69,20 @@ async def oauth2callback(application: str, request: Request):
     state = request.query_params.get("state")
     code = request.query_params.get("code")
 
-    if not state or state not in auth_flows:
+    # Remove flow from memory once used
+    flow = auth_flows.pop(state, None) if state else None
+    if flow is None:
         return JSONResponse(
             status_code=400,
             content={"status": "error", "message": "Invalid state or session expired."},
         )
 
-    flow = auth_flows.pop(state)  # Remove flow from memory once used
     try:
         flow.fetch_token(code=code)
         creds = flow.credentials
 
-        with open(CREDENTIALS_PICKLE_FILE, "wb") as token:
-            pickle.dump(creds, token)
+        # Replaces the credentials uploads of this process are using, too
+        save_credentials(CREDENTIALS_PICKLE_FILE, creds)
 
         return JSONResponse(
             status_code=200,
@@ -101,7 +103,9 @@ async def upload_file(
     tags: str,
     category_id: str,
     privacy_status: str,
-    upload_id: str
+    upload_id: str,
+    on_progress=None,
+    stream=None,
 ):
     """
     Uploads a video to YouTube using the YouTube Data API.
@@ -113,10 +117,18 @@ async def upload_file(
         tags (str): Comma-separated tags for the video.
         category_id (str): The category ID for the video.
         privacy_status (str): The privacy status of the video ("public", "private", "unlisted").
+        on_progress (Callable[[int, float], None]): Optional callback receiving
+            the percentage uploaded and the measured throughput in bytes per
+            second after each chunk.
+        stream (BinaryIO): Optional seekable stream of the file's content to
+            upload instead of opening `file_path`.
 
     Returns:
         dict: A dictionary containing the upload status and video ID.
     """
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+
     CREDENTIALS_DIR = f"app/api/v1/{application}/video_generation/storage/credentials"
     CREDENTIALS_PICKLE_FILE = os.path.join(
         CREDENTIALS_DIR, f"{application}_google_credentials.pickle"
@@ -129,10 +141,11 @@ async def upload_file(
         }
 
     try:
-        with open(CREDENTIALS_PICKLE_FILE, "rb") as token:
-            creds = pickle.load(token)
-
-        youtube = build("youtube", "v3", credentials=creds)
+        # Reuse the client (and token) of earlier uploads for this application
+        client = await asyncio.to_thread(
+            get_youtube_client, application, CREDENTIALS_PICKLE_FILE
+        )
+        youtube = client.service
 
         body = {
             "snippet": {
@@ -146,7 +159,14 @@ async def upload_file(
             }
         }
 
-        media = MediaFileUpload(file_path, chunksize=CHUNK_SIZE, resumable=True)
+        sizer = ChunkSizer()
+        session = UploadSession(SESSION_DESTINATION, upload_id, file_path)
+        if stream is not None:
+            media = MediaIoBaseUpload(
+                stream, mimetype="video/mp4", chunksize=sizer.size, resumable=True
+            )
+        else:
+            media = MediaFileUpload(file_path, chunksize=sizer.size, resumable=True)
 
         request = youtube.videos().insert(
             part="snippet,status",
@@ -154,17 +174,14 @@ async def upload_file(
             media_body=media
         )
 
-        response = None
-        upload_progress[upload_id] = 0
-        
-        while response is None:
-            status, response = request.next_chunk()
-            if status:
-                progress = int(status.progress() * 100)
-                upload_progress[upload_id] = progress
+        def report(progress, sizer):
+            if on_progress:
+                on_progress(progress, sizer.throughput_bps)
+
+        with client.http() as http:
+            response = await upload_chunks(request, http, report, sizer, session)
                 
         print(f"Upload complete! File ID: {response.get('id')}")
-        upload_progress[upload_id] = 100  # Ensure final update
 
         return response.get("id")
 
@@ -0,0 +1,327 @@
+import argparse
+import asyncio
+import importlib
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import traceback
+from app.core import jobs, metrics, status_store, timing
+from app.core.config import config
+from app.core.tools import resumable
+from app.core.tools.ffmpeg import FFmpegError, FFmpegTimeoutError
+
+try:
+    import fcntl
+except ImportError:  # Windows: every web process runs its own pool
+    fcntl = None
+
+# Worker processes started by this process
+_pool = []
+
+# Descriptor of the pool lock while this process holds it
+_pool_lock_fd = None
+
+
+def _load_handler(path: str):
+    module_name, qualname = path.split(":", 1)
+    handler = importlib.import_module(module_name)
+    for attr in qualname.split("."):
+        handler = getattr(handler, attr)
+    return handler
+
+
+def _is_transient(error: BaseException) -> bool:
+    # Only failures another attempt may not hit are retried: a corrupt or
+    # unsupported input, a missing file or a rejected request fails the
+    # same way every time. Crashed workers are retried via their lease.
+    if isinstance(error, FFmpegError):
+        return isinstance(error, FFmpegTimeoutError)
+    if isinstance(
+        error, (FileNotFoundError, IsADirectoryError, NotADirectoryError, PermissionError)
+    ):
+        return False
+    if isinstance(error, TimeoutError) or resumable.is_retryable(error):
+        return True
+    # e.g. the summary of a publish whose uploads failed
+    return error.__cause__ is not None and _is_transient(error.__cause__)
+
+
+async def _keep_lease(job_id: str):
+    while True:
+        await asyncio.sleep(config.JOB_LEASE_SECONDS / 3)
+        await asyncio.to_thread(jobs.heartbeat, job_id)
+
+
+async def _run_job(job: dict):
+    token = jobs.current_job_id.set(job["id"])
+    lease = asyncio.create_task(_keep_lease(job["id"]))
+    state = "released"
+    with timing.collect() as timings:
+        try:
+            handler = _load_handler(job["handler"])
+            if asyncio.iscoroutinefunction(handler):
+                result = await handler(**job["payload"])
+            else:
+                result = await asyncio.to_thread(handler, **job["payload"])
+        except asyncio.CancelledError:
+            # Worker is shutting down: let another worker pick the job up
+            await asyncio.to_thread(jobs.release, job["id"])
+            raise
+        except Exception as e:
+            retry = _is_transient(e)
+            print(f"Job {job['id']} ({job['kind']}) failed{'' if retry else ' permanently'}")
+            state = jobs.FAILED
+            await asyncio.to_thread(jobs.fail, job["id"], traceback.format_exc(), retry)
+        else:
+            state = jobs.COMPLETED
+            await asyncio.to_thread(jobs.complete, job["id"], result)
+        finally:
+            lease.cancel()
+            jobs.current_job_id.reset(token)
+            timing.log_event(
+                "job",
+                job_id=job["id"],
+                kind=job["kind"],
+                state=state,
+                duration_ms=round(timings.elapsed() * 1000, 1),
+                spans=timings.as_dict(),
+            )
+
+
+async def run_worker(worker_id: str, concurrency: int):
+    """
+    Claims and runs jobs until cancelled.
+
+    Up to `concurrency` jobs run at once on this process's event loop;
+    blocking handlers are moved to a thread. Jobs of crashed workers are
+    re-queued once their lease expires.
+
+    Args:
+        worker_id (str): ID recorded on the jobs this worker claims.
+        concurrency (int): Maximum number of jobs to run at once.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    last_maintenance = 0.0
+
+    def _finished(task: asyncio.Task):
+        running.discard(task)
+        slots.release()
+
+    try:
+        while True:
+            await slots.acquire()
+            job = await asyncio.to_thread(jobs.claim_next, worker_id)
+            if job is None:
+                slots.release()
+                if time.time() - last_maintenance > config.JOB_LEASE_SECONDS:
+                    await asyncio.to_thread(jobs.recover_expired)
+                    await asyncio.to_thread(jobs.prune)
+                    await asyncio.to_thread(status_store.prune)
+                    last_maintenance = time.time()
+                await asyncio.sleep(config.JOB_POLL_INTERVAL)
+                continue
+
+            task = asyncio.create_task(_run_job(job))
+            running.add(task)
+            task.add_done_callback(_finished)
+    finally:
+        for task in list(running):
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+def worker_main(worker_id: str, concurrency: int):
+    """
+    Entry point of a worker process.
+    """
+
+    parent = os.getppid()
+
+    async def _watch_parent(task: asyncio.Task):
+        # A killed web process leaves its workers behind; they stop so the
+        # process taking over the pool does not run them twice
+        while os.getppid() == parent:
+            await asyncio.sleep(config.JOB_POLL_INTERVAL)
+        task.cancel()
+
+    async def _main():
+        task = asyncio.create_task(run_worker(worker_id, concurrency))
+        watcher = asyncio.create_task(_watch_parent(task))
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, task.cancel)
+            except NotImplementedError:
+                pass  # Not supported on Windows
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            watcher.cancel()
+
+    print(f"Worker {worker_id} started (pid {os.getpid()})")
+    asyncio.run(_main())
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists but belongs to another user
+    return True
+
+
+def recover_orphaned_jobs() -> int:
+    """
+    Re-queues jobs left running by workers of an earlier instance on this
+    host, without waiting for their lease to expire. Interrupted uploads
+    then continue from their saved resumable session.
+
+    Must run before this process starts its own workers: a job claimed by
+    a worker ID carrying this process's PID (reused after a container
+    restart) is treated as orphaned too.
+
+    Returns:
+        int: The number of jobs re-queued.
+    """
+    host = socket.gethostname()
+    recovered = 0
+    for job in jobs.list_jobs(jobs.RUNNING, limit=10000):
+        worker = job["worker"] or ""
+        if not worker.startswith(f"{host}-"):
+            continue
+        try:
+            pid = int(worker[len(host) + 1 :].split("-")[0])
+        except ValueError:
+            continue
+        if pid == os.getpid() or not _process_alive(pid):
+            jobs.release(job["id"])
+            recovered += 1
+
+    if recovered:
+        print(f"Re-queued {recovered} job(s) interrupted by a restart")
+    return recovered
+
+
+def claim_worker_pool() -> bool:
+    """
+    Takes the lock of the app's worker pool, so that of several web
+    processes (uvicorn --workers, gunicorn) only one starts the JOB_WORKERS
+    workers. The OS releases it if the holder dies, and another process can
+    claim it then.
+
+    Returns:
+        bool: Whether this process holds the lock.
+    """
+    global _pool_lock_fd
+    if _pool_lock_fd is not None or fcntl is None:
+        return True
+    directory = os.path.dirname(config.JOB_POOL_LOCK_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd = os.open(config.JOB_POOL_LOCK_PATH, os.O_RDWR | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    _pool_lock_fd = fd
+    return True
+
+
+def _pool_claimed_elsewhere() -> bool:
+    # A shared lock is refused while another process holds the pool lock
+    if fcntl is None or not os.path.exists(config.JOB_POOL_LOCK_PATH):
+        return False
+    fd = os.open(config.JOB_POOL_LOCK_PATH, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def start_worker_pool(workers: int = None, concurrency: int = None) -> list:
+    """
+    Starts worker processes that consume the job queue.
+
+    Workers only share the job database, so more can be started at any time
+    (here or with `python -m app.core.worker`) to increase throughput.
+
+    Args:
+        workers (int): Number of processes. Defaults to JOB_WORKERS.
+        concurrency (int): Jobs per process. Defaults to JOB_WORKER_CONCURRENCY.
+
+    Returns:
+        list: The started processes.
+    """
+    workers = config.JOB_WORKERS if workers is None else workers
+    concurrency = concurrency or config.JOB_WORKER_CONCURRENCY
+
+    context = multiprocessing.get_context("spawn")
+    for index in range(workers):
+        worker_id = f"{socket.gethostname()}-{os.getpid()}-{index}"
+        process = context.Process(
+            target=worker_main, args=(worker_id, concurrency), daemon=True
+        )
+        process.start()
+        _pool.append(process)
+    return list(_pool)
+
+
+def stop_worker_pool(timeout: float = 10):
+    """
+    Stops the worker processes started by start_worker_pool and releases
+    the pool lock. Jobs they were running go back to the queue.
+    """
+    global _pool_lock_fd
+    for process in _pool:
+        if process.is_alive():
+            process.terminate()
+    for process in _pool:
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        metrics.mark_process_dead(process.pid)
+    _pool.clear()
+    if _pool_lock_fd is not None:
+        os.close(_pool_lock_fd)
+        _pool_lock_fd = None
+
+
+def pool_status() -> dict:
+    """
+    Reports how many of the worker processes started here are running, and
+    whether another web process runs the pool instead.
+    """
+    return {
+        "configured": config.JOB_WORKERS,
+        "alive": sum(1 for process in _pool if process.is_alive()),
+        "elsewhere": _pool_lock_fd is None and _pool_claimed_elsewhere(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run job queue workers.")
+    parser.add_argument("--workers", type=int, default=config.JOB_WORKERS or 1)
+    parser.add_argument(
+        "--concurrency", type=int, default=config.JOB_WORKER_CONCURRENCY
+    )
+    args = parser.parse_args()
+
+    recover_orphaned_jobs()
+    processes = start_worker_pool(args.workers, args.concurrency)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop_worker_pool()
@@ -1,11 +1,95 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from app.api.v1.main import v1_router
+import time
+
+# Taken before the other imports so that importing the app is timed
+_import_started = time.perf_counter()
+
+import asyncio  # noqa: E402
+from contextlib import asynccontextmanager  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from app.api.v1.main import v1_router  # noqa: E402
+from app.core import jobs, metrics, storage, timing  # noqa: E402
+from app.core.config import config  # noqa: E402
+from app.core.worker import (  # noqa: E402
+    claim_worker_pool,
+    recover_orphaned_jobs,
+    start_worker_pool,
+    stop_worker_pool,
+)
+from app.api.v1.tuneezy.video_generation.utils.video_generation import (  # noqa: E402
+    migrate_status_files,
+)
+
+# Time from the start of the process to the import of the app
+_process_age_at_import = timing.process_age()
+if _process_age_at_import is not None:
+    _process_age_at_import -= time.perf_counter() - _import_started
+
+
+async def sweep_storage():
+    # Runs in a thread between sleeps so requests are never held up
+    while True:
+        try:
+            await asyncio.to_thread(storage.sweep)
+        except Exception as e:
+            print(f"Storage sweep failed: {e}")
+        await asyncio.sleep(config.STORAGE_SWEEP_INTERVAL)
+
+
+async def run_worker_pool():
+    # One web process runs the workers; the others wait to take over if it
+    # exits, so JOB_WORKERS is the total whatever the number of web workers
+    if config.JOB_WORKERS <= 0:
+        return
+    while not claim_worker_pool():
+        await asyncio.sleep(config.JOB_LEASE_SECONDS)
+    start_worker_pool()
+
+
+def record_startup(lifespan_seconds: float):
+    """
+    Logs how long this process took to become ready and exports it as
+    the app_startup_seconds metric.
+    """
+    phases = {
+        "import": _import_seconds,
+        "lifespan": lifespan_seconds,
+    }
+    if _process_age_at_import is not None:
+        phases["process"] = _process_age_at_import
+        phases["total"] = _process_age_at_import + _import_seconds + lifespan_seconds
+    for phase, seconds in phases.items():
+        metrics.STARTUP_SECONDS.labels(phase).set(seconds)
+    timing.log_event(
+        "startup",
+        **{f"{phase}_ms": round(seconds * 1000, 1) for phase, seconds in phases.items()},
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lifespan_started = time.perf_counter()
+    migrate_status_files()
+    metrics.remove_dead_processes()
+
+    # Re-queue jobs left running by a previous instance, then start workers
+    recover_orphaned_jobs()
+    jobs.recover_expired()
+    storage.remove_orphans()
+    pool = asyncio.create_task(run_worker_pool())
+    sweeper = asyncio.create_task(sweep_storage())
+    record_startup(time.perf_counter() - lifespan_started)
+    yield
+    sweeper.cancel()
+    pool.cancel()
+    stop_worker_pool()
+
 
 app = FastAPI(
     title="Work Automation API Collection",
     description="API for Automating Your Works",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Allow CORS (Cross-Origin Resource Sharing) for docs to work
@@ -17,5 +101,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency per route, for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Named spans per request in a Server-Timing header, optional profiling
+if config.TIMING_ENABLED:
+    app.add_middleware(timing.TimingMiddleware)
+
 # Include routers
 app.include_router(v1_router)
+
+_import_seconds = time.perf_counter() - _import_started
@@ -0,0 +1,255 @@
+import json
+import pickle
+import os
+import re
+import ssl
+import subprocess
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+# Resumable upload endpoints, and the resource each one creates
+UPLOAD_PATHS = {
+    "/upload/drive/v3/files": "drive",
+    "/upload/youtube/v3/videos": "youtube",
+}
+SESSION_PATH = re.compile(r"^/upload/sessions/([0-9a-f-]+)$")
+CONTENT_RANGE = re.compile(r"^bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$")
+
+
+class UploadSession:
+    """
+    A resumable upload in progress: only the byte count is kept, the
+    content itself is discarded.
+    """
+
+    def __init__(self, api: str, metadata: dict, total: Optional[int]):
+        self.api = api
+        self.metadata = metadata
+        self.total = total
+        self.received = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self.resource_id = None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeGoogleServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: Optional[dict] = None, headers: Optional[dict] = None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        self.server.delay()
+        url = urlparse(self.path)
+        body = self._read_body()
+
+        if url.path == "/token":
+            # Both the service account (JWT bearer) and the refresh token grants
+            self.server.token_requests += 1
+            self._send(
+                200,
+                {"access_token": f"fake-{uuid.uuid4()}", "expires_in": 3600, "token_type": "Bearer"},
+            )
+            return
+
+        api = UPLOAD_PATHS.get(url.path)
+        if api is None or parse_qs(url.query).get("uploadType") != ["resumable"]:
+            self._send(404, {"error": {"code": 404, "message": f"Unknown path {url.path}"}})
+            return
+
+        total = self.headers.get("X-Upload-Content-Length")
+        session_id = str(uuid.uuid4())
+        with self.server.lock:
+            self.server.sessions[session_id] = UploadSession(
+                api, json.loads(body or b"{}"), int(total) if total else None
+            )
+        self._send(200, headers={"Location": f"{self.server.url}upload/sessions/{session_id}"})
+
+    def do_PUT(self):
+        self.server.delay()
+        match = SESSION_PATH.match(urlparse(self.path).path)
+        session = match and self.server.sessions.get(match.group(1))
+        body = self._read_body()
+        if session is None:
+            self._send(404, {"error": {"code": 404, "message": "Upload session not found"}})
+            return
+
+        content_range = CONTENT_RANGE.match(self.headers.get("Content-Range", ""))
+        if content_range is None:
+            self._send(400, {"error": {"code": 400, "message": "Bad Content-Range"}})
+            return
+        first, _, total = content_range.groups()
+        if total != "*":
+            session.total = int(total)
+
+        if first is not None:
+            if int(first) != session.received:
+                # Out of order: tell the client where to resume from
+                self._send_progress(session)
+                return
+            session.received += len(body)
+            self.server.bytes_received += len(body)
+
+        if session.total is not None and session.received >= session.total:
+            if session.resource_id is None:
+                session.resource_id = uuid.uuid4().hex[:16]
+                session.finished = time.monotonic()
+                self.server.completed.append(session)
+            self._send(200, self._resource(session))
+        else:
+            self._send_progress(session)
+
+    def _send_progress(self, session: UploadSession):
+        headers = {"Range": f"bytes=0-{session.received - 1}"} if session.received else {}
+        self._send(308, headers=headers)
+
+    def _resource(self, session: UploadSession) -> dict:
+        if session.api == "youtube":
+            return {"kind": "youtube#video", "id": session.resource_id, **session.metadata}
+        return {"kind": "drive#file", "id": session.resource_id, **session.metadata}
+
+
+class FakeGoogleServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the OAuth token endpoint and the resumable upload
+    endpoints of Drive v3 and YouTube v3, speaking the protocol of
+    googleapiclient's MediaUpload (session initiation, chunked PUTs with
+    Content-Range, 308 "Resume Incomplete" replies and status queries).
+
+    googleapiclient only swaps the host of upload URLs for the one of the
+    API endpoint, keeping https, so the server speaks TLS when given a
+    certificate (see make_certificate). Point the API at it with
+    GOOGLE_API_ENDPOINT=`url`, HTTPLIB2_CA_CERTS and REQUESTS_CA_BUNDLE set
+    to the certificate, and credentials whose token URI is `token_uri`.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        certificate: Optional[tuple] = None,
+    ):
+        super().__init__((host, port), _Handler)
+        self.scheme = "http"
+        if certificate is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*certificate)
+            # Handshake in the handler threads rather than in accept()
+            self.socket = context.wrap_socket(
+                self.socket, server_side=True, do_handshake_on_connect=False
+            )
+            self.scheme = "https"
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.completed = []
+        self.token_requests = 0
+        self.bytes_received = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"{self.scheme}://{host}:{port}/"
+
+    @property
+    def token_uri(self) -> str:
+        return self.url + "token"
+
+    def delay(self):
+        # Simulated round trip to Google
+        if self.latency:
+            time.sleep(self.latency)
+
+    def start(self) -> "FakeGoogleServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-google", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def make_certificate(directory: str, host: str = "127.0.0.1") -> tuple:
+    """
+    Creates a self-signed certificate for `host` with the openssl CLI.
+
+    Returns:
+        tuple: The paths of the certificate and of its private key.
+    """
+    certfile = os.path.join(directory, "fake_google.crt")
+    keyfile = os.path.join(directory, "fake_google.key")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", keyfile, "-out", certfile, "-days", "1",
+            "-subj", f"/CN={host}", "-addext", f"subjectAltName=IP:{host}",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def service_account_data(token_uri: str) -> str:
+    """
+    Returns the JSON of a service account with a freshly generated key
+    whose tokens are issued by `token_uri`.
+    """
+    import rsa
+
+    _, private_key = rsa.newkeys(2048)
+    return json.dumps(
+        {
+            "type": "service_account",
+            "project_id": "benchmarks",
+            "private_key_id": uuid.uuid4().hex,
+            "private_key": private_key.save_pkcs1().decode(),
+            "client_email": "benchmarks@benchmarks.iam.gserviceaccount.com",
+            "client_id": "1",
+            "token_uri": token_uri,
+        }
+    )
+
+
+def write_youtube_credentials(path: str, token_uri: str):
+    """
+    Pickles OAuth credentials like the ones stored by the YouTube auth flow,
+    without an access token so the first upload refreshes it at `token_uri`.
+    """
+    from google.oauth2.credentials import Credentials
+
+    credentials = Credentials(
+        token=None,
+        refresh_token="fake-refresh-token",
+        token_uri=token_uri,
+        client_id="benchmarks",
+        client_secret="benchmarks",
+        scopes=["https://www.googleapis.com/auth/youtube.upload"],
+    )
+    with open(path, "wb") as f:
+        pickle.dump(credentials, f)
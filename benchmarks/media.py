@@ -0,0 +1,57 @@
+import os
+import subprocess
+
+
+def _ffmpeg(*args: str):
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args],
+        check=True,
+    )
+
+
+def generate_audio(path: str, seconds: float) -> str:
+    """
+    Writes an MP3 tone (lavfi sine source) of the given length, unless the
+    file already exists.
+    """
+    if not os.path.exists(path):
+        _ffmpeg(
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds}",
+            "-c:a", "libmp3lame", "-b:a", "128k", path,
+        )
+    return path
+
+
+def generate_video(path: str, seconds: float, size: str = "1280x720", rate: int = 30) -> str:
+    """
+    Writes a silent H.264 MP4 test pattern (lavfi testsrc2 source) of the
+    given length, unless the file already exists.
+    """
+    if not os.path.exists(path):
+        _ffmpeg(
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={rate}:duration={seconds}",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-movflags", "+faststart", path,
+        )
+    return path
+
+
+def generate_media(directory: str, audio_seconds: float, video_seconds: float, video_size: str) -> dict:
+    """
+    Generates the synthetic inputs of the benchmarks in `directory`. Files
+    are named after their parameters so they are reused across runs.
+
+    Returns:
+        dict: The "audio" and "video" paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    return {
+        "audio": generate_audio(
+            os.path.join(directory, f"tone_{audio_seconds:g}s.mp3"), audio_seconds
+        ),
+        "video": generate_video(
+            os.path.join(directory, f"testsrc2_{video_size}_{video_seconds:g}s.mp4"),
+            video_seconds,
+            video_size,
+        ),
+    }
@@ -0,0 +1,126 @@
+import json
+from typing import Optional
+
+# Compared metrics, and whether a higher value is better
+METRICS = {
+    "throughput_per_s": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_mb": False,
+    "cpu_seconds": False,
+}
+
+
+def percentile(values: list, q: float) -> Optional[float]:
+    """
+    Returns the q-th percentile (0-100) of `values`, interpolating
+    linearly between the closest ranks.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(
+    latencies: list,
+    errors: list,
+    wall_seconds: float,
+    payload_bytes: int,
+    usage: dict,
+    concurrency: int,
+) -> dict:
+    """
+    Reduces the measurements of one scenario to its reported figures.
+    """
+
+    def ms(seconds):
+        return round(seconds * 1000, 1) if seconds is not None else None
+
+    peak_rss = usage["peak_rss_bytes"]
+    return {
+        "operations": len(latencies),
+        "errors": len(errors),
+        "concurrency": concurrency,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_s": round(len(latencies) / wall_seconds, 3) if wall_seconds else None,
+        "payload_mb_per_s": round(payload_bytes / wall_seconds / 1e6, 2)
+        if payload_bytes and wall_seconds
+        else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "max_ms": ms(max(latencies, default=None)),
+        "peak_rss_mb": round(peak_rss / 1e6, 1) if peak_rss is not None else None,
+        "cpu_seconds": usage["cpu_seconds"],
+        "error_samples": errors[:3],
+    }
+
+
+def print_results(results: dict):
+    columns = (
+        "operations", "errors", "throughput_per_s", "payload_mb_per_s",
+        "p50_ms", "p99_ms", "peak_rss_mb", "cpu_seconds",
+    )
+    print(f"{'scenario':<16}" + "".join(f"{column:>18}" for column in columns))
+    for name, result in results.items():
+        print(
+            f"{name:<16}"
+            + "".join(
+                f"{'-' if result[column] is None else result[column]:>18}"
+                for column in columns
+            )
+        )
+    for name, result in results.items():
+        for error in result["error_samples"]:
+            print(f"{name}: {error}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares the results with a baseline and prints the changes.
+
+    Args:
+        results (dict): Results of this run, keyed by scenario.
+        baseline (dict): Results of the baseline run, keyed by scenario.
+        tolerance (float): Relative change allowed before a metric counts
+            as regressed (e.g. 0.15 for 15%).
+
+    Returns:
+        list: The (scenario, metric) pairs that regressed.
+    """
+    regressions = []
+    print(f"\n{'scenario':<16}{'metric':<18}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<16}(not in baseline)")
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            regressed = worse > tolerance
+            if regressed:
+                regressions.append((name, metric))
+            print(
+                f"{name:<16}{metric:<18}{old:>12}{new:>12}{change:>+10.1%}"
+                + ("  REGRESSION" if regressed else "")
+            )
+    return regressions
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path: str, document: dict):
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
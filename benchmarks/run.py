@@ -0,0 +1,282 @@
+"""
+Benchmarks the video generation API end to end.
+
+Every scenario starts the API in a fresh working directory under uvicorn,
+prepares its inputs, then times `--requests` operations at `--concurrency`
+against it. Drive and YouTube uploads go to a local fake of their
+resumable upload endpoints, so the suite runs offline. See README.md.
+
+    python -m benchmarks.run --scenarios merge,drive_upload --concurrency 4
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks import report
+from benchmarks.fake_google import (
+    FakeGoogleServer,
+    make_certificate,
+    service_account_data,
+    write_youtube_credentials,
+)
+from benchmarks.media import generate_media
+from benchmarks.scenarios import SCENARIOS, Context
+from benchmarks.server import ApiServer
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Settings that make runs comparable with a baseline
+COMPARED_SETTINGS = (
+    "requests", "concurrency", "workers", "audio_seconds", "video_seconds",
+    "video_size", "google_latency_ms", "env",
+)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated scenarios to run (default: all of {', '.join(SCENARIOS)})",
+    )
+    parser.add_argument("--requests", type=int, default=8, help="Timed operations per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="Operations in flight at once")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed operations run first")
+    parser.add_argument("--workers", type=int, default=2, help="JOB_WORKERS of the API")
+    parser.add_argument("--audio-seconds", type=float, default=30)
+    parser.add_argument("--video-seconds", type=float, default=5)
+    parser.add_argument("--video-size", default="1280x720")
+    parser.add_argument(
+        "--google-latency-ms",
+        type=float,
+        default=0,
+        help="Delay the fake Google APIs add to every request",
+    )
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Extra settings of the API (repeatable), e.g. JOB_POLL_INTERVAL=0.1",
+    )
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Status polling interval")
+    parser.add_argument("--timeout", type=float, default=600, help="Limit per operation in seconds")
+    parser.add_argument(
+        "--workdir",
+        help="Directory of the media and the servers' storage (kept; default: a temp dir)",
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare with")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store the results as the new baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="Relative change that counts as a regression (default 0.15)",
+    )
+    return parser.parse_args(argv)
+
+
+def _api_env(args: argparse.Namespace, google: FakeGoogleServer, certfile: str) -> dict:
+    env = {
+        "JOB_WORKERS": str(args.workers),
+        "GOOGLE_API_ENDPOINT": google.url,
+        "HTTPLIB2_CA_CERTS": certfile,
+        "REQUESTS_CA_BUNDLE": certfile,
+        # Identical inputs would otherwise be served from the merge cache
+        "MERGE_CACHE_MAX_BYTES": "0",
+        # The readiness checks are not what is measured
+        "HEALTH_MIN_FREE_BYTES": "0",
+    }
+    for setting in args.env:
+        key, _, value = setting.partition("=")
+        env[key] = value
+    return env
+
+
+async def _run_operations(scenario, ctx: Context, count: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def prepare():
+        if scenario.prepare is None:
+            return None
+        async with semaphore:
+            return await scenario.prepare(ctx)
+
+    items = await asyncio.gather(*(prepare() for _ in range(count)))
+
+    latencies, errors = [], []
+    payload_bytes = 0
+
+    async def operation(item):
+        nonlocal payload_bytes
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                payload_bytes += await scenario.run(ctx, item) or 0
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(operation(item) for item in items))
+    return {
+        "latencies": latencies,
+        "errors": errors,
+        "wall_seconds": time.perf_counter() - started,
+        "payload_bytes": payload_bytes,
+    }
+
+
+async def run_scenario(
+    name: str,
+    args: argparse.Namespace,
+    workdir: str,
+    media: dict,
+    google: FakeGoogleServer,
+    certfile: str,
+    service_account: str,
+) -> dict:
+    scenario = SCENARIOS[name]
+    server_dir = os.path.join(workdir, "runs", name)
+    shutil.rmtree(server_dir, ignore_errors=True)
+
+    # Where the YouTube upload looks for the stored OAuth credentials
+    credentials_dir = os.path.join(
+        server_dir, "app", "api", "v1", "tuneezy", "video_generation", "storage", "credentials"
+    )
+    os.makedirs(credentials_dir)
+    write_youtube_credentials(
+        os.path.join(credentials_dir, "tuneezy_google_credentials.pickle"), google.token_uri
+    )
+
+    server = ApiServer(server_dir, _api_env(args, google, certfile))
+    server.start()
+    try:
+        async with httpx.AsyncClient(base_url=server.url, timeout=args.timeout) as client:
+            ctx = Context(client, media, service_account, args.poll_interval, args.timeout)
+            if args.warmup:
+                await _run_operations(scenario, ctx, args.warmup, args.concurrency)
+
+            server.monitor.begin()
+            measured = await _run_operations(scenario, ctx, args.requests, args.concurrency)
+            usage = server.monitor.end()
+    finally:
+        server.stop()
+
+    return report.summarize(
+        measured["latencies"],
+        measured["errors"],
+        measured["wall_seconds"],
+        measured["payload_bytes"],
+        usage,
+        args.concurrency,
+    )
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    for tool in ("ffmpeg", "ffprobe", "openssl"):
+        if shutil.which(tool) is None:
+            print(f"{tool} is required to run the benchmarks", file=sys.stderr)
+            return 2
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="benchmarks-"))
+    os.makedirs(workdir, exist_ok=True)
+    print(f"Working directory: {workdir}")
+    media = generate_media(
+        os.path.join(workdir, "media"), args.audio_seconds, args.video_seconds, args.video_size
+    )
+
+    certificate = make_certificate(workdir)
+    google = FakeGoogleServer(
+        latency=args.google_latency_ms / 1000, certificate=certificate
+    ).start()
+    service_account = service_account_data(google.token_uri)
+
+    results = {}
+    try:
+        for name in names:
+            print(f"Running {name}: {SCENARIOS[name].description}")
+            results[name] = asyncio.run(
+                run_scenario(
+                    name, args, workdir, media, google, certificate[0], service_account
+                )
+            )
+    finally:
+        google.stop()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    settings = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "workers": args.workers,
+        "audio_seconds": args.audio_seconds,
+        "video_seconds": args.video_seconds,
+        "video_size": args.video_size,
+        "google_latency_ms": args.google_latency_ms,
+        "env": sorted(args.env),
+    }
+    document = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": settings,
+        "scenarios": results,
+    }
+
+    print()
+    report.print_results(results)
+    if args.output:
+        report.save(args.output, document)
+
+    failed = any(result["errors"] for result in results.values())
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        baseline = report.load(args.baseline)
+        changed = [
+            key
+            for key in COMPARED_SETTINGS
+            if baseline["settings"].get(key) != settings.get(key)
+        ]
+        if changed:
+            print(f"\nWarning: the baseline was run with other settings ({', '.join(changed)})")
+        if baseline["machine"] != document["machine"]:
+            print("Warning: the baseline was run on another machine")
+        regressions = report.compare(results, baseline["scenarios"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+
+    if args.save_baseline:
+        # Keep the scenarios of the old baseline that were not run this time
+        if os.path.exists(args.baseline):
+            previous = report.load(args.baseline)["scenarios"]
+            document["scenarios"] = {**previous, **results}
+        report.save(args.baseline, document)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
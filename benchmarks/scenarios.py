@@ -0,0 +1,237 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional
+import httpx
+
+API_PREFIX = "/api/v1/tuneezy/video_generation"
+
+
+class Context:
+    """
+    What the operations of a scenario share: the client of the API under
+    test, the synthetic inputs and the credentials for the fake Google APIs.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        media: dict,
+        service_account_data: str,
+        poll_interval: float,
+        timeout: float,
+    ):
+        self.client = client
+        self.media = media
+        self.service_account_data = service_account_data
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+
+class Scenario:
+    """
+    A benchmarked operation. `prepare` runs before the timed phase (e.g. to
+    upload the inputs) and returns the argument of `run`; `run` is timed and
+    returns the number of payload bytes it moved, if that is meaningful.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        run: Callable[[Context, object], Awaitable[Optional[int]]],
+        prepare: Optional[Callable[[Context], Awaitable[object]]] = None,
+    ):
+        self.name = name
+        self.description = description
+        self.run = run
+        self.prepare = prepare
+
+
+class OperationError(Exception):
+    """
+    Raised when an operation of a scenario fails.
+    """
+
+
+def _check(response: httpx.Response) -> dict:
+    if response.status_code != 200:
+        raise OperationError(f"{response.request.url.path}: {response.status_code} {response.text[:200]}")
+    return response.json()
+
+
+async def _upload(ctx: Context, file_type: str) -> str:
+    path = ctx.media[file_type]
+    with open(path, "rb") as f:
+        response = await ctx.client.post(
+            f"{API_PREFIX}/upload-audio-video",
+            params={"file_type": file_type},
+            files={"file": (os.path.basename(path), f)},
+        )
+    return _check(response)["saved_filename"]
+
+
+async def _wait_for(ctx: Context, path: str, done: Callable[[dict], bool]) -> dict:
+    # Polls like a client of the API would
+    deadline = time.monotonic() + ctx.timeout
+    while True:
+        status = _check(await ctx.client.get(path))
+        if done(status):
+            return status
+        if time.monotonic() > deadline:
+            raise OperationError(f"{path}: not done after {ctx.timeout}s: {status}")
+        await asyncio.sleep(ctx.poll_interval)
+
+
+def _upload_finished(status: dict) -> bool:
+    return status.get("status") in ("completed", "failed")
+
+
+async def upload_video(ctx: Context, _) -> int:
+    await _upload(ctx, "video")
+    return os.path.getsize(ctx.media["video"])
+
+
+async def prepare_merge(ctx: Context) -> tuple:
+    return await _upload(ctx, "audio"), await _upload(ctx, "video")
+
+
+async def merge(ctx: Context, inputs: tuple) -> None:
+    audio_file, video_file = inputs
+    result = _check(
+        await ctx.client.post(
+            f"{API_PREFIX}/merge_audio-video",
+            params={"audio_file": audio_file, "video_file": video_file},
+        )
+    )
+    status = await _wait_for(
+        ctx,
+        f"{API_PREFIX}/check_generation/{result['filename']}",
+        lambda status: status.get("success") or status.get("message") == "Generation failed",
+    )
+    if not status.get("success"):
+        raise OperationError(f"Merge failed: {status}")
+
+
+async def prepare_video(ctx: Context) -> str:
+    return await _upload(ctx, "video")
+
+
+async def merge_stream(ctx: Context, video_file: str) -> int:
+    path = ctx.media["audio"]
+
+    async def body():
+        with open(path, "rb") as f:
+            while chunk := f.read(256 * 1024):
+                yield chunk
+
+    _check(
+        await ctx.client.post(
+            f"{API_PREFIX}/merge_audio-video/stream",
+            params={"video_file": video_file},
+            content=body(),
+        )
+    )
+    return os.path.getsize(path)
+
+
+async def drive_upload(ctx: Context, file_id: str) -> int:
+    result = _check(
+        await ctx.client.post(
+            f"{API_PREFIX}/upload_to_google_drive",
+            params={"folder_id": "benchmarks", "file_id": file_id, "file_name": file_id},
+            data={"service_account_data": ctx.service_account_data},
+        )
+    )
+    status = await _wait_for(
+        ctx, f"{API_PREFIX}/check_upload_progress/{result['upload_id']}", _upload_finished
+    )
+    if status["status"] != "completed":
+        raise OperationError(f"Drive upload failed: {status}")
+    return os.path.getsize(ctx.media["video"])
+
+
+async def youtube_upload(ctx: Context, filename: str) -> int:
+    result = _check(
+        await ctx.client.get(
+            f"{API_PREFIX}/upload_youtube_video/{filename}",
+            params={
+                "title": "Benchmark",
+                "description": "Synthetic test pattern",
+                "tags": "benchmark",
+                "category_id": "22",
+                "privacy_status": "private",
+            },
+        )
+    )
+    status = await _wait_for(
+        ctx, f"{API_PREFIX}/check_youtube_upload_progress/{result['upload_id']}", _upload_finished
+    )
+    if status["status"] != "completed":
+        raise OperationError(f"YouTube upload failed: {status}")
+    return os.path.getsize(ctx.media["video"])
+
+
+async def pipeline(ctx: Context, _) -> None:
+    with open(ctx.media["audio"], "rb") as audio, open(ctx.media["video"], "rb") as video:
+        result = _check(
+            await ctx.client.post(
+                f"{API_PREFIX}/pipeline",
+                params={
+                    "destinations": "google_drive,youtube",
+                    "folder_id": "benchmarks",
+                    "title": "Benchmark",
+                    "category_id": "22",
+                    "privacy_status": "private",
+                },
+                data={"service_account_data": ctx.service_account_data},
+                files={
+                    "audio": (os.path.basename(ctx.media["audio"]), audio),
+                    "video": (os.path.basename(ctx.media["video"]), video),
+                },
+            )
+        )
+    status = await _wait_for(
+        ctx,
+        f"{API_PREFIX}/pipeline/{result['pipeline_id']}",
+        lambda status: status.get("state") in ("completed", "failed"),
+    )
+    if status["state"] != "completed":
+        raise OperationError(f"Pipeline failed: {status}")
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario("upload", "Multipart upload of the video to the temp storage", upload_video),
+        Scenario(
+            "merge",
+            "Queued merge of uploaded audio and video, polled until done",
+            merge,
+            prepare_merge,
+        ),
+        Scenario(
+            "merge_stream",
+            "Audio streamed in the request body and merged while it arrives",
+            merge_stream,
+            prepare_video,
+        ),
+        Scenario(
+            "drive_upload",
+            "Resumable upload of the video to the fake Drive, polled until done",
+            drive_upload,
+            prepare_video,
+        ),
+        Scenario(
+            "youtube_upload",
+            "Resumable upload of the video to the fake YouTube, polled until done",
+            youtube_upload,
+            prepare_video,
+        ),
+        Scenario(
+            "pipeline",
+            "Upload, merge and publish to both fake destinations in one request",
+            pipeline,
+        ),
+    )
+}
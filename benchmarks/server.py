@@ -0,0 +1,186 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _read_stat(pid: int) -> Optional[list]:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces: split after its ")"
+            return f.read().rsplit(")", 1)[1].split()
+    except (FileNotFoundError, ProcessLookupError, IndexError):
+        return None
+
+
+def _process_tree(root: int) -> list:
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            stat = _read_stat(int(entry))
+            if stat is not None:
+                children.setdefault(int(stat[1]), []).append(int(entry))
+    tree, pending = [], [root]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, ()))
+    return tree
+
+
+class ProcessTreeMonitor:
+    """
+    Samples the resident memory and CPU time of a process and all of its
+    descendants (uvicorn, the job workers and their ffmpeg processes) from
+    /proc. Linux only; elsewhere the figures are None.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.available = os.path.isdir("/proc")
+        self._peak_rss = 0
+        self._cpu_started = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="monitor", daemon=True)
+
+    def _sample(self) -> tuple:
+        rss = 0
+        cpu_ticks = 0
+        for pid in _process_tree(self.pid):
+            stat = _read_stat(pid)
+            if stat is None:
+                continue
+            # utime, stime, and those of the children it has reaped
+            cpu_ticks += sum(int(value) for value in stat[11:15])
+            rss += int(stat[21]) * PAGE_SIZE
+        return rss, cpu_ticks / CLOCK_TICKS
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss, _ = self._sample()
+            self._peak_rss = max(self._peak_rss, rss)
+
+    def start(self):
+        if self.available:
+            self._thread.start()
+
+    def begin(self):
+        """
+        Starts a measurement window.
+        """
+        if self.available:
+            rss, self._cpu_started = self._sample()
+            self._peak_rss = rss
+
+    def end(self) -> dict:
+        """
+        Ends the measurement window.
+
+        Returns:
+            dict: The "peak_rss_bytes" and "cpu_seconds" of the window.
+        """
+        if not self.available:
+            return {"peak_rss_bytes": None, "cpu_seconds": None}
+        rss, cpu_seconds = self._sample()
+        return {
+            "peak_rss_bytes": max(self._peak_rss, rss),
+            "cpu_seconds": round(cpu_seconds - self._cpu_started, 3),
+        }
+
+    def stop(self):
+        self._stop.set()
+
+
+class ApiServer:
+    """
+    Runs the API under uvicorn in a subprocess, in its own working
+    directory so every scenario starts with empty databases and storage.
+    """
+
+    def __init__(self, workdir: str, env: dict, port: Optional[int] = None):
+        self.workdir = workdir
+        self.port = port or _free_port()
+        self.env = {
+            **os.environ,
+            **env,
+            "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])),
+        }
+        self.process = None
+        self.monitor = None
+        self._log = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 60):
+        """
+        Starts the server and waits until it answers the health check
+        (ready or not: the disk or worker checks may fail on a benchmark box).
+        """
+        os.makedirs(self.workdir, exist_ok=True)
+        self._log = open(os.path.join(self.workdir, "server.log"), "wb")
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning",
+            ],
+            cwd=self.workdir,
+            env=self.env,
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+        )
+
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(
+                    f"API server exited with code {self.process.returncode}, "
+                    f"see {self._log.name}"
+                )
+            try:
+                urllib.request.urlopen(f"{self.url}/api/v1/health-check", timeout=1)
+                break
+            except urllib.error.HTTPError:
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"API server did not start within {timeout}s")
+                time.sleep(0.2)
+
+        self.monitor = ProcessTreeMonitor(self.process.pid)
+        self.monitor.start()
+
+    def stop(self, timeout: float = 30):
+        """
+        Shuts the server (and its job workers) down gracefully.
+        """
+        if self.monitor is not None:
+            self.monitor.stop()
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log is not None:
+            self._log.close()
@@ -0,0 +1,31 @@
+import os
+import tempfile
+import pytest
+
+# Settings are read once app.core.config is imported, and some modules
+# create their directories on import, so point them all at a scratch
+# directory before any test imports the app
+_scratch = tempfile.mkdtemp(prefix="tests-")
+for name, relative in {
+    "STORAGE_TEMP_DIR": "temp",
+    "MERGE_CACHE_DIR": "temp/cache/merged",
+    "LOOP_CACHE_DIR": "temp/cache/looped",
+    "STORAGE_DB_PATH": "files.db",
+    "STATUS_DB_PATH": "status.db",
+    "JOB_DB_PATH": "jobs.db",
+    "JOB_POOL_LOCK_PATH": "job_pool.lock",
+    "FFMPEG_SLOTS_DIR": "ffmpeg_slots",
+    "METRICS_DIR": "metrics",
+}.items():
+    os.environ.setdefault(name, os.path.join(_scratch, relative))
+
+from app.core.config import config  # noqa: E402
+
+
+@pytest.fixture
+def job_db(tmp_path, monkeypatch):
+    """
+    Gives the test an empty job database of its own.
+    """
+    monkeypatch.setattr(config, "JOB_DB_PATH", str(tmp_path / "jobs.db"))
+    return config.JOB_DB_PATH
@@ -0,0 +1,95 @@
+import math
+import pytest
+from app.api.v1.tuneezy.video_generation.utils.ffmpeg_commands import plan_segments
+from app.core.config import config
+from app.core.tools.ffmpeg import get_duration, parse_progress_time
+
+
+def _video(duration: float, rate: str = "25/1", avg_rate: str = None) -> dict:
+    return {
+        "streams": [
+            {
+                "codec_type": "video",
+                "r_frame_rate": rate,
+                "avg_frame_rate": avg_rate or rate,
+            }
+        ],
+        "format": {"duration": str(duration)},
+    }
+
+
+@pytest.fixture(autouse=True)
+def segment_budget(monkeypatch):
+    monkeypatch.setattr(config, "MERGE_MAX_SEGMENTS", 4)
+    monkeypatch.setattr(config, "MERGE_SEGMENT_MIN_SECONDS", 120)
+
+
+def test_parse_progress_time_prefers_microseconds():
+    assert parse_progress_time({"out_time_us": "1500000", "out_time": "00:00:09.0"}) == 1.5
+
+
+def test_parse_progress_time_clamps_negative_positions():
+    assert parse_progress_time({"out_time_us": "-23000"}) == 0.0
+
+
+def test_parse_progress_time_falls_back_to_the_clock_format():
+    assert parse_progress_time({"out_time_us": "N/A", "out_time": "01:02:03.5"}) == 3723.5
+
+
+def test_parse_progress_time_unknown():
+    assert parse_progress_time({"out_time": "N/A"}) is None
+    assert parse_progress_time({}) is None
+
+
+def test_get_duration_from_the_format():
+    assert get_duration({"format": {"duration": "12.5"}}) == 12.5
+
+
+def test_get_duration_falls_back_to_the_longest_stream():
+    info = {
+        "format": {"duration": "N/A"},
+        "streams": [{"duration": "3.0"}, {"duration": "N/A"}, {"duration": "4.5"}],
+    }
+    assert get_duration(info) == 4.5
+    assert get_duration({"format": {}, "streams": [{}]}) is None
+
+
+def test_plan_segments_covers_every_frame_once():
+    segments = plan_segments(601, _video(7))
+
+    assert len(segments) == 4
+    assert [segment["frames"] for segment in segments] == [3757, 3757, 3757, 3754]
+    assert sum(segment["frames"] for segment in segments) == math.ceil(601 * 25)
+
+
+def test_plan_segments_offsets_wrap_around_the_loop():
+    segments = plan_segments(600, _video(7))
+
+    # 3750 frames per segment into a 175-frame loop
+    assert [segment["offset"] for segment in segments] == [0.0, 3.0, 6.0, 2.0]
+
+
+def test_plan_segments_needs_two_minimum_length_segments():
+    assert plan_segments(239.9, _video(7)) is None
+    assert len(plan_segments(240, _video(7))) == 2
+
+
+def test_plan_segments_count_is_capped_by_the_budget(monkeypatch):
+    monkeypatch.setattr(config, "MERGE_MAX_SEGMENTS", 1)
+
+    assert plan_segments(3600, _video(7)) is None
+
+
+@pytest.mark.parametrize(
+    "duration, video",
+    [
+        (None, _video(7)),
+        (600, _video(7, rate="0/0")),
+        (600, _video(7, rate="30000/1001", avg_rate="2997/100")),
+        (600, {"streams": [], "format": {"duration": "7"}}),
+        (600, {"streams": _video(7)["streams"], "format": {}}),
+    ],
+    ids=["unknown duration", "no frame rate", "variable frame rate", "no video", "unknown video length"],
+)
+def test_plan_segments_falls_back_to_a_single_encoder(duration, video):
+    assert plan_segments(duration, video) is None
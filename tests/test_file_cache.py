@@ -0,0 +1,84 @@
+import itertools
+import os
+import pytest
+from app.core.tools import file_cache
+from app.core.tools.file_cache import FileCache, make_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Distinct, increasing access times so the LRU order is deterministic
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(file_cache.time, "time", lambda: float(next(ticks)))
+
+
+def _file(directory, name: str, size: int) -> str:
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_make_key_depends_on_every_part():
+    assert make_key("a", "b", ["-c", "copy"]) == make_key("a", "b", ["-c", "copy"])
+    assert make_key("a", "b", ["-c", "copy"]) != make_key("a", "b", ["-c", "aac"])
+    assert make_key("a", "b") != make_key("b", "a")
+
+
+def test_put_then_get_into_links_the_cached_file(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=1000, suffix=".mp4")
+    source = _file(tmp_path, "merged.mp4", 10)
+
+    cached = cache.put("key", source)
+    destination = str(tmp_path / "copy.mp4")
+
+    assert cached.endswith("key.mp4")
+    assert cache.get_into("key", destination)
+    assert os.stat(destination).st_ino == os.stat(cached).st_ino
+    assert cache.stats()["hits"] == 1
+
+
+def test_miss_is_counted(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=1000)
+
+    assert not cache.get_into("missing", str(tmp_path / "out.mp4"))
+    assert not os.path.exists(tmp_path / "out.mp4")
+    assert cache.stats()["misses"] == 1
+
+
+def test_entry_removed_behind_the_cache_is_a_miss(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=1000)
+    os.remove(cache.put("key", _file(tmp_path, "a", 10)))
+
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.usefixtures("clock")
+def test_put_evicts_least_recently_used_entries(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=25)
+    first = cache.put("first", _file(tmp_path, "a", 10))
+    second = cache.put("second", _file(tmp_path, "b", 10))
+    # Used after "second", so "second" is now the least recently used
+    assert cache.get("first") == first
+
+    cache.put("third", _file(tmp_path, "c", 10))
+
+    assert cache.get("second") is None
+    assert not os.path.exists(second)
+    assert cache.get("first") == first
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    assert stats["size_bytes"] == 20
+
+
+@pytest.mark.usefixtures("clock")
+def test_evict_to_a_smaller_limit(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=100)
+    for name in ("a", "b", "c"):
+        cache.put(name, _file(tmp_path, name, 10))
+
+    assert cache.evict(max_bytes=10) == 20
+    assert cache.get("c") is not None
+    assert cache.stats()["entries"] == 1
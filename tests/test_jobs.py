@@ -0,0 +1,146 @@
+import time
+import pytest
+from app.core import jobs
+
+pytestmark = pytest.mark.usefixtures("job_db")
+
+
+def noop(**kwargs):
+    pass
+
+
+def _state(job_id: str) -> str:
+    return jobs.get_job(job_id)["state"]
+
+
+def test_claim_next_takes_highest_priority_then_oldest():
+    low = jobs.enqueue(noop, {}, priority=jobs.PRIORITY_LOW)
+    first = jobs.enqueue(noop, {"n": 1})
+    second = jobs.enqueue(noop, {"n": 2})
+    high = jobs.enqueue(noop, {}, priority=jobs.PRIORITY_HIGH)
+
+    claimed = [jobs.claim_next("worker")["id"] for _ in range(4)]
+
+    assert claimed == [high, first, second, low]
+    assert jobs.claim_next("worker") is None
+
+
+def test_claim_next_marks_job_running_with_lease():
+    job_id = jobs.enqueue(noop, {"path": "a.mp4"})
+
+    job = jobs.claim_next("worker-1")
+
+    assert job["id"] == job_id
+    assert job["state"] == jobs.RUNNING
+    assert job["worker"] == "worker-1"
+    assert job["attempts"] == 1
+    assert job["payload"] == {"path": "a.mp4"}
+    assert job["lease_expires_at"] > time.time()
+    # A running job is never handed out twice
+    assert jobs.claim_next("worker-2") is None
+
+
+def test_fail_requeues_until_attempts_are_used_up():
+    job_id = jobs.enqueue(noop, {"path": "a.mp4"}, max_attempts=2)
+
+    jobs.claim_next("worker")
+    jobs.fail(job_id, "first")
+    assert _state(job_id) == jobs.QUEUED
+
+    jobs.claim_next("worker")
+    jobs.fail(job_id, "second")
+    job = jobs.get_job(job_id)
+    assert job["state"] == jobs.FAILED
+    assert job["error"] == "second"
+    assert job["finished_at"] is not None
+    assert jobs.active_payloads() == []
+
+
+def test_fail_without_retry_fails_at_once():
+    job_id = jobs.enqueue(noop, {}, max_attempts=3)
+
+    jobs.claim_next("worker")
+    jobs.fail(job_id, "unreadable input", retry=False)
+
+    assert _state(job_id) == jobs.FAILED
+    assert jobs.claim_next("worker") is None
+
+
+def test_release_does_not_count_the_attempt():
+    job_id = jobs.enqueue(noop, {})
+
+    jobs.claim_next("worker")
+    jobs.release(job_id)
+
+    job = jobs.get_job(job_id)
+    assert job["state"] == jobs.QUEUED
+    assert job["attempts"] == 0
+
+
+def test_recover_expired_requeues_jobs_of_dead_workers():
+    job_id = jobs.enqueue(noop, {}, max_attempts=2)
+    jobs.claim_next("worker")
+
+    # Nothing to do while the lease is valid
+    assert jobs.recover_expired() == 0
+
+    jobs._db().execute("UPDATE jobs SET lease_expires_at = ?", (time.time() - 1,))
+    assert jobs.recover_expired() == 1
+    assert _state(job_id) == jobs.QUEUED
+
+
+def _finish(job_id: str, ok: bool = True):
+    job = jobs.claim_next("worker")
+    assert job["id"] == job_id
+    if ok:
+        jobs.complete(job_id)
+    else:
+        jobs.fail(job_id, "broken", retry=False)
+
+
+def test_dependent_job_is_queued_once_every_dependency_completes():
+    merge = jobs.enqueue(noop, {})
+    thumbnail = jobs.enqueue(noop, {})
+    publish = jobs.enqueue(noop, {}, depends_on=[merge, thumbnail])
+    assert _state(publish) == jobs.BLOCKED
+
+    _finish(merge)
+    assert _state(publish) == jobs.BLOCKED
+
+    _finish(thumbnail)
+    assert _state(publish) == jobs.QUEUED
+
+
+def test_dependency_completed_before_enqueue_queues_at_once():
+    merge = jobs.enqueue(noop, {})
+    _finish(merge)
+
+    publish = jobs.enqueue(noop, {}, depends_on=[merge])
+
+    assert _state(publish) == jobs.QUEUED
+
+
+def test_failed_dependency_fails_dependents_in_turn():
+    merge = jobs.enqueue(noop, {})
+    publish = jobs.enqueue(noop, {"path": "a.mp4"}, depends_on=[merge])
+    cleanup = jobs.enqueue(noop, {"path": "a.mp4"}, depends_on=[publish])
+
+    _finish(merge, ok=False)
+
+    for job_id in (publish, cleanup):
+        job = jobs.get_job(job_id)
+        assert job["state"] == jobs.FAILED
+        assert job["error"] == "A step this job depends on failed"
+    # Their payloads no longer keep files from being cleaned up
+    assert jobs.active_payloads() == []
+
+
+def test_requeued_dependency_keeps_dependents_blocked():
+    merge = jobs.enqueue(noop, {}, max_attempts=2)
+    publish = jobs.enqueue(noop, {}, depends_on=[merge])
+
+    jobs.claim_next("worker")
+    jobs.fail(merge, "timed out")
+
+    assert _state(merge) == jobs.QUEUED
+    assert _state(publish) == jobs.BLOCKED
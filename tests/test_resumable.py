@@ -0,0 +1,81 @@
+from app.core.tools.resumable import CHUNK_GRANULARITY, ChunkSizer
+
+MIB = 1024 * 1024
+
+
+def _send_full_chunk(sizer: ChunkSizer, seconds: float):
+    sizer.record(sizer.size, seconds)
+
+
+def test_sizes_are_rounded_to_the_chunk_granularity():
+    sizer = ChunkSizer(initial=MIB + 1000, maximum=8 * MIB, adaptive=True)
+
+    assert sizer.size == MIB
+    assert ChunkSizer(initial=1000, adaptive=True).size == CHUNK_GRANULARITY
+
+
+def test_grows_while_throughput_improves_up_to_the_maximum():
+    sizer = ChunkSizer(initial=MIB, maximum=4 * MIB, adaptive=True)
+
+    # Each chunk twice as big in the same time: throughput keeps doubling
+    for _ in range(4):
+        _send_full_chunk(sizer, 1.0)
+
+    assert sizer.size == 4 * MIB
+
+
+def test_stops_growing_once_bigger_chunks_stop_paying_off():
+    sizer = ChunkSizer(initial=MIB, maximum=32 * MIB, adaptive=True)
+    _send_full_chunk(sizer, 1.0)
+    assert sizer.size == 2 * MIB
+
+    # Twice the bytes in twice the time: no better
+    _send_full_chunk(sizer, 2.0)
+    assert sizer.size == 2 * MIB
+
+    # Even a faster chunk does not restart growth
+    _send_full_chunk(sizer, 0.5)
+    assert sizer.size == 2 * MIB
+
+
+def test_partial_chunks_do_not_change_the_size():
+    sizer = ChunkSizer(initial=MIB, maximum=8 * MIB, adaptive=True)
+
+    sizer.record(MIB // 2, 0.01)
+
+    assert sizer.size == MIB
+    assert sizer.bytes_sent == MIB // 2
+
+
+def test_error_halves_the_size_and_allows_growth_again():
+    sizer = ChunkSizer(initial=MIB, maximum=8 * MIB, adaptive=True)
+    _send_full_chunk(sizer, 1.0)
+    _send_full_chunk(sizer, 2.0)  # Growth stopped at 2 MiB
+
+    sizer.record_error()
+    assert sizer.size == MIB
+
+    _send_full_chunk(sizer, 1.0)
+    assert sizer.size == 2 * MIB
+
+
+def test_error_never_goes_below_the_granularity():
+    sizer = ChunkSizer(initial=CHUNK_GRANULARITY, adaptive=True)
+
+    sizer.record_error()
+
+    assert sizer.size == CHUNK_GRANULARITY
+
+
+def test_fixed_size_without_adaptive_sizing():
+    sizer = ChunkSizer(initial=MIB, maximum=8 * MIB, adaptive=False)
+    _send_full_chunk(sizer, 1.0)
+    _send_full_chunk(sizer, 0.1)
+    sizer.record_error()
+
+    assert sizer.size == MIB
+    assert sizer.throughput_bps == 2 * MIB / 1.1
+
+
+def test_throughput_is_unknown_before_the_first_chunk():
+    assert ChunkSizer(adaptive=True).throughput_bps is None